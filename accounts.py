@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# accounts.py — حسابات الدخول: تجزئة كلمات المرور، تحقق محدود التزامن، حدّ المحاولات، وتجهيز حسابات الطلاب
+
+import hmac
+import os
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from contextlib import closing
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+VERIFY_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+LoginResult = namedtuple("LoginResult", ["account", "rehash", "retry_after"])
+
+# المرشّحون بالبريد: المالك ثم مستخدم المركز ثم الطالب ثم ولي الأمر — كل فرع بحث في فهرس email الفريد.
+# البريد فريد داخل كل جدول لا بينها، فقد يعود أكثر من صف؛ authenticate يجرّبها بهذا الترتيب.
+# المالك وولي الأمر لا يتقيدان بالمركز (قد يكون للولي أبناء في أكثر من مركز).
+ACCOUNT_SQL = """
+    SELECT 0 AS prio, 'owner' AS kind, id, full_name, email, 'owner' AS role, password_hash, NULL AS student_id
+    FROM owners WHERE email=:email
+    UNION ALL
+    SELECT 1, 'user', id, full_name, email, role, password_hash, NULL
+    FROM users WHERE email=:email AND center_id=:center_id
+    UNION ALL
+    SELECT 2, 'student', sa.id, s.full_name, sa.email, 'student', sa.password_hash, sa.student_id
+    FROM student_accounts sa JOIN students s ON s.id=sa.student_id
+    WHERE sa.email=:email AND sa.center_id=:center_id
+    UNION ALL
+    SELECT 3, 'guardian', id, full_name, email, 'guardian', password_hash, NULL
+    FROM guardian_accounts WHERE email=:email
+    ORDER BY prio
+"""
+
+HASH_TABLES = {"owner": "owners", "user": "users", "student": "student_accounts", "guardian": "guardian_accounts"}
+
+
+def _context(rounds):
+    # min=max=default: أي تجزئة بكلفة مختلفة تُعدّ قديمة وتُعاد تجزئتها عند أول دخول ناجح
+    return CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds,
+                        bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+
+
+_passwords = _context(BCRYPT_ROUNDS)
+_verify_slots = threading.BoundedSemaphore(VERIFY_WORKERS)
+
+
+def set_bcrypt_rounds(rounds):
+    """كلفة bcrypt للتجزئات الجديدة وإعادة التجزئة (الإعداد BCRYPT_ROUNDS)."""
+    global _passwords
+    if int(rounds) != _passwords.to_dict().get("bcrypt__default_rounds"):
+        _passwords = _context(int(rounds))
+        default_password_hash.cache_clear()
+
+
+def hash_password(password):
+    return _passwords.hash(password)
+
+
+@lru_cache(maxsize=8)
+def default_password_hash(password):
+    """bcrypt مكلف (~250ms)؛ كلمة المرور الموحّدة تُجزّأ مرة واحدة وتُشارك بين كل الصفوف."""
+    return hash_password(password)
+
+
+def verify_password(password, password_hash):
+    """تحقق bcrypt في خيط المستدعي، وVERIFY_WORKERS تحققًا على الأكثر في آن: موجة دخول لا تستهلك كل أنوية المعالج.
+
+    يعيد (صحيحة؟، تجزئة جديدة أو None) — الجديدة عند اختلاف كلفة التجزئة المخزنة عن BCRYPT_ROUNDS.
+    """
+    with _verify_slots:
+        try:
+            return _passwords.verify_and_update(password, password_hash)
+        except ValueError:  # تجزئة تالفة أو ليست bcrypt
+            return False, None
+
+
+class RateLimiter:
+    """نافذة منزلقة في الذاكرة: أكثر من limit محاولة فاشلة خلال window ثانية لنفس المفتاح تُحجب مؤقتًا.
+
+    attempt يفحص ويحجز المحاولة تحت قفل واحد، فالطلبات المتزامنة لا تتجاوز limit تحققًا قبل تسجيل فشلها.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._hits = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _prune(self, key, now):
+        hits = self._hits.get(key)
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if hits is not None and not hits:
+            del self._hits[key]
+        return hits or ()
+
+    def retry_after(self, key):
+        """ثوانٍ حتى يُسمح بمحاولة جديدة (0 = مسموح)."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._prune(key, now)
+            return hits[0] + self.window - now if len(hits) >= self.limit else 0
+
+    def attempt(self, key):
+        """احجز محاولة: 0 إن سُمح بها (وتُحتسب فاشلة ما لم تُلغَ بـ release أو reset)، وإلا ثوانٍ حتى السماح."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._prune(key, now)
+            if len(hits) >= self.limit:
+                return hits[0] + self.window - now
+            self._hits[key].append(now)
+            return 0
+
+    def release(self, key):
+        """ألغِ محاولة محجوزة لم تفشل (دخول ناجح أو محاولة حُجبت بمفتاح آخر)."""
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits:
+                hits.pop()
+                if not hits:
+                    del self._hits[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+email_limiter = RateLimiter(limit=5, window=300)
+ip_limiter = RateLimiter(limit=30, window=300)
+
+
+def find_accounts(conn, email, center_id):
+    """كل الحسابات بهذا البريد بترتيب الأولوية (غالبًا صف واحد أو لا شيء)."""
+    with closing(conn.cursor()) as cur:
+        cur.execute(ACCOUNT_SQL, {"email": email, "center_id": center_id})
+        rows = cur.fetchall()
+    return [dict(zip(["prio", "kind", "id", "full_name", "email", "role", "password_hash", "student_id"], r)) for r in rows]
+
+
+def find_account(conn, email, center_id):
+    accounts = find_accounts(conn, email, center_id)
+    return accounts[0] if accounts else None
+
+
+def session_account(a):
+    """قاموس الجلسة من صف حساب (find_accounts، أو الصف الحي في load_session)."""
+    if a["kind"] == "student":
+        return {"kind": "student", "account_id": a["id"], "student_id": a["student_id"],
+                "full_name": a["full_name"], "email": a["email"], "role": "student"}
+    return {"kind": a["kind"], **{k: a[k] for k in ("id", "full_name", "email", "role")}}
+
+
+def authenticate(conn, email, password, center_id, unified_password=None, ip=None):
+    """بحث واحد عن الحسابات ثم تحقق bcrypt لكل مرشّح بالترتيب حتى يطابق أحدها (مرشّح واحد في الغالب).
+
+    المعلّم والطالب يقبلان كلمة المرور الموحّدة بلا bcrypt كما كان. يعيد LoginResult:
+    account (قاموس الجلسة أو None)، rehash (يمرَّر إلى save_rehash إن لم يكن None)، retry_after (ثوانٍ عند الحجب).
+    """
+    email = email.strip()
+    limits = [(email_limiter, ("email", email.lower()))] + ([(ip_limiter, ("ip", ip))] if ip else [])
+    for i, (lim, key) in enumerate(limits):
+        wait = lim.attempt(key)
+        if wait:
+            for held, held_key in limits[:i]:
+                held.release(held_key)
+            return LoginResult(None, None, wait)
+
+    ok, new_hash = False, None
+    for a in find_accounts(conn, email, center_id):
+        if unified_password and a["role"] in ("teacher", "student") and hmac.compare_digest(str(password).encode(), str(unified_password).encode()):
+            ok = True
+        else:
+            ok, new_hash = verify_password(password, a["password_hash"])
+        if ok:
+            break
+    if not ok:
+        return LoginResult(None, None, 0)  # المحاولات المحجوزة تبقى محسوبة فاشلة
+    email_limiter.reset(limits[0][1])
+    for lim, key in limits[1:]:
+        lim.release(key)
+    rehash = (HASH_TABLES[a["kind"]], a["id"], new_hash) if new_hash else None
+    return LoginResult(session_account(a), rehash, 0)
+
+
+def save_rehash(conn, rehash):
+    """احفظ التجزئة المحدّثة داخل معاملة المستدعي (db_write)."""
+    table, account_id, new_hash = rehash
+    conn.execute(f"UPDATE {table} SET password_hash=? WHERE id=?", (new_hash, account_id))
+
+
+def provision_student_accounts(conn, password, center_id=None):
+    """أنشئ حسابات الطلاب الناقصة بجملة INSERT ... SELECT واحدة. يعيد عدد الحسابات المنشأة.
+
+    المعاملة يملكها المستدعي (db_write)، فيُثبَّت التجهيز مع التعديل الذي استدعاه أو يُلغى معه.
+    """
+    where = "WHERE NOT EXISTS (SELECT 1 FROM student_accounts sa WHERE sa.student_id = s.id)"
+    params = [default_password_hash(password)]
+    if center_id is not None:
+        where += " AND s.center_id = ?"; params.append(center_id)
+    with closing(conn.cursor()) as cur:
+        cur.execute(
+            f"""
+            INSERT INTO student_accounts(student_id, email, password_hash, center_id)
+            SELECT s.id, 'student' || s.id || '@darien.local', ?, s.center_id
+            FROM students s
+            {where}
+            """,
+            params,
+        )
+        return cur.rowcount
+
+
+__all__ = [
+    "BCRYPT_ROUNDS", "LoginResult", "RateLimiter", "email_limiter", "ip_limiter",
+    "set_bcrypt_rounds", "hash_password", "default_password_hash", "verify_password",
+    "find_accounts", "find_account", "session_account", "authenticate", "save_rehash", "provision_student_accounts",
+]
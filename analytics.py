@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# analytics.py — استعلامات تجميعية صغيرة للوحة التحليلات (نتائجها عشرات الصفوف لا ملايين)
+
+import pandas as pd
+
+from gradebook import day_number
+
+# تجميع التاريخ في الرسوم: يوم / أسبوع (يبدأ الإثنين) / شهر
+BUCKETS = {
+    "day": "{col}",
+    "week": "date({col}, 'weekday 0', '-6 days')",
+    "month": "substr({col}, 1, 7) || '-01'",
+}
+SCORE_BIN = 10
+
+
+def grade_trend(conn, center_id, date_from, date_to, by="class_name", subject_id=None, bucket="week"):
+    """متوسط الدرجات عبر الزمن لكل صف (by="class_name") أو مادة (by="subject") من grade_daily_stats."""
+    b = BUCKETS[bucket].format(col="d.grade_date")
+    series = "d.class_name" if by == "class_name" else "sub.name"
+    where = "WHERE d.center_id=? AND d.grade_date BETWEEN ? AND ?"; params = [center_id, date_from, date_to]
+    if subject_id: where += " AND d.subject_id=?"; params.append(int(subject_id))
+    q = f"""
+    SELECT {b} AS "التاريخ", {series} AS "السلسلة",
+           SUM(d.total) / SUM(d.n) AS "المتوسط", SUM(d.n) AS "عدد الدرجات"
+    FROM grade_daily_stats d JOIN subjects sub ON sub.id=d.subject_id
+    {where}
+    GROUP BY 1, 2 ORDER BY 1
+    """
+    return pd.read_sql_query(q, conn, params=params)
+
+
+def score_distribution(conn, center_id, date_from, date_to, subject_ids):
+    """توزيع الدرجات في فئات بعرض SCORE_BIN. IN على المواد يُبقي البحث داخل فهرس (center, subject, date, ..., score) المغطّي."""
+    if not subject_ids:
+        return pd.DataFrame(columns=["الفئة", "العدد"])
+    marks = ",".join("?" * len(subject_ids))
+    q = f"""
+    SELECT CAST(score / {SCORE_BIN} AS INTEGER) * {SCORE_BIN} AS "الفئة", COUNT(*) AS "العدد"
+    FROM grades
+    WHERE center_id=? AND subject_id IN ({marks}) AND grade_day BETWEEN ? AND ?
+    GROUP BY 1 ORDER BY 1
+    """
+    return pd.read_sql_query(q, conn, params=[center_id, *map(int, subject_ids), day_number(date_from), day_number(date_to)])
+
+
+def attendance_rate(conn, center_id, date_from, date_to, subject_id=None, bucket="week"):
+    """نسبة الحضور (٪) وعدد السجلات لكل فترة."""
+    b = BUCKETS[bucket].format(col="att_date")
+    where = "WHERE center_id=? AND att_date BETWEEN ? AND ?"; params = [center_id, date_from, date_to]
+    if subject_id: where += " AND subject_id=?"; params.append(int(subject_id))
+    q = f"""
+    SELECT {b} AS "التاريخ", 100.0 * AVG(status = 'present') AS "نسبة الحضور", COUNT(*) AS "السجلات"
+    FROM attendance {where}
+    GROUP BY 1 ORDER BY 1
+    """
+    return pd.read_sql_query(q, conn, params=params)
+
+
+__all__ = ["BUCKETS", "SCORE_BIN", "grade_trend", "score_distribution", "attendance_rate"]
@@ -1,11 +1,37 @@
 # -*- coding: utf-8 -*-
-import os, sqlite3, math, statistics as stats
+import os, sqlite3, tempfile
 from contextlib import closing
 import datetime as dt
 import pandas as pd
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import altair as alt
-from passlib.hash import bcrypt
+
+from accounts import (
+    authenticate, default_password_hash, hash_password, provision_student_accounts, save_rehash, set_bcrypt_rounds,
+)
+import analytics
+from attendance import STATUSES, class_summary, roll_call_sheet, save_roll_call, student_summary
+import datacache
+from changeset import save_editor
+from datacache import STUDENT_PAGE, data_version, label_map, search_students
+from db_pool import ConnectionPool, WriteQueue
+from guardians import (
+    GUARDIAN_PAGE, center_guardians, center_links, children, guardian_feed, link_children, unlink_children,
+)
+from importer import commit_import, plan_import, read_table
+from labels import label_grades
+from migrations import run_migrations
+from reports import (
+    EXPORT_MAX_ROWS, PAGE_SIZE, NOTE_COLUMNS, STUDENT_NOTE_COLUMNS, XLSX_AVAILABLE, center_enrollments, export_csv,
+    export_xlsx, grade_notes, grade_sheet, honor_board_top10, report_count_estimate, report_page, student_grades,
+    teacher_recent_grades,
+)
+from schedule import DAYS, lesson_conflicts, weekly_grid
+from schemes import SINCE_ALWAYS, center_schemes, delete_schemes, save_scheme, scheme_for
+from sessions import (
+    TOKEN_PARAM, active_sessions, create_session, load_session, revoke_sessions, session_secret, touch_session,
+)
 
 # ===================== إعداد آمن لقراءة الإعدادات =====================
 
@@ -30,6 +56,11 @@ QURAN_YT = "https://www.youtube.com/embed/m7tva04iQv4?autoplay=1&mute=1&loop=1&p
 
 st.set_page_config(page_title="📊 تطبيق الدرجات — متعدد المراكز", page_icon="📊", layout="wide")
 
+# بعد set_page_config: الإعداد الغائب عن البيئة وعن secrets.toml يعرض تنبيهًا، ولا يجوز قبلها أي عنصر
+BCRYPT_ROUNDS = get_setting("BCRYPT_ROUNDS", 12)    # كلفة التجزئة؛ التجزئات الأقدم تُحدّث عند الدخول
+SESSION_SECRET = get_setting("SESSION_SECRET", None) # مفتاح توقيع رموز الجلسات (وإلا يُولَّد ويُحفظ في القاعدة)
+set_bcrypt_rounds(BCRYPT_ROUNDS)
+
 # ===================== بذرة اختيارية =====================
 try:
     from darien_seed import ensure_darien_seed, render_marquee as seed_render_marquee
@@ -40,206 +71,73 @@ except Exception:
 # ===================== أدوات DB =====================
 
 @st.cache_resource
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-    except Exception:
-        pass
-    return conn
+def get_pool():
+    return ConnectionPool(DB_PATH)
 
 
-def has_column(conn, table, col):
-    q = "PRAGMA table_info(%s)" % table
-    with closing(conn.cursor()) as cur:
-        cur.execute(q)
-        return any(r[1] == col for r in cur.fetchall())
-
+def get_conn():
+    """اتصال القراءة الخاص بالخيط الحالي (قراءة فقط)؛ الكتابة عبر db_write()."""
+    return get_pool().reader()
 
-def ensure_schema_and_migrations(conn):
-    """إنشاء/ترقية المخطط: دعم تعدد المراكز، جداول الحصص، مخطط الدرجات، وحقول min/max للدرجات، وجدول المالكين."""
-    with closing(conn.cursor()) as cur:
-        # المالكين (Super Admins)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS owners (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL DEFAULT 'مالك التطبيق',
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL
-            );
-            """
-        )
 
-        # مراكز
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS centers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                address TEXT,
-                phone TEXT
-            );
-            """
-        )
+def db_write():
+    """معاملة كتابة واحدة على الاتصال الكاتب: commit عند النجاح و rollback عند الخطأ."""
+    return get_pool().writer()
 
-        # الجداول الأساسية
-        cur.executescript(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin','teacher')),
-                password_hash TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                class_name TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS subjects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            );
-
-            CREATE TABLE IF NOT EXISTS enrollments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
-                subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
-                teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS grades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
-                subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
-                teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                grade_date TEXT NOT NULL,
-                score REAL NOT NULL,
-                note TEXT,
-                note_teacher TEXT,
-                note_parent TEXT,
-                note_admin TEXT,
-                created_at TEXT NOT NULL DEFAULT (datetime('now'))
-            );
-
-            CREATE TABLE IF NOT EXISTS attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
-                subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
-                teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                att_date TEXT NOT NULL,
-                status TEXT NOT NULL CHECK(status IN ('present','absent_excused','absent_unexcused')),
-                note TEXT
-            );
-
-            CREATE TABLE IF NOT EXISTS student_accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS guardian_accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS guardian_student (
-                guardian_id INTEGER NOT NULL REFERENCES guardian_accounts(id) ON DELETE CASCADE,
-                student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
-                PRIMARY KEY (guardian_id, student_id)
-            );
-            """
-        )
 
-        # إضافة center_id للجداول إن لم يوجد
-        tables_to_center = [
-            "users", "students", "subjects", "enrollments", "grades", "attendance", "student_accounts"
-        ]
-        for t in tables_to_center:
-            if not has_column(conn, t, "center_id"):
-                cur.execute(f"ALTER TABLE {t} ADD COLUMN center_id INTEGER DEFAULT 1")
-
-        # min/max للدرجات
-        if not has_column(conn, "grades", "min_score"):
-            cur.execute("ALTER TABLE grades ADD COLUMN min_score REAL")
-        if not has_column(conn, "grades", "max_score"):
-            cur.execute("ALTER TABLE grades ADD COLUMN max_score REAL")
-
-        # جداول الحصص
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS lessons (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                center_id INTEGER NOT NULL,
-                class_name TEXT NOT NULL,
-                subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
-                teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                day_of_week INTEGER NOT NULL,  -- 0=Mon .. 6=Sun
-                start_time TEXT NOT NULL,
-                end_time   TEXT NOT NULL
-            );
-            """
-        )
+@st.cache_resource
+def get_write_queue():
+    return WriteQueue(get_pool())
 
-        # مخطط الدرجات
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS grading_scheme (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                center_id INTEGER NOT NULL,
-                class_name TEXT NOT NULL,
-                subject_id INTEGER,
-                min_score REAL NOT NULL DEFAULT 0,
-                max_score REAL NOT NULL DEFAULT 100,
-                excellent_cut REAL,
-                high_cut REAL,
-                average_cut REAL
-            );
-            """
-        )
 
-        # فهارس
-        cur.executescript(
-            """
-            CREATE INDEX IF NOT EXISTS idx_users_center ON users(center_id);
-            CREATE INDEX IF NOT EXISTS idx_students_center ON students(center_id);
-            CREATE INDEX IF NOT EXISTS idx_subjects_center ON subjects(center_id);
-            CREATE INDEX IF NOT EXISTS idx_enroll_center ON enrollments(center_id);
-            CREATE INDEX IF NOT EXISTS idx_grades_center ON grades(center_id);
-            CREATE INDEX IF NOT EXISTS idx_lessons_center ON lessons(center_id);
-            CREATE INDEX IF NOT EXISTS idx_scheme_center ON grading_scheme(center_id);
-            """
-        )
-        conn.commit()
+def queued_write(fn, *args):
+    """كتابة درجات/حضور عبر طابور الالتزام الجماعي: fn(conn, *args) تُدمج مع حفظ المعلّمين الآخرين
+    في معاملة واحدة، وتعيد نتيجتها (أو ترفع استثناءها) بعد الالتزام."""
+    return get_write_queue().run(fn, *args)
 
-        # مركز افتراضي + إسناد center_id=1
-        cur.execute("SELECT COUNT(*) FROM centers")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO centers(name) VALUES ('مركز دارين التعليمي')")
-            conn.commit()
 
-        # تأكد أن كل السجلات لها center_id
-        for t in tables_to_center:
-            cur.execute(f"UPDATE {t} SET center_id=1 WHERE center_id IS NULL")
-        conn.commit()
+def bootstrap_database(conn):
+    """ترحيل المخطط + الحسابات الافتراضية + البذرة. تُستدعى مرة واحدة لكل عملية عبر bootstrap_once."""
+    run_migrations(conn)
 
+    with closing(conn.cursor()) as cur:
         # تهيئة مالك التطبيق إن لم يوجد
         cur.execute("SELECT COUNT(*) FROM owners")
         if cur.fetchone()[0] == 0:
             email = OWNER_EMAIL or "owner@darien.local"
             pw = OWNER_PASSWORD or "owner"
             cur.execute("INSERT INTO owners(full_name,email,password_hash) VALUES (?,?,?)",
-                        ("مالك التطبيق", email, bcrypt.hash(pw)))
+                        ("مالك التطبيق", email, hash_password(pw)))
             conn.commit()
 
+        # مدير افتراضي إن لم يوجد (للمركز 1)
+        cur.execute("SELECT COUNT(*) FROM users WHERE role='admin'")
+        if cur.fetchone()[0] == 0:
+            cur.execute(
+                "INSERT INTO users(full_name,email,role,password_hash,center_id) VALUES (?,?,?,?,1)",
+                ("المدير", "admin@darien.local", "admin", hash_password("admin")),
+            )
+            conn.commit()
+
+    # تهيئة (اختياري) عبر darien_seed إن وجد
+    if ensure_darien_seed:
+        try:
+            ensure_darien_seed(conn)
+        except Exception:
+            conn.rollback()
+
+    # حسابات الطلاب الموحّدة عند الحاجة (كل المراكز دفعة واحدة)
+    with db_write() as w:
+        provision_student_accounts(w, UNIFIED_PASSWORD)
+
+
+@st.cache_resource
+def bootstrap_once(db_path):
+    """مرة واحدة لكل عملية (وليس مع كل إعادة تشغيل للسكربت)؛ المفتاح مسار القاعدة."""
+    with get_pool().writer(begin=False) as w:
+        bootstrap_database(w)
+    return True
+
 
 def get_current_center_id(conn):
     if "center_id" not in st.session_state:
@@ -273,43 +171,49 @@ def render_global_style():
 render_global_style()
 
 # ===================== إنشاء/ترحيل المخطط =====================
+bootstrap_once(DB_PATH)
 conn = get_conn()
-ensure_schema_and_migrations(conn)
-
-# مدير افتراضي إن لم يوجد (للمركز 1)
-with closing(conn.cursor()) as cur:
-    cur.execute("SELECT COUNT(*) FROM users WHERE role='admin'")
-    if cur.fetchone()[0] == 0:
-        cur.execute(
-            "INSERT INTO users(full_name,email,role,password_hash,center_id) VALUES (?,?,?,?,1)",
-            ("المدير", "admin@darien.local", "admin", bcrypt.hash("admin")),
-        )
-        conn.commit()
 
 # ===================== أدوات مساعدة =====================
 
-def qualitative_label(score, class_avg=None, class_std=None):
-    if class_avg is not None and class_std is not None and class_std > 0:
-        if score >= class_avg + class_std: return "متفوق"
-        if score >= class_avg: return "مرتفع"
-        if score >= class_avg - class_std: return "متوسط"
-        return "منخفض"
-    if score >= 90: return "متفوق"
-    if score >= 75: return "مرتفع"
-    if score >= 50: return "متوسط"
-    return "منخفض"
+def fragment_context():
+    """(اتصال القراءة، المركز، المستخدم) من حالة الجلسة عند كل تشغيل للـ fragment.
 
+    Streamlit يحفظ الـ fragment من أول تشغيل كامل ويعيد استدعاءه بوسائطه الأولى، فلو مُرِّر conn أو
+    center_id لعمل التشغيل الجزئي على مركز قديم وعلى قارئ خيط انتهى (وقد يُسلَّم لجلسة أخرى).
+    """
+    return get_conn(), st.session_state.get("center_id", 1), st.session_state.get("user")
 
-def user_by_email(conn, email, center_id):
-    with closing(conn.cursor()) as cur:
-        cur.execute(
-            "SELECT id, full_name, email, role, password_hash FROM users WHERE email=? AND center_id=?",
-            (email, center_id),
-        )
-        r = cur.fetchone()
-    if r:
-        return {"id": r[0], "full_name": r[1], "email": r[2], "role": r[3], "password_hash": r[4]}
-    return None
+
+def rerun_fragment():
+    """أعد تشغيل الـ fragment الحالية وحدها؛ خارج إعادة تشغيل fragment (تشغيل كامل) يُعاد التطبيق كله."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+def student_picker(conn, center_id, key, label="الطالب", class_name=None):
+    """اختيار طالب من قائمة كبيرة: بحث بالاسم + صفحات من STUDENT_PAGE خيارًا بدل تحميل كل الطلاب في القائمة."""
+    text = st.text_input(f"بحث عن {label}", key=f"{key}_search", placeholder="جزء من الاسم")
+    page_key = f"{key}_page"
+    if st.session_state.get(f"{key}_last_search") != text:
+        st.session_state[f"{key}_last_search"] = text
+        st.session_state[page_key] = 0
+    page = st.session_state.get(page_key, 0)
+    df, total = search_students(conn, center_id, text, class_name, page * STUDENT_PAGE)
+    if df.empty:
+        st.caption("لا يوجد طلاب مطابقون.")
+        return None
+    names = label_map(df, df["full_name"] + " - " + df["class_name"])
+    pages = (total + STUDENT_PAGE - 1) // STUDENT_PAGE
+    c1, c2, c3 = st.columns([1, 4, 1])
+    if c1.button("→", disabled=page == 0, key=f"{key}_prev"):
+        st.session_state[page_key] = page - 1; rerun_fragment()
+    sid = c2.selectbox(f"{label} ({total} · صفحة {page + 1} من {pages})", list(names), format_func=names.get, key=f"{key}_select")
+    if c3.button("←", disabled=page + 1 >= pages, key=f"{key}_next"):
+        st.session_state[page_key] = page + 1; rerun_fragment()
+    return sid
 
 # ===================== شريط التحفيز + واتساب =====================
 MOTIV = [f"عبارة تحفيزية تربوية رقم {i} — اجتهد اليوم لتتقدم غدًا." for i in range(1, 301)]
@@ -339,7 +243,7 @@ def render_whatsapp_fab():
 # ===================== اختيار المركز =====================
 
 def sidebar_center_selector(conn):
-    centers = pd.read_sql_query("SELECT id, name FROM centers ORDER BY name", conn)
+    centers = datacache.centers(conn)
     if centers.empty:
         st.sidebar.error("لا توجد مراكز.")
         return 1
@@ -347,12 +251,24 @@ def sidebar_center_selector(conn):
         st.session_state["center_id"] = int(centers.iloc[0,0])
     mapping = dict(zip(centers["name"], centers["id"]))
     current = st.session_state["center_id"]
-    sel = st.sidebar.selectbox("🧭 اختر المركز", centers["name"], index=list(centers["id"]).index(current))
+    sel = st.sidebar.selectbox("🧭 اختر المركز", centers["name"], index=list(centers["id"]).index(current), key="center_selector")
     st.session_state["center_id"] = mapping[sel]
     return mapping[sel]
 
 # ===================== تسجيل الدخول =====================
 
+def client_ip():
+    """عنوان العميل كما أضافه وكيل Render (آخر عنصر في X-Forwarded-For، فما قبله يتحكم به العميل).
+
+    None إن لم يتوفر فيُكتفى بحدّ البريد.
+    """
+    try:
+        forwarded = st.context.headers.get("X-Forwarded-For", "")
+    except Exception:
+        return None
+    return forwarded.split(",")[-1].strip() or None
+
+
 def login_any(conn, center_id):
     st.subheader("تسجيل الدخول")
     email = st.text_input("البريد الإلكتروني", key="login_email")
@@ -366,40 +282,82 @@ def login_any(conn, center_id):
         st.session_state["quran_muted_started"] = True
 
     if st.button("دخول", type="primary", key="login_button"):
-        # 0) مالك التطبيق أولاً (لا يعتمد على center_id)
-        with closing(conn.cursor()) as cur:
-            cur.execute("SELECT id, full_name, email, password_hash FROM owners WHERE email=?", (email.strip(),))
-            ow = cur.fetchone()
-        if ow and bcrypt.verify(password, ow[3]):
-            return {"kind": "owner", "id": ow[0], "full_name": ow[1], "email": ow[2], "role": "owner"}
-
-        # 1) مستخدم (معلم/مدير) ضمن المركز المحدّد
-        u = user_by_email(conn, email.strip(), center_id)
-        if u:
-            if u["role"] == "admin":
-                if bcrypt.verify(password, u["password_hash"]):
-                    return {"kind": "user", **{k: u[k] for k in ("id","full_name","email","role")}}
-            else:  # teacher
-                if password == UNIFIED_PASSWORD or bcrypt.verify(password, u["password_hash"]):
-                    return {"kind": "user", **{k: u[k] for k in ("id","full_name","email","role")}}
-
-        # 2) طالب ضمن نفس المركز
-        with closing(conn.cursor()) as cur:
-            cur.execute(
-                """
-                SELECT sa.id, sa.student_id, s.full_name, sa.email, sa.password_hash
-                FROM student_accounts sa JOIN students s ON s.id=sa.student_id
-                WHERE sa.email=? AND sa.center_id=?
-                """,
-                (email.strip(), center_id),
-            )
-            srow = cur.fetchone()
-        if srow and (password == UNIFIED_PASSWORD or bcrypt.verify(password, srow[4])):
-            return {"kind":"student","account_id":srow[0],"student_id":srow[1],"full_name":srow[2],"email":srow[3],"role":"student"}
-
-        st.error("بيانات الدخول غير صحيحة")
+        res = authenticate(conn, email, password, center_id, unified_password=UNIFIED_PASSWORD, ip=client_ip())
+        if res.retry_after:
+            st.error(f"محاولات كثيرة خاطئة — حاول بعد {int(res.retry_after // 60) + 1} دقيقة.")
+            return None
+        if res.account is None:
+            st.error("بيانات الدخول غير صحيحة")
+            return None
+        if res.rehash:
+            with db_write() as w:
+                save_rehash(w, res.rehash)
+        return res.account
     return None
 
+@st.cache_resource
+def session_key():
+    return session_secret(get_conn(), SESSION_SECRET)
+
+
+def start_session(user, center_id):
+    """بعد دخول ناجح: جلسة في القاعدة + رمزها في الرابط، فإعادة الاتصال أو إعادة تشغيل الخادم لا تطلب دخولًا جديدًا."""
+    with db_write() as w:
+        token, sid = create_session(w, session_key(), user, center_id, ip=client_ip())
+    st.session_state["user"] = user
+    st.session_state["session_token"] = token
+    st.query_params[TOKEN_PARAM] = token
+
+
+def restore_session(conn):
+    """مع كل تشغيل: تحقق HMAC + بحث بالمفتاح الأساسي؛ الجلسة الملغاة أو المنتهية تُخرج المستخدم.
+
+    رمز الجلسة الحالية يتقدم على رمز الرابط: رابط يحمل رمز حساب آخر لا يبدّل المستخدم المسجّل.
+    """
+    token = st.session_state.get("session_token") or st.query_params.get(TOKEN_PARAM)
+    if not token:
+        return
+    if st.query_params.get(TOKEN_PARAM) != token:
+        st.query_params[TOKEN_PARAM] = token
+    s = load_session(conn, session_key(), token)
+    if s is None:
+        for k in ("user", "session_token"):
+            st.session_state.pop(k, None)
+        st.query_params.pop(TOKEN_PARAM, None)
+        return
+    if "user" not in st.session_state and s.center_id is not None:
+        st.session_state["center_id"] = s.center_id
+    st.session_state["user"] = s.account
+    st.session_state["session_token"] = token
+    if s.needs_touch:
+        with db_write() as w:
+            touch_session(w, s.id)
+
+
+def end_session(conn):
+    token = st.session_state.get("session_token")
+    s = load_session(conn, session_key(), token) if token else None
+    if s is not None:
+        with db_write() as w:
+            revoke_sessions(w, [s.id])
+    st.query_params.pop(TOKEN_PARAM, None)
+    st.session_state.clear()
+
+# ===================== حفظ محررات الجداول =====================
+
+def save_editor_changes(table, old, new, columns, success_msg, after=None, **kw):
+    """احفظ فروق st.data_editor كمعاملة واحدة؛ أي خطأ يُلغي كل التغييرات. after(w) يعمل داخل نفس المعاملة."""
+    try:
+        with db_write() as w:
+            counts = save_editor(w, table, old, new, columns, **kw)
+            if after:
+                after(w)
+    except sqlite3.Error as e:
+        st.error(f"لم يُحفظ أي تغيير: {e}")
+        return None
+    st.success(f"{success_msg} — {counts['inserted']} إضافة، {counts['updated']} تعديل، {counts['deleted']} حذف")
+    return counts
+
 # ===================== إدارة كمالك (Owners) =====================
 
 def owner_panel(conn):
@@ -408,39 +366,56 @@ def owner_panel(conn):
     centers = pd.read_sql_query("SELECT id, name, address, phone FROM centers ORDER BY id", conn)
     edited = st.data_editor(centers, use_container_width=True, num_rows="dynamic", disabled=["id"], key="edit_centers")
     if st.button("حفظ تعديلات المراكز"):
-        old = centers.set_index("id")
-        new = edited.set_index("id")
-        for cid in new.index:
-            if cid in old.index:
-                if not (old.loc[cid] == new.loc[cid]).all():
-                    conn.execute("UPDATE centers SET name=?, address=?, phone=? WHERE id=?", (new.loc[cid,"name"], new.loc[cid,"address"], new.loc[cid,"phone"], int(cid)))
-            else:
-                conn.execute("INSERT INTO centers(name,address,phone) VALUES (?,?,?)", (new.loc[cid,"name"], new.loc[cid,"address"], new.loc[cid,"phone"]))
-        removed = set(old.index) - set(new.index)
-        for cid in removed:
-            conn.execute("DELETE FROM centers WHERE id=?", (int(cid),))
-        conn.commit(); st.success("تم حفظ المراكز")
+        save_editor_changes("centers", centers, edited, ["name", "address", "phone"], "تم حفظ المراكز")
 
     st.markdown("---")
     st.subheader("👤 إنشاء مدير لمركز")
-    centers2 = pd.read_sql_query("SELECT id, name FROM centers ORDER BY name", conn)
-    if centers2.empty:
+    center_names = datacache.center_names(conn)
+    if not center_names:
         st.info("أضف مركزًا أولًا")
     else:
-        c = st.selectbox("المركز", centers2["id"], format_func=lambda i: centers2.set_index('id').loc[i,'name'])
+        c = st.selectbox("المركز", list(center_names), format_func=center_names.get)
         name = st.text_input("اسم المدير")
         email = st.text_input("إيميل المدير")
         pw = st.text_input("كلمة المرور", type="password")
         if st.button("إنشاء حساب المدير"):
             try:
-                conn.execute(
-                    "INSERT INTO users(full_name,email,role,password_hash,center_id) VALUES (?,?,?,?,?)",
-                    (name.strip(), email.strip(), "admin", bcrypt.hash(pw if pw else UNIFIED_PASSWORD), int(c)),
-                )
-                conn.commit(); st.success("تم إنشاء حساب المدير")
+                with db_write() as w:
+                    w.execute(
+                        "INSERT INTO users(full_name,email,role,password_hash,center_id) VALUES (?,?,?,?,?)",
+                        (name.strip(), email.strip(), "admin", hash_password(pw if pw else UNIFIED_PASSWORD), int(c)),
+                    )
+                st.success("تم إنشاء حساب المدير")
             except sqlite3.IntegrityError:
                 st.error("هذا البريد مستخدم بالفعل")
 
+    with st.expander("🔐 الجلسات النشطة"):
+        owner_sessions(conn)
+
+    with st.expander("📈 ذاكرة الاستعلامات المرجعية"):
+        st.dataframe(datacache.lookup_cache.stats(), hide_index=True, use_container_width=True)
+
+    with st.expander("✍️ طابور حفظ الدرجات والحضور"):
+        st.dataframe(pd.Series(get_write_queue().stats(), name="القيمة").astype(object), use_container_width=True)
+
+def owner_sessions(conn):
+    sessions = active_sessions(conn)
+    if sessions.empty:
+        st.caption("لا توجد جلسات نشطة."); return
+    st.dataframe(sessions.drop(columns="id"), hide_index=True, use_container_width=True)
+    labels = dict(zip(sessions["id"], sessions["full_name"] + " · " + sessions["email"] + " · " + sessions["last_seen"].astype(str)))
+    mine = st.session_state.get("session_token", "").partition(".")[0]
+    picked = st.multiselect("جلسات للإلغاء", list(labels), format_func=labels.get, key="revoke_sessions")
+    c1, c2 = st.columns(2)
+    if c1.button("إلغاء المحدد", key="revoke_picked", disabled=not picked):
+        with db_write() as w:
+            n = revoke_sessions(w, picked)
+        st.success(f"أُلغيت {n} جلسة")
+    if c2.button("إلغاء كل الجلسات عدا جلستي", key="revoke_all"):
+        with db_write() as w:
+            n = revoke_sessions(w, [i for i in sessions["id"] if i != mine])
+        st.success(f"أُلغيت {n} جلسة")
+
 # ===================== إدارة المخطط: الطلاب/المعلمين/المواد/الحصص/مخطط الدرجات =====================
 
 def admin_edit_students(conn, center_id):
@@ -448,252 +423,457 @@ def admin_edit_students(conn, center_id):
     df = pd.read_sql_query("SELECT id, full_name, class_name FROM students WHERE center_id=? ORDER BY class_name, full_name", conn, params=[center_id])
     edited = st.data_editor(df, use_container_width=True, num_rows="dynamic", disabled=["id"], key=f"edit_students_{center_id}")
     if st.button("حفظ تعديلات الطلاب"):
-        old = df.set_index("id"); new = edited.set_index("id")
-        for sid in new.index:
-            if sid in old.index:
-                if not (old.loc[sid] == new.loc[sid]).all():
-                    conn.execute("UPDATE students SET full_name=?, class_name=? WHERE id=? AND center_id=?", (new.loc[sid,"full_name"], new.loc[sid,"class_name"], int(sid), center_id))
-            else:
-                conn.execute("INSERT INTO students(full_name, class_name, center_id) VALUES (?,?,?)", (new.loc[sid,"full_name"], new.loc[sid,"class_name"], center_id))
-        removed = set(old.index) - set(new.index)
-        for sid in removed:
-            conn.execute("DELETE FROM students WHERE id=? AND center_id=?", (int(sid), center_id))
-        conn.commit(); st.success("تم حفظ تعديلات الطلاب")
+        save_editor_changes(
+            "students", df, edited, ["full_name", "class_name"], "تم حفظ تعديلات الطلاب",
+            scope={"center_id": center_id}, insert_extra={"center_id": center_id},
+            after=lambda w: provision_student_accounts(w, UNIFIED_PASSWORD, center_id),
+        )
 
 
 def admin_edit_teachers(conn, center_id):
     st.markdown("### 🧑‍🏫 إدارة المعلمين")
-    df = pd.read_sql_query("SELECT id, full_name, email FROM users WHERE role='teacher' AND center_id=? ORDER BY full_name", conn, params=[center_id])
+    df = datacache.teachers(conn, center_id)
     edited = st.data_editor(df, use_container_width=True, num_rows="dynamic", disabled=["id"], key=f"edit_teachers_{center_id}")
     if st.button("حفظ تعديلات المعلمين"):
-        old = df.set_index("id"); new = edited.set_index("id")
-        for tid in new.index:
-            if tid in old.index:
-                if not (old.loc[tid] == new.loc[tid]).all():
-                    conn.execute("UPDATE users SET full_name=?, email=? WHERE id=? AND center_id=?", (new.loc[tid,"full_name"], new.loc[tid,"email"], int(tid), center_id))
-            else:
-                pw_hash = bcrypt.hash(UNIFIED_PASSWORD)
-                conn.execute("INSERT INTO users(full_name,email,role,password_hash,center_id) VALUES (?,?,?,?,?)", (new.loc[tid,"full_name"], new.loc[tid,"email"], "teacher", pw_hash, center_id))
-        removed = set(old.index) - set(new.index)
-        for tid in removed:
-            conn.execute("DELETE FROM users WHERE id=? AND center_id=? AND role='teacher'", (int(tid), center_id))
-        conn.commit(); st.success("تم حفظ تعديلات المعلمين")
+        save_editor_changes(
+            "users", df, edited, ["full_name", "email"], "تم حفظ تعديلات المعلمين",
+            scope={"center_id": center_id, "role": "teacher"},
+            insert_extra={"role": "teacher", "password_hash": default_password_hash(UNIFIED_PASSWORD), "center_id": center_id},
+        )
 
 
 def admin_edit_subjects(conn, center_id):
     st.markdown("### 📚 إدارة المواد")
-    df = pd.read_sql_query("SELECT id, name FROM subjects WHERE center_id=? ORDER BY name", conn, params=[center_id])
+    df = datacache.subjects(conn, center_id)
     edited = st.data_editor(df, use_container_width=True, num_rows="dynamic", disabled=["id"], key=f"edit_subjects_{center_id}")
     if st.button("حفظ تعديلات المواد"):
-        old = df.set_index("id"); new = edited.set_index("id")
-        for sid in new.index:
-            if sid in old.index:
-                if not (old.loc[sid] == new.loc[sid]).all():
-                    conn.execute("UPDATE subjects SET name=? WHERE id=? AND center_id=?", (new.loc[sid,"name"], int(sid), center_id))
-            else:
-                conn.execute("INSERT INTO subjects(name, center_id) VALUES (?,?)", (new.loc[sid,"name"], center_id))
-        removed = set(old.index) - set(new.index)
-        for sid in removed:
-            conn.execute("DELETE FROM subjects WHERE id=? AND center_id=?", (int(sid), center_id))
-        conn.commit(); st.success("تم حفظ تعديلات المواد")
+        save_editor_changes(
+            "subjects", df, edited, ["name"], "تم حفظ تعديلات المواد",
+            scope={"center_id": center_id}, insert_extra={"center_id": center_id},
+        )
 
 
 def admin_manage_lessons(conn, center_id):
     st.markdown("### 🗓️ جداول الحصص والمواعيد")
-    days = ["الإثنين","الثلاثاء","الأربعاء","الخميس","الجمعة","السبت","الأحد"]
 
-    studs_classes = pd.read_sql_query("SELECT DISTINCT class_name FROM students WHERE center_id=? ORDER BY class_name", conn, params=[center_id])
-    subs = pd.read_sql_query("SELECT id, name FROM subjects WHERE center_id=? ORDER BY name", conn, params=[center_id])
-    teach = pd.read_sql_query("SELECT id, full_name FROM users WHERE role='teacher' AND center_id=? ORDER BY full_name", conn, params=[center_id])
+    studs_classes = datacache.classes(conn, center_id)
+    sub_names = datacache.subject_names(conn, center_id)
+    teacher_names = datacache.teacher_names(conn, center_id)
 
     with st.form("add_lesson"):
         c = st.selectbox("الصف/الفصل", studs_classes["class_name"]) if not studs_classes.empty else st.text_input("الصف/الفصل")
-        subj = st.selectbox("المادة", subs["id"], format_func=lambda i: subs.set_index('id').loc[i,'name']) if not subs.empty else st.number_input("معرّف المادة", step=1)
-        t = st.selectbox("المعلم", teach["id"], format_func=lambda i: teach.set_index('id').loc[i,'full_name']) if not teach.empty else st.number_input("معرّف المعلّم", step=1)
-        d = st.selectbox("اليوم", list(range(7)), format_func=lambda i: days[i])
+        subj = st.selectbox("المادة", list(sub_names), format_func=sub_names.get) if sub_names else st.number_input("معرّف المادة", step=1)
+        t = st.selectbox("المعلم", list(teacher_names), format_func=teacher_names.get) if teacher_names else st.number_input("معرّف المعلّم", step=1)
+        d = st.selectbox("اليوم", list(range(7)), format_func=lambda i: DAYS[i])
         start = st.time_input("من")
         end = st.time_input("إلى")
+        room = st.text_input("القاعة (اختياري)").strip() or None
         if st.form_submit_button("إضافة/حجز الحصّة"):
-            conn.execute(
-                "INSERT INTO lessons(center_id,class_name,subject_id,teacher_id,day_of_week,start_time,end_time) VALUES (?,?,?,?,?,?,?)",
-                (center_id, c, int(subj), int(t), int(d), start.strftime('%H:%M'), end.strftime('%H:%M')),
-            )
-            conn.commit(); st.success("تمت إضافة الحصة")
+            lesson = {"class_name": c, "teacher_id": int(t), "day_of_week": int(d), "room": room,
+                      "start_time": start.strftime('%H:%M'), "end_time": end.strftime('%H:%M')}
+            if lesson["start_time"] >= lesson["end_time"]:
+                st.error("وقت البداية يجب أن يسبق وقت النهاية.")
+            else:
+                # الفحص والإدخال في معاملة الكتابة نفسها حتى لا تُحجز الفترة مرتين
+                with db_write() as w:
+                    conflicts = lesson_conflicts(w, center_id, lesson)
+                    if not conflicts:
+                        w.execute(
+                            "INSERT INTO lessons(center_id,class_name,subject_id,teacher_id,day_of_week,start_time,end_time,room) VALUES (?,?,?,?,?,?,?,?)",
+                            (center_id, c, int(subj), int(t), int(d), lesson["start_time"], lesson["end_time"], room),
+                        )
+                if conflicts:
+                    st.error("تعذّر الحجز — " + "، ".join(f"{why} (الحصة #{lid})" for why, lid in conflicts))
+                else:
+                    st.success("تمت إضافة الحصة")
+
+    st.markdown("#### الجدول الأسبوعي")
+    g1, g2 = st.columns([1, 3])
+    by = g1.radio("عرض حسب", ["الصف", "المعلم"], key="grid_by")
+    if by == "الصف":
+        cls = g2.selectbox("الصف", studs_classes["class_name"], key="grid_class") if not studs_classes.empty else None
+        grid = weekly_grid(conn, center_id, class_name=cls) if cls else pd.DataFrame()
+    else:
+        tid = g2.selectbox("المعلم", list(teacher_names), format_func=teacher_names.get, key="grid_teacher") if teacher_names else None
+        grid = weekly_grid(conn, center_id, teacher_id=tid) if tid else pd.DataFrame()
+    if grid.empty:
+        st.info("لا توجد حصص مسجلة لهذا الاختيار.")
+    else:
+        st.dataframe(grid, use_container_width=True)
 
     st.markdown("#### الحصص المسجلة")
     df = pd.read_sql_query(
         """
         SELECT l.id, l.class_name AS "الصف", s.name AS "المادة", u.full_name AS "المعلم",
-               l.day_of_week AS "اليوم", l.start_time AS "من", l.end_time AS "إلى"
+               l.day_of_week AS "اليوم", l.start_time AS "من", l.end_time AS "إلى", l.room AS "القاعة"
         FROM lessons l JOIN subjects s ON s.id=l.subject_id JOIN users u ON u.id=l.teacher_id
         WHERE l.center_id=? ORDER BY l.class_name, l.day_of_week, l.start_time
         """,
         conn,
         params=[center_id],
     )
+    df["اليوم"] = df["اليوم"].map(lambda i: DAYS[i] if 0 <= i < 7 else i)
     st.dataframe(df, use_container_width=True)
 
 
 def admin_manage_grading_scheme(conn, center_id):
     st.markdown("### 🧮 مخطط الدرجات (حد أدنى/أقصى وعتبات نوعية)")
-    classes = pd.read_sql_query("SELECT DISTINCT class_name FROM students WHERE center_id=? ORDER BY class_name", conn, params=[center_id])
-    subs = pd.read_sql_query("SELECT id, name FROM subjects WHERE center_id=? ORDER BY name", conn, params=[center_id])
+    classes = datacache.classes(conn, center_id)
+    sub_names = datacache.subject_names(conn, center_id)
     with st.form("scheme"):
         c = st.selectbox("الصف", classes["class_name"]) if not classes.empty else st.text_input("الصف")
-        subj = st.selectbox("المادة (اختياري)", [None] + subs["id"].tolist(), format_func=lambda i: "— كل المواد —" if i is None else subs.set_index('id').loc[i,'name']) if not subs.empty else None
+        subj = st.selectbox("المادة (اختياري)", [None] + list(sub_names), format_func=lambda i: "— كل المواد —" if i is None else sub_names[i]) if sub_names else None
         min_s = st.number_input("الدرجة الدنيا", value=0.0, step=0.5)
         max_s = st.number_input("الدرجة العظمى", value=100.0, step=0.5)
         excellent = st.number_input("حد 'متفوق' %", value=90.0, step=1.0)
         high = st.number_input("حد 'مرتفع' %", value=75.0, step=1.0)
         avg = st.number_input("حد 'متوسط' %", value=50.0, step=1.0)
+        always = st.checkbox("يسري على كل الدرجات (بلا تاريخ بداية)", value=False)
+        since = st.date_input("يسري من تاريخ", value=dt.date.today())
         if st.form_submit_button("حفظ/تحديث المخطط"):
-            conn.execute(
-                "INSERT INTO grading_scheme(center_id,class_name,subject_id,min_score,max_score,excellent_cut,high_cut,average_cut) VALUES (?,?,?,?,?,?,?,?)",
-                (center_id, c, None if subj is None else int(subj), float(min_s), float(max_s), float(excellent), float(high), float(avg)),
-            )
-            conn.commit(); st.success("تم حفظ المخطط")
+            # نفس الصف/المادة/التاريخ يُعدَّل في مكانه؛ تاريخ جديد يضيف إصدارًا لا يغيّر تقييم الدرجات الأقدم
+            with db_write() as w:
+                save_scheme(w, center_id, c, subj, {"min_score": min_s, "max_score": max_s, "excellent_cut": excellent,
+                                                    "high_cut": high, "average_cut": avg},
+                            SINCE_ALWAYS if always else since.isoformat())
+            st.success("تم حفظ المخطط")
 
     st.markdown("#### المخططات المسجلة")
-    df = pd.read_sql_query(
-        "SELECT id, class_name AS 'الصف', subject_id AS 'مادة#', min_score AS 'الدنيا', max_score AS 'العظمى', excellent_cut AS '%متفوق', high_cut AS '%مرتفع', average_cut AS '%متوسط' FROM grading_scheme WHERE center_id=? ORDER BY class_name, subject_id",
-        conn,
-        params=[center_id],
-    )
-    st.dataframe(df, use_container_width=True)
+    df = center_schemes(conn, center_id).sort_values(["class_name", "subject_id", "effective_from"])
+    df["subject_id"] = df["subject_id"].map(lambda i: sub_names.get(i, "— كل المواد —"))
+    df["effective_from"] = df["effective_from"].replace(SINCE_ALWAYS, "دائمًا")
+    df = df.drop(columns="day").rename(columns={
+        "class_name": "الصف", "subject_id": "المادة", "effective_from": "يسري من", "min_score": "الدنيا",
+        "max_score": "العظمى", "excellent_cut": "%متفوق", "high_cut": "%مرتفع", "average_cut": "%متوسط"})
+    st.dataframe(df.drop(columns="id"), hide_index=True, use_container_width=True)
+    drop = st.multiselect("حذف إصدارات", df["id"].tolist(), key="scheme_delete",
+                          format_func=label_map(df, df["الصف"] + " — " + df["المادة"] + " — " + df["يسري من"]).get)
+    if drop and st.button("حذف المحدد", key="scheme_delete_btn"):
+        with db_write() as w:
+            delete_schemes(w, center_id, drop)
+        rerun_fragment()
 
 # ===================== لوحات واجهة الاستخدام =====================
 
-def honor_board_top10(conn, center_id, class_name=None, subject_id=None, date_iso=None):
-    where = "WHERE g.center_id=?"; params = [center_id]
-    if class_name: where += " AND s.class_name=?"; params.append(class_name)
-    if subject_id: where += " AND g.subject_id=?"; params.append(subject_id)
-    if date_iso: where += " AND g.grade_date=?" ; params.append(date_iso)
-    q = f"""
-    SELECT s.full_name AS student, s.class_name AS class, g.subject_id, sub.name AS subject, g.grade_date, g.score
-    FROM grades g JOIN students s ON s.id=g.student_id JOIN subjects sub ON sub.id=g.subject_id
-    {where} ORDER BY g.score DESC
+def render_export(conn, center_id, filters, key, file_stem="grades", notes=NOTE_COLUMNS):
+    """الملف يُجهَّز عند الطلب فقط (وليس مع كل إعادة تشغيل) بالتدفق من المؤشر، ثم يظهر زر التنزيل.
+
+    يُرفض ما فوق EXPORT_MAX_ROWS صف: زر التنزيل يُبقي الملف كله في ذاكرة الخادم.
     """
-    df = pd.read_sql_query(q, conn, params=params)
-    if df.empty: return df
-    n = len(df); k = max(1, math.ceil(n * 0.10))
-    return df.head(k)
-
-
-def admin_panel(conn, center_id):
-    tabs = st.tabs(["👥 الطلاب","📚 المواد","🧑‍🏫 المعلمون","🔗 التعيينات","🗓️ الحصص","🧮 مخطط الدرجات","📈 التقارير","🏅 المجتهدون"])
-    with tabs[0]:
-        order = st.selectbox("طريقة الفرز", ["الصف ثم الاسم","الاسم","الصف فقط","أحدث إضافة"], index=0)
-        order_sql = {"الصف ثم الاسم": "ORDER BY class_name, full_name","الاسم": "ORDER BY full_name","الصف فقط": "ORDER BY class_name","أحدث إضافة": "ORDER BY id DESC"}[order]
-        df_students = pd.read_sql_query(f"SELECT id AS 'رقم', full_name AS 'الاسم الكامل', class_name AS 'الصف' FROM students WHERE center_id=? {order_sql}", conn, params=[center_id])
-        st.dataframe(df_students, use_container_width=True)
-        st.markdown("---"); admin_edit_students(conn, center_id)
-    with tabs[1]: admin_edit_subjects(conn, center_id)
-    with tabs[2]: admin_edit_teachers(conn, center_id)
-    with tabs[3]:
-        st.markdown("**تعيين طالب ↔ مادة ↔ معلّم**")
-        studs = pd.read_sql_query("SELECT id, full_name, class_name FROM students WHERE center_id=? ORDER BY class_name, full_name", conn, params=[center_id])
-        subs  = pd.read_sql_query("SELECT id, name FROM subjects WHERE center_id=? ORDER BY name", conn, params=[center_id])
-        teach = pd.read_sql_query("SELECT id, full_name, email FROM users WHERE role='teacher' AND center_id=? ORDER BY full_name", conn, params=[center_id])
-        if studs.empty or subs.empty or teach.empty:
-            st.info("أضف طلاب/مواد/معلمين أولاً.")
-        else:
-            sid = st.selectbox("طالب", studs["id"], format_func=lambda i: f"{studs.set_index('id').loc[i,'full_name']} - {studs.set_index('id').loc[i,'class_name']}")
-            subid= st.selectbox("مادة", subs["id"], format_func=lambda i: subs.set_index('id').loc[i,'name'])
-            tid  = st.selectbox("معلّم", teach["id"], format_func=lambda i: f"{teach.set_index('id').loc[i,'full_name']} ({teach.set_index('id').loc[i,'email']})")
-            if st.button("تعيين"):
-                conn.execute("INSERT INTO enrollments(student_id,subject_id,teacher_id,center_id) VALUES (?,?,?,?)", (int(sid), int(subid), int(tid), center_id))
-                conn.commit(); st.success("تم التعيين")
-        st.markdown("**التعيينات الحالية**")
-        q = """
-        SELECT e.id AS "#", s.full_name AS "الطالب", s.class_name AS "الصف", sub.name AS "المادة", u.full_name AS "المعلم"
-        FROM enrollments e JOIN students s ON s.id=e.student_id JOIN subjects sub ON sub.id=e.subject_id JOIN users u ON u.id=e.teacher_id
-        WHERE e.center_id=? ORDER BY "الصف", "الطالب", "المادة"
-        """
-        st.dataframe(pd.read_sql_query(q, conn, params=[center_id]), use_container_width=True)
-    with tabs[4]: admin_manage_lessons(conn, center_id)
-    with tabs[5]: admin_manage_grading_scheme(conn, center_id)
-    with tabs[6]:
-        c1,c2 = st.columns(2)
-        fd = c1.date_input("من تاريخ", value=None); td = c2.date_input("إلى تاريخ", value=None)
-        params=[center_id]; where="WHERE g.center_id=?"
-        if fd: where += " AND g.grade_date >= ?"; params.append(fd.isoformat())
-        if td: where += " AND g.grade_date <= ?"; params.append(td.isoformat())
-        q = f"""
-        SELECT g.id AS "#", g.grade_date AS "التاريخ", s.full_name AS "الطالب", s.class_name AS "الصف", sub.name AS "المادة",
-               u.full_name AS "المعلم", g.score AS "الدرجة", g.min_score AS "الدنيا", g.max_score AS "العظمى",
-               g.note AS "ملاحظة للطالب", g.note_teacher AS "ملاحظة للمعلم", g.note_parent AS "ملاحظة لولي الأمر", g.note_admin AS "ملاحظة للمدير"
-        FROM grades g JOIN students s ON s.id=g.student_id JOIN subjects sub ON sub.id=g.subject_id JOIN users u ON u.id=g.teacher_id
-        {where} ORDER BY g.grade_date DESC
-        """
-        df = pd.read_sql_query(q, conn, params=params)
-        st.dataframe(df, use_container_width=True)
-    with tabs[7]:
-        classes = pd.read_sql_query("SELECT DISTINCT class_name FROM students WHERE center_id=? ORDER BY class_name", conn, params=[center_id])
-        subs = pd.read_sql_query("SELECT id, name FROM subjects WHERE center_id=? ORDER BY name", conn, params=[center_id])
-        if classes.empty or subs.empty:
-            st.info("أضف طلابًا وموادًا أولًا.")
-        else:
-            c = st.selectbox("اختر الصف", classes["class_name"]) 
-            s = st.selectbox("اختر المادة", subs["id"], format_func=lambda i: subs.set_index('id').loc[i,'name'])
-            d = st.date_input("اختر التاريخ", value=dt.date.today())
-            df = honor_board_top10(conn, center_id, c, int(s), d.isoformat())
-            if df.empty:
-                st.info("لا بيانات لهذا الاختيار.")
+    formats = ["CSV"] + (["Excel"] if XLSX_AVAILABLE else [])
+    c1, c2 = st.columns([1, 2])
+    fmt = c1.radio("صيغة التصدير", formats, horizontal=True, key=f"{key}_fmt")
+    if c2.button("⬇️ تجهيز ملف التصدير", key=f"{key}_prepare"):
+        if report_count_estimate(conn, center_id, filters, cap=EXPORT_MAX_ROWS)[1]:
+            c2.warning(f"التصدير محدود بـ {EXPORT_MAX_ROWS:,} صف؛ ضيّق الفلاتر (التاريخ أو المادة أو الصف)."); return
+        # ملف على القرص لا SpooledTemporaryFile: نسخة الذاكرة الوحيدة هي البايتات التي يحتفظ بها download_button
+        with tempfile.TemporaryFile() as tmp:
+            if fmt == "CSV":
+                n = export_csv(conn, center_id, filters, tmp, notes); ext, mime = "csv", "text/csv"
             else:
-                df.rename(columns={"student":"الطالب","class":"الصف","subject":"المادة","grade_date":"التاريخ","score":"الدرجة"}, inplace=True)
-                st.dataframe(df[["الطالب","الصف","المادة","التاريخ","الدرجة"]], use_container_width=True)
+                n = export_xlsx(conn, center_id, filters, tmp, notes); ext, mime = "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            tmp.seek(0)
+            c2.download_button(f"تنزيل الملف ({n} صف)", tmp.read(), file_name=f"{file_stem}.{ext}", mime=mime, key=f"{key}_download")
+
+
+IMPORT_KINDS = {
+    "students": ("الطلاب", "الاسم، الصف"),
+    "teachers": ("المعلمون", "الاسم، البريد، المواد (اختياري)"),
+    "enrollments": ("التعيينات", "الطالب، الصف، المادة، المعلم (بريد أو اسم)"),
+    "lessons": ("الحصص", "الصف، المادة، المعلم، اليوم، من، إلى، القاعة (اختياري) — تُرفض الحصص المتعارضة"),
+}
+
+
+def admin_import_tab(conn, center_id):
+    """رفع CSV/Excel → معاينة الصالح والمرفوض مع السبب → اعتماد بمعاملة واحدة."""
+    kind = st.radio("نوع البيانات", list(IMPORT_KINDS), format_func=lambda k: IMPORT_KINDS[k][0], horizontal=True, key="imp_kind")
+    st.caption("الأعمدة المطلوبة: " + IMPORT_KINDS[kind][1])
+    f = st.file_uploader("ملف CSV أو Excel", type=["csv", "xlsx"], key=f"imp_file_{kind}")
+    if f is None:
+        return
+    try:
+        plan = plan_import(conn, kind, read_table(f.name, f.getvalue()), center_id)
+    except ValueError as e:
+        st.error(str(e)); return
+    c1, c2 = st.columns(2)
+    c1.metric("صفوف صالحة", len(plan.rows)); c2.metric("صفوف مرفوضة", len(plan.rejected))
+    if not plan.rejected.empty:
+        with st.expander("الصفوف المرفوضة"):
+            st.dataframe(plan.rejected, use_container_width=True)
+    if plan.rows.empty:
+        st.info("لا توجد صفوف صالحة للاستيراد."); return
+    st.dataframe(plan.rows.head(20), use_container_width=True)
+    if st.button("اعتماد الاستيراد", key="imp_commit"):
+        try:
+            with db_write() as w:
+                n = commit_import(w, kind, plan, center_id, UNIFIED_PASSWORD)
+        except sqlite3.Error as e:
+            st.error(f"تعذّر الاستيراد: {e}"); return
+        st.success(f"تم استيراد {n} صف")
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def cached_analytics(query, center_id, version, **params):
+    """نتيجة استعلام تجميعي من analytics؛ version (عدّاد data_versions) يُبطل النسخة القديمة بعد أي كتابة."""
+    return getattr(analytics, query)(get_conn(), center_id, **params)
+
+
+ANALYTICS_BUCKETS = {"day": "يوم", "week": "أسبوع", "month": "شهر"}
+
+
+def admin_analytics_tab(conn, center_id):
+    sub_names = datacache.subject_names(conn, center_id)
+    c1, c2, c3 = st.columns(3)
+    fd = c1.date_input("من تاريخ", value=dt.date.today() - dt.timedelta(days=90), key="an_from").isoformat()
+    td = c2.date_input("إلى تاريخ", value=dt.date.today(), key="an_to").isoformat()
+    subj = c3.selectbox("المادة", [None] + list(sub_names), format_func=lambda i: "— الكل —" if i is None else sub_names[i], key="an_subject")
+    c4, c5 = st.columns(2)
+    bucket = c4.radio("التجميع", list(ANALYTICS_BUCKETS), format_func=ANALYTICS_BUCKETS.get, index=1, horizontal=True, key="an_bucket")
+    by = c5.radio("حسب", ["class_name", "subject"], format_func={"class_name": "الصف", "subject": "المادة"}.get, horizontal=True, key="an_by")
+
+    gv = data_version(conn, "grades")
+    trend = cached_analytics("grade_trend", center_id, gv, date_from=fd, date_to=td, by=by, subject_id=subj, bucket=bucket)
+    st.markdown("**متوسط الدرجات عبر الزمن**")
+    if trend.empty:
+        st.info("لا درجات في هذه الفترة.")
+    else:
+        st.altair_chart(
+            alt.Chart(trend).mark_line(point=True).encode(
+                x=alt.X("التاريخ:T"), y=alt.Y("المتوسط:Q"), color=alt.Color("السلسلة:N", title=None),
+                tooltip=["التاريخ:T", "السلسلة:N", alt.Tooltip("المتوسط:Q", format=".1f"), "عدد الدرجات:Q"],
+            ),
+            use_container_width=True,
+        )
 
-# ===================== لوحة المعلّم =====================
+    dist = cached_analytics("score_distribution", center_id, gv, date_from=fd, date_to=td,
+                            subject_ids=[subj] if subj else list(sub_names))
+    st.markdown("**توزيع الدرجات**")
+    if dist.empty:
+        st.info("لا درجات في هذه الفترة.")
+    else:
+        st.altair_chart(
+            alt.Chart(dist).mark_bar().encode(
+                x=alt.X("الفئة:O", title=f"الدرجة (فئات بعرض {analytics.SCORE_BIN})"), y=alt.Y("العدد:Q"),
+                tooltip=["الفئة:O", "العدد:Q"],
+            ),
+            use_container_width=True,
+        )
 
-def teacher_daily_panel(conn, center_id, user):
-    st.subheader("🗓️ إدخال الدرجات اليومية")
-    teacher_classes = pd.read_sql_query(
-        """
-        SELECT DISTINCT s.class_name
-        FROM enrollments e JOIN students s ON s.id = e.student_id
-        WHERE e.teacher_id = ? AND e.center_id=?
-        ORDER BY s.class_name
-    """, conn, params=[user["id"], center_id])
-    if teacher_classes.empty:
-        st.info("لم يتم تعيين أي صفوف لك بعد."); return
+    att = cached_analytics("attendance_rate", center_id, data_version(conn, "attendance"),
+                           date_from=fd, date_to=td, subject_id=subj, bucket=bucket)
+    st.markdown("**نسبة الحضور**")
+    if att.empty:
+        st.info("لا سجلات حضور في هذه الفترة.")
+    else:
+        st.altair_chart(
+            alt.Chart(att).mark_area(line=True, opacity=0.3).encode(
+                x=alt.X("التاريخ:T"), y=alt.Y("نسبة الحضور:Q", scale=alt.Scale(domain=[0, 100])),
+                tooltip=["التاريخ:T", alt.Tooltip("نسبة الحضور:Q", format=".1f"), "السجلات:Q"],
+            ),
+            use_container_width=True,
+        )
 
-    selected_class = st.selectbox("اختر الصف", options=teacher_classes["class_name"])
-    class_students = pd.read_sql_query(
-        """
-        SELECT s.id, s.full_name
-        FROM enrollments e JOIN students s ON s.id = e.student_id
-        WHERE e.teacher_id = ? AND s.class_name = ? AND e.center_id=?
-        ORDER BY s.full_name
-    """, conn, params=[user["id"], selected_class, center_id])
-    if class_students.empty:
+
+REPORT_LABEL_COLUMNS = {"class_name": "الصف", "grade_date": "التاريخ", "score": "الدرجة", "min_score": "الدنيا", "max_score": "العظمى"}
+
+
+def admin_reports_tab(conn, center_id):
+    c1,c2 = st.columns(2)
+    fd = c1.date_input("من تاريخ", value=None); td = c2.date_input("إلى تاريخ", value=None)
+    classes = datacache.classes(conn, center_id)
+    sub_names = datacache.subject_names(conn, center_id)
+    teacher_names = datacache.teacher_names(conn, center_id)
+    f1,f2,f3,f4 = st.columns(4)
+    c = f1.selectbox("الصف", [None] + classes["class_name"].tolist(), format_func=lambda v: "— الكل —" if v is None else v, key="rep_class")
+    subj = f2.selectbox("المادة", [None] + list(sub_names), format_func=lambda i: "— الكل —" if i is None else sub_names[i], key="rep_subject")
+    t = f3.selectbox("المعلم", [None] + list(teacher_names), format_func=lambda i: "— الكل —" if i is None else teacher_names[i], key="rep_teacher")
+    studs = pd.read_sql_query("SELECT id, full_name FROM students WHERE center_id=? AND class_name=? ORDER BY full_name", conn, params=[center_id, c]) if c else None
+    stu_names = label_map(studs, "full_name") if studs is not None else None
+    stu = f4.selectbox("الطالب", [None] + list(stu_names), format_func=lambda i: "— الكل —" if i is None else stu_names[i], key="rep_student") if studs is not None else None
+    filters = {"date_from": fd.isoformat() if fd else None, "date_to": td.isoformat() if td else None,
+               "class_name": c, "subject_id": subj, "teacher_id": t, "student_id": stu}
+
+    # مؤشرات الصفحات: قائمة بآخر (التاريخ، id) لكل صفحة سابقة؛ تُصفّر عند تغيير الفلاتر
+    if st.session_state.get("rep_filters") != filters:
+        st.session_state["rep_filters"] = filters
+        st.session_state["rep_cursors"] = []
+    cursors = st.session_state["rep_cursors"]
+    df = report_page(conn, center_id, filters, after=cursors[-1] if cursors else None)
+    df.insert(df.columns.get_loc("الدرجة") + 1, "التقييم", label_grades(conn, center_id, df, REPORT_LABEL_COLUMNS))
+
+    n, more = report_count_estimate(conn, center_id, filters)
+    page_no = len(cursors) + 1
+    st.caption(f"عدد الدرجات: {'أكثر من ' if more else ''}{n} · الصفحة {page_no}")
+    event = st.dataframe(df, use_container_width=True, hide_index=True, column_config={"subject_id": None},
+                         on_select="rerun", selection_mode="single-row", key="rep_table")
+
+    p1,p2 = st.columns(2)
+    if p1.button("→ السابق", disabled=not cursors, key="rep_prev"):
+        cursors.pop(); rerun_fragment()
+    if p2.button("التالي ←", disabled=len(df) < PAGE_SIZE, key="rep_next"):
+        last = df.iloc[-1]
+        cursors.append((last["التاريخ"], int(last["#"]))); rerun_fragment()
+
+    render_export(conn, center_id, filters, key="rep_export", file_stem=f"grades_center{center_id}")
+
+    # الملاحظات تُجلب فقط للصف المحدد
+    rows = event.selection.rows if event else []
+    if rows:
+        gid = int(df.iloc[rows[0]]["#"])
+        notes = grade_notes(conn, gid, center_id)
+        with st.expander(f"ملاحظات الدرجة #{gid}", expanded=True):
+            for label, text in (notes or {}).items():
+                st.markdown(f"**{label}:** {text or '—'}")
+
+
+def admin_guardians_tab(conn, center_id):
+    """حسابات أولياء الأمور وربطهم بطلاب المركز."""
+    with st.form("add_guardian"):
+        st.markdown("**حساب ولي أمر جديد**")
+        name = st.text_input("الاسم")
+        email = st.text_input("البريد الإلكتروني")
+        pw = st.text_input("كلمة المرور (فارغة = الموحّدة)", type="password")
+        if st.form_submit_button("إنشاء الحساب"):
+            if not name.strip() or "@" not in email:
+                st.error("الاسم والبريد مطلوبان.")
+            else:
+                try:
+                    with db_write() as w:
+                        w.execute(
+                            "INSERT INTO guardian_accounts(full_name, email, password_hash, center_id) VALUES (?,?,?,?)",
+                            (name.strip(), email.strip().lower(), hash_password(pw) if pw else default_password_hash(UNIFIED_PASSWORD), center_id),
+                        )
+                    st.success("تم إنشاء حساب ولي الأمر")
+                except sqlite3.IntegrityError:
+                    st.error("هذا البريد مستخدم بالفعل")
+
+    guardians = center_guardians(conn, center_id)
+    if guardians.empty:
+        st.info("لا يوجد أولياء أمور بعد."); return
+    st.markdown("**ربط ابن بولي أمر**")
+    g_labels = label_map(guardians, guardians["full_name"] + " (" + guardians["email"] + ")")
+    gid = st.selectbox("ولي الأمر", list(g_labels), format_func=g_labels.get, key="guardian_pick")
+    sid = student_picker(conn, center_id, key="guardian_student", label="الطالب")
+    if st.button("ربط", key="guardian_link", disabled=sid is None):
+        with db_write() as w:
+            link_children(w, gid, [sid])
+        st.success("تم الربط")
+
+    links = center_links(conn, center_id)
+    if links.empty:
+        return
+    st.dataframe(links.drop(columns=["guardian_id", "student_id"]), hide_index=True, use_container_width=True)
+    link_labels = dict(zip(zip(links["guardian_id"], links["student_id"]), links["ولي الأمر"] + " ← " + links["الطالب"]))
+    drop = st.multiselect("فك الربط", list(link_labels), format_func=link_labels.get, key="guardian_unlink")
+    if st.button("فك الربط المحدد", key="guardian_unlink_btn", disabled=not drop):
+        with db_write() as w:
+            unlink_children(w, drop)
+        st.success(f"تم فك {len(drop)} ربط")
+
+
+def admin_students_tab(conn, center_id):
+    order = st.selectbox("طريقة الفرز", ["الصف ثم الاسم","الاسم","الصف فقط","أحدث إضافة"], index=0)
+    order_sql = {"الصف ثم الاسم": "ORDER BY class_name, full_name","الاسم": "ORDER BY full_name","الصف فقط": "ORDER BY class_name","أحدث إضافة": "ORDER BY id DESC"}[order]
+    df_students = pd.read_sql_query(f"SELECT id AS 'رقم', full_name AS 'الاسم الكامل', class_name AS 'الصف' FROM students WHERE center_id=? {order_sql}", conn, params=[center_id])
+    st.dataframe(df_students, use_container_width=True)
+    st.markdown("---"); admin_edit_students(conn, center_id)
+
+
+def admin_enrollments_tab(conn, center_id):
+    st.markdown("**تعيين طالب ↔ مادة ↔ معلّم**")
+    sub_names = datacache.subject_names(conn, center_id)
+    teach = datacache.teachers(conn, center_id)
+    teach_labels = label_map(teach, teach["full_name"] + " (" + teach["email"] + ")")
+    sid = student_picker(conn, center_id, key="enroll_student", label="طالب")
+    if sid is None or not sub_names or not teach_labels:
+        st.info("أضف طلاب/مواد/معلمين أولاً.")
+    else:
+        subid= st.selectbox("مادة", list(sub_names), format_func=sub_names.get)
+        tid  = st.selectbox("معلّم", list(teach_labels), format_func=teach_labels.get)
+        if st.button("تعيين"):
+            with db_write() as w:
+                # طالب/مادة لهما معلّم واحد: التعيين الجديد يستبدل المعلّم السابق
+                w.execute(
+                    """
+                    INSERT INTO enrollments(student_id,subject_id,teacher_id,center_id) VALUES (?,?,?,?)
+                    ON CONFLICT(student_id, subject_id, center_id) DO UPDATE SET teacher_id=excluded.teacher_id
+                    """,
+                    (int(sid), int(subid), int(tid), center_id),
+                )
+            st.success("تم التعيين")
+    st.markdown("**التعيينات الحالية**")
+    st.dataframe(center_enrollments(conn, center_id), use_container_width=True)
+
+
+def admin_honor_tab(conn, center_id):
+    classes = datacache.classes(conn, center_id)
+    sub_names = datacache.subject_names(conn, center_id)
+    if classes.empty or not sub_names:
+        st.info("أضف طلابًا وموادًا أولًا.")
+        return
+    scope = st.radio("نطاق الترتيب", ["صف ومادة محددان", "كل الصفوف والمواد"], horizontal=True)
+    d = st.date_input("اختر التاريخ", value=dt.date.today())
+    if scope == "صف ومادة محددان":
+        c = st.selectbox("اختر الصف", classes["class_name"]) 
+        s = st.selectbox("اختر المادة", list(sub_names), format_func=sub_names.get)
+        df = honor_board_top10(conn, center_id, c, int(s), d.isoformat())
+    else:
+        df = honor_board_top10(conn, center_id, date_iso=d.isoformat(), per="class_subject")
+    if df.empty:
+        st.info("لا بيانات لهذا الاختيار.")
+    else:
+        df["التقييم"] = label_grades(conn, center_id, df, {"class_name": "class"})
+        df.rename(columns={"student":"الطالب","class":"الصف","subject":"المادة","grade_date":"التاريخ","score":"الدرجة"}, inplace=True)
+        st.dataframe(df[["الطالب","الصف","المادة","التاريخ","الدرجة","التقييم"]], use_container_width=True)
+
+
+ADMIN_TABS = {
+    "👥 الطلاب": admin_students_tab,
+    "📚 المواد": admin_edit_subjects,
+    "🧑‍🏫 المعلمون": admin_edit_teachers,
+    "🔗 التعيينات": admin_enrollments_tab,
+    "🗓️ الحصص": admin_manage_lessons,
+    "🧮 مخطط الدرجات": admin_manage_grading_scheme,
+    "📈 التقارير": admin_reports_tab,
+    "🏅 المجتهدون": admin_honor_tab,
+    "📥 الاستيراد": admin_import_tab,
+    "📊 التحليلات": admin_analytics_tab,
+    "👪 أولياء الأمور": admin_guardians_tab,
+}
+
+
+@st.fragment
+def admin_panel():
+    """قسم واحد فقط يُرسم ويستعلم (st.tabs كانت تنفّذ كل الأقسام في كل تشغيل).
+
+    اللوحة fragment: أي تفاعل داخلها يعيد تشغيلها وحدها بلا الترحيل والشريط والشريط الجانبي.
+    """
+    conn, center_id, _ = fragment_context()
+    section = st.radio("القسم", list(ADMIN_TABS), horizontal=True, key="admin_section", label_visibility="collapsed")
+    ADMIN_TABS[section](conn, center_id)
+
+# ===================== لوحة المعلّم =====================
+
+def teacher_single_entry(conn, center_id, user, selected_class, roster):
+    # من قائمة المعلّم في الذاكرة: تبديل الصف أو الطالب لا يستعلم عن التعيينات
+    student_names = roster.students.get(selected_class, {})
+    if not student_names:
         st.info("لا يوجد طلاب معينون لك في هذا الصف."); return
 
-    sid = st.selectbox("اختر الطالب", options=class_students["id"], format_func=lambda i: class_students.set_index('id').loc[i, 'full_name'])
-    avail_subjects = pd.read_sql_query(
-        """
-        SELECT sub.id, sub.name
-        FROM enrollments e JOIN subjects sub ON e.subject_id = sub.id
-        WHERE e.teacher_id = ? AND e.student_id = ? AND e.center_id=?
-        ORDER BY sub.name
-    """, conn, params=[user["id"], int(sid), center_id])
-    if avail_subjects.empty:
+    sid = st.selectbox("اختر الطالب", options=list(student_names), format_func=student_names.get)
+    avail_names = roster.subjects.get(sid, {})
+    if not avail_names:
         st.info("لا توجد مواد معينة لهذا الطالب."); return
 
-    subid = st.selectbox("المادة", options=avail_subjects["id"], format_func=lambda i: avail_subjects.set_index('id').loc[i,'name'])
-
-    # مخطط درجات للصف/المادة (إن وجد)
-    scheme = pd.read_sql_query(
-        """
-        SELECT min_score, max_score, excellent_cut, high_cut, average_cut
-        FROM grading_scheme
-        WHERE center_id=? AND class_name=? AND (subject_id IS NULL OR subject_id=?)
-        ORDER BY subject_id NULLS FIRST LIMIT 1
-        """,
-        conn, params=[center_id, selected_class, int(subid)])
-    default_min = float(scheme.iloc[0,0]) if not scheme.empty else 0.0
-    default_max = float(scheme.iloc[0,1]) if not scheme.empty else 100.0
+    subid = st.selectbox("المادة", options=list(avail_names), format_func=avail_names.get)
 
     gdate = st.date_input("تاريخ اليوم", value=dt.date.today())
+
+    # مخطط الدرجات الساري يومها للصف/المادة (إن وجد) من الخريطة المخزّنة
+    scheme = scheme_for(conn, center_id, selected_class, subid, gdate.isoformat())
+    default_min = scheme["min_score"] if scheme else 0.0
+    default_max = scheme["max_score"] if scheme else 100.0
+
     min_val = st.number_input("الدرجة الدنيا", min_value=0.0, max_value=10000.0, step=0.5, value=default_min)
     max_val = st.number_input("الدرجة العظمى", min_value=0.0, max_value=10000.0, step=0.5, value=default_max)
     score = st.number_input("الدرجة", min_value=min_val, max_value=max_val, step=0.5)
@@ -704,89 +884,204 @@ def teacher_daily_panel(conn, center_id, user):
     saved_row = st.empty()
 
     if st.button("حفظ الدرجة", type="primary"):
-        conn.execute(
+        queued_write(
+            sqlite3.Connection.execute,
             """
-            INSERT INTO grades(student_id,subject_id,teacher_id,grade_date,score,note,note_teacher,note_parent,note_admin,min_score,max_score,center_id)
+            INSERT INTO grades_wide(student_id,subject_id,teacher_id,grade_date,score,note,note_teacher,note_parent,note_admin,min_score,max_score,center_id)
             VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
             """,
             (int(sid), int(subid), int(user["id"]), gdate.isoformat(), float(score), note, note, note_p, note_a, float(min_val), float(max_val), center_id),
         )
-        conn.commit()
-
-        percent = None
-        if max_val is not None and max_val > min_val:
-            percent = (float(score) - float(min_val)) / (float(max_val) - float(min_val)) * 100.0
-        if percent is not None and not scheme.empty and all(pd.notna(scheme.iloc[0,2:5])):
-            exc, high, avg = map(float, scheme.iloc[0,2:5])
-            if percent >= exc: qlabel = "متفوق"
-            elif percent >= high: qlabel = "مرتفع"
-            elif percent >= avg: qlabel = "متوسط"
-            else: qlabel = "منخفض"
-        else:
-            scores_df = pd.read_sql_query(
-                "SELECT g.score FROM grades g JOIN students s ON s.id=g.student_id WHERE s.class_name=? AND g.subject_id=? AND g.grade_date=? AND g.center_id=?",
-                conn, params=[selected_class, int(subid), gdate.isoformat(), center_id])
-            scores = scores_df["score"].tolist()
-            avg_v = stats.mean(scores) if scores else None
-            std_v = stats.pstdev(scores) if len(scores) > 1 else None
-            qlabel = qualitative_label(float(score), avg_v, std_v)
-
-        sname = class_students.set_index('id').loc[int(sid),'full_name']
-        subname = avail_subjects.set_index('id').loc[int(subid),'name']
+
+        row = pd.DataFrame([{"class_name": selected_class, "subject_id": int(subid), "grade_date": gdate.isoformat(),
+                             "score": float(score), "min_score": float(min_val), "max_score": float(max_val)}])
+        qlabel = label_grades(conn, center_id, row).iloc[0]
+
+        sname = student_names[sid]
+        subname = avail_names[subid]
         show = pd.DataFrame([{ "رقم الطالب": int(sid), "اسم الطالب": sname, "الصف": selected_class, "المادة": subname, "التاريخ": gdate.isoformat(), "الدرجة": float(score), "الدنيا": float(min_val), "العظمى": float(max_val), "التقييم النوعي": qlabel }])
         saved_row.dataframe(show, use_container_width=True)
         st.success(f"تم حفظ الدرجة. <span class='badge-qual'>{qlabel}</span>", icon="✅")
 
+
+def teacher_roll_call(conn, center_id, user, selected_class, roster):
+    """رصد حضور الصف كاملًا لحصة واحدة وحفظه بـ upsert واحدة."""
+    sub_names = roster.class_subjects.get(selected_class, {})
+    if not sub_names:
+        st.info("لا توجد مواد معينة لك في هذا الصف."); return
+    c1, c2 = st.columns(2)
+    subid = int(c1.selectbox("المادة", options=list(sub_names), format_func=sub_names.get, key="att_subject"))
+    att_date = c2.date_input("التاريخ", value=dt.date.today(), key="att_date").isoformat()
+
+    sheet = roll_call_sheet(conn, center_id, user["id"], selected_class, subid, att_date)
+    if sheet.empty:
+        st.info("لا يوجد طلاب معينون لك في هذه المادة."); return
+    if not sheet["recorded"].any():
+        st.caption("لم يُرصد حضور هذه الحصة بعد — الجميع \"حاضر\" افتراضيًا.")
+    edited = st.data_editor(
+        sheet,
+        column_config={
+            "student_id": None, "recorded": None,
+            "full_name": st.column_config.TextColumn("الطالب", disabled=True),
+            "status": st.column_config.SelectboxColumn("الحالة", options=list(STATUSES.values()), required=True),
+            "note": st.column_config.TextColumn("ملاحظة"),
+        },
+        hide_index=True, use_container_width=True, num_rows="fixed",
+        key=f"att_{selected_class}_{subid}_{att_date}",
+    )
+    if st.button("حفظ الحضور", type="primary", key="att_save"):
+        n = queued_write(save_roll_call, center_id, user["id"], subid, att_date, edited)
+        absent = int((edited["status"] != STATUSES["present"]).sum())
+        st.success(f"تم رصد حضور {n} طالب ({absent} غائب).", icon="✅")
+
+    st.markdown("**ملخص الحضور — آخر 30 يومًا**")
+    today = dt.date.today()
+    summary = class_summary(conn, center_id, selected_class, (today - dt.timedelta(days=30)).isoformat(), today.isoformat(), subid)
+    if summary.empty:
+        st.info("لا سجلات حضور بعد.")
+    else:
+        st.dataframe(summary, hide_index=True, use_container_width=True)
+
+
+def teacher_class_sheet(conn, center_id, user, selected_class, roster):
+    """ورقة الصف: كل طلاب الصف في المادة لتاريخ واحد، تُحفظ بمعاملة واحدة بدل حفظ لكل طالب."""
+    sub_names = roster.class_subjects.get(selected_class, {})
+    if not sub_names:
+        st.info("لا توجد مواد معينة لك في هذا الصف."); return
+    c1, c2 = st.columns(2)
+    subid = int(c1.selectbox("المادة", options=list(sub_names), format_func=sub_names.get, key="sheet_subject"))
+    gdate = c2.date_input("التاريخ", value=dt.date.today(), key="sheet_date").isoformat()
+
+    scheme = scheme_for(conn, center_id, selected_class, subid, gdate)
+    c3, c4 = st.columns(2)
+    min_val = float(c3.number_input("الدرجة الدنيا", min_value=0.0, max_value=10000.0, step=0.5,
+                                    value=scheme["min_score"] if scheme else 0.0, key="sheet_min"))
+    max_val = float(c4.number_input("الدرجة العظمى", min_value=0.0, max_value=10000.0, step=0.5,
+                                    value=scheme["max_score"] if scheme else 100.0, key="sheet_max"))
+
+    # طلاب الصف مع آخر درجة مسجلة لهم في هذا اليوم (إن وجدت) — استعلام واحد
+    sheet = grade_sheet(conn, center_id, user["id"], subid, selected_class, gdate)
+    if sheet.empty:
+        st.info("لا يوجد طلاب معينون لك في هذه المادة."); return
+
+    edited = st.data_editor(
+        sheet,
+        column_config={
+            "student_id": None, "grade_id": None,
+            "full_name": st.column_config.TextColumn("الطالب", disabled=True),
+            "score": st.column_config.NumberColumn("الدرجة", min_value=min_val, max_value=max_val, step=0.5),
+            "note": st.column_config.TextColumn("ملاحظة للطالب"),
+        },
+        hide_index=True, use_container_width=True, num_rows="fixed",
+        key=f"sheet_{selected_class}_{subid}_{gdate}",
+    )
+
+    if st.button("حفظ درجات الصف", type="primary", key="sheet_save"):
+        filled = edited[edited["score"].notna()].copy()
+        filled["note"] = filled["note"].astype(object).where(filled["note"].notna() & filled["note"].ne(""), None)
+        same = (filled["score"] == sheet.loc[filled.index, "score"]) & (
+            filled["note"].fillna("") == sheet.loc[filled.index, "note"].fillna(""))
+        updates = filled[filled["grade_id"].notna() & ~same]
+        inserts = filled[filled["grade_id"].isna()]
+        def save_sheet(w):
+            w.executemany(
+                "UPDATE grades_wide SET score=?, note=?, note_teacher=?, min_score=?, max_score=?, teacher_id=? WHERE id=? AND center_id=?",
+                [(float(r.score), r.note, r.note, min_val, max_val, int(user["id"]), int(r.grade_id), center_id)
+                 for r in updates.itertuples()],
+            )
+            w.executemany(
+                """
+                INSERT INTO grades_wide(student_id,subject_id,teacher_id,grade_date,score,note,note_teacher,min_score,max_score,center_id)
+                VALUES (?,?,?,?,?,?,?,?,?,?)
+                """,
+                [(int(r.student_id), subid, int(user["id"]), gdate, float(r.score), r.note, r.note, min_val, max_val, center_id)
+                 for r in inserts.itertuples()],
+            )
+
+        queued_write(save_sheet)
+        shown = filled[["full_name", "score"]].rename(columns={"full_name": "الطالب", "score": "الدرجة"})
+        shown["التقييم النوعي"] = label_grades(
+            conn, center_id, filled.assign(class_name=selected_class, subject_id=subid, grade_date=gdate, min_score=min_val, max_score=max_val))
+        st.dataframe(shown, hide_index=True, use_container_width=True)
+        st.success(f"تم الحفظ: {len(inserts)} درجة جديدة و{len(updates)} تعديل.", icon="✅")
+
+
+@st.fragment
+def teacher_daily_panel():
+    conn, center_id, user = fragment_context()
+    st.subheader("🗓️ إدخال الدرجات اليومية")
+    roster = datacache.roster(conn, user["id"], center_id)
+    if not roster.classes:
+        st.info("لم يتم تعيين أي صفوف لك بعد."); return
+
+    with st.expander("🗓️ جدولي الأسبوعي"):
+        grid = weekly_grid(conn, center_id, teacher_id=user["id"])
+        if grid.empty:
+            st.caption("لا توجد حصص مسجلة لك.")
+        else:
+            st.dataframe(grid, use_container_width=True)
+
+    selected_class = st.selectbox("اختر الصف", options=roster.classes)
+    mode = st.radio("طريقة الإدخال", ["طالب واحد", "الصف كاملًا", "الحضور والغياب"], horizontal=True, key="entry_mode")
+    if mode == "الصف كاملًا":
+        teacher_class_sheet(conn, center_id, user, selected_class, roster)
+    elif mode == "الحضور والغياب":
+        teacher_roll_call(conn, center_id, user, selected_class, roster)
+    else:
+        teacher_single_entry(conn, center_id, user, selected_class, roster)
+
     st.divider(); st.subheader("درجاتي الأخيرة")
-    df = pd.read_sql_query(
-        """
-        SELECT g.id AS "#", g.grade_date AS "التاريخ", s.full_name AS "الطالب", sub.name AS "المادة",
-               g.score AS "الدرجة", g.min_score AS "الدنيا", g.max_score AS "العظمى", g.note AS "الملاحظات"
-        FROM grades g JOIN students s ON s.id=g.student_id JOIN subjects sub ON sub.id=g.subject_id
-        WHERE g.teacher_id=? AND g.center_id=? ORDER BY g.grade_date DESC, g.id DESC LIMIT 200
-    """, conn, params=[user["id"], center_id])
+    df = teacher_recent_grades(conn, user["id"], center_id)
     st.dataframe(df, use_container_width=True)
     render_whatsapp_fab()
 
 # ===================== بوابة الطالب =====================
 
-def student_portal(conn, center_id, user):
+@st.fragment
+def student_portal():
+    conn, center_id, user = fragment_context()
     st.subheader("🎓 بوابة الطالب — عرض الدرجات")
     kid = user["student_id"]
-    df = pd.read_sql_query(
-        """
-        SELECT g.grade_date AS "التاريخ", sub.name AS "المادة", g.score AS "الدرجة",
-               g.min_score AS "الدنيا", g.max_score AS "العظمى", g.note AS "ملاحظات المعلم"
-        FROM grades g JOIN subjects sub ON sub.id=g.subject_id
-        WHERE g.student_id=? AND g.center_id=? ORDER BY g.grade_date DESC
-    """, conn, params=[int(kid), center_id])
-    st.dataframe(df, use_container_width=True)
+    df = student_grades(conn, kid, center_id)
+    df.insert(df.columns.get_loc("الدرجة") + 1, "التقييم", label_grades(conn, center_id, df, dict(REPORT_LABEL_COLUMNS, class_name="class_name")))
+    st.dataframe(df, use_container_width=True, column_config={"subject_id": None, "class_name": None})
+    render_export(conn, center_id, {"student_id": kid}, key="student_export", file_stem="my_grades", notes=STUDENT_NOTE_COLUMNS)
+    att = student_summary(conn, center_id, kid)
+    if not att.empty:
+        st.markdown("**الحضور والغياب**")
+        st.dataframe(att, hide_index=True, use_container_width=True)
+    render_whatsapp_fab()
+
+# ===================== بوابة ولي الأمر =====================
+
+@st.fragment
+def guardian_portal():
+    conn, _, user = fragment_context()
+    st.subheader("👪 بوابة ولي الأمر")
+    kids = children(conn, user["id"])
+    if kids.empty:
+        st.info("لم يُربط أي ابن بحسابك بعد. تواصل مع إدارة المركز."); return
+    st.caption("الأبناء: " + "، ".join(kids["full_name"] + " (" + kids["class_name"] + ")"))
+
+    # مؤشرات الصفحات كما في التقارير: آخر (التاريخ، النوع، الرقم) لكل صفحة سابقة
+    cursors = st.session_state.setdefault("guardian_cursors", [])
+    df = guardian_feed(conn, user["id"], after=cursors[-1] if cursors else None)
+    st.dataframe(df, hide_index=True, use_container_width=True, column_config={"kind": None, "id": None})
+    p1, p2 = st.columns(2)
+    if p1.button("→ الأحدث", disabled=not cursors, key="guardian_prev"):
+        cursors.pop(); rerun_fragment()
+    if p2.button("الأقدم ←", disabled=len(df) < GUARDIAN_PAGE, key="guardian_next"):
+        last = df.iloc[-1]
+        cursors.append((last["التاريخ"], last["kind"], int(last["id"]))); rerun_fragment()
     render_whatsapp_fab()
 
 # ===================== التشغيل =====================
 
 st.title("📊 تطبيق الدرجات — متعدد المراكز")
 
+restore_session(conn)
 center_id = sidebar_center_selector(conn)
 
-# تهيئة (اختياري) عبر darien_seed إن وجد
-if ensure_darien_seed:
-    try:
-        ensure_darien_seed(conn)
-    except Exception:
-        pass
-
-# حسابات الطلاب الموحّدة عند الحاجة
-with closing(conn.cursor()) as cur:
-    cur.execute("SELECT id FROM students WHERE center_id=?", (center_id,))
-    student_ids = [r[0] for r in cur.fetchall()]
-for sid in student_ids:
-    existing = pd.read_sql_query("SELECT id FROM student_accounts WHERE student_id=? AND center_id=?", conn, params=[sid, center_id])
-    if existing.empty:
-        email = f"student{sid}@darien.local"
-        conn.execute("INSERT INTO student_accounts(student_id,email,password_hash,center_id) VALUES (?,?,?,?)", (sid, email, bcrypt.hash(UNIFIED_PASSWORD), center_id))
-        conn.commit()
-
 # شريط التحفيز
 if seed_render_marquee:
     try:
@@ -799,7 +1094,7 @@ else:
 if "user" not in st.session_state:
     u = login_any(conn, center_id)
     if u:
-        st.session_state["user"] = u
+        start_session(u, center_id)
         st.rerun()
     st.stop()
 
@@ -812,7 +1107,7 @@ with st.sidebar:
         st.warning("⚠️ هذا حساب مالك افتراضي. يُنصح بضبط OWNER_EMAIL و OWNER_PASSWORD من إعدادات البيئة.")
     st.info(f"كلمة المرور الموحّدة (غير المدير): {UNIFIED_PASSWORD}")
     if st.button("تسجيل الخروج"):
-        st.session_state.clear(); st.rerun()
+        end_session(conn); st.rerun()
 
 # عرض اللوحات حسب الدور
 if user["role"] == "owner":
@@ -820,13 +1115,15 @@ if user["role"] == "owner":
     owner_panel(conn)
     st.divider()
     st.subheader("إدارة مركز محدد")
-    center_id = sidebar_center_selector(conn)
-    admin_panel(conn, center_id)
+    # المركز المختار في الشريط الجانبي أعلاه (استدعاء المحدد مرة ثانية كان يكرر عنصر الاختيار نفسه)
+    admin_panel()
 elif user["role"] == "admin":
-    admin_panel(conn, center_id)
+    admin_panel()
 elif user["role"] == "teacher":
-    teacher_daily_panel(conn, center_id, user)
+    teacher_daily_panel()
 elif user["role"] == "student":
-    student_portal(conn, center_id, user)
+    student_portal()
+elif user["role"] == "guardian":
+    guardian_portal()
 else:
     st.info("هذا الإصدار يركّز على لوحتي المدير والمعلّم والطالب.")
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# attendance.py — رصد الحضور لصف كامل بـ executemany واحدة + ملخصات تجميعية من SQL
+
+import pandas as pd
+
+STATUSES = {"present": "حاضر", "absent_excused": "غائب بعذر", "absent_unexcused": "غائب بدون عذر"}
+STATUS_CODES = {v: k for k, v in STATUSES.items()}
+
+
+def roll_call_sheet(conn, center_id, teacher_id, class_name, subject_id, att_date):
+    """طلاب المعلّم في الصف/المادة مع حالة اليوم المسجلة (أو "حاضر" افتراضيًا) — استعلام واحد."""
+    df = pd.read_sql_query(
+        """
+        SELECT s.id AS student_id, s.full_name, a.status, a.note
+        FROM (SELECT DISTINCT student_id FROM enrollments
+              WHERE teacher_id=? AND subject_id=? AND center_id=?) e
+        JOIN students s ON s.id=e.student_id AND s.class_name=?
+        LEFT JOIN attendance a
+          ON a.student_id=s.id AND a.subject_id=? AND a.att_date=? AND a.center_id=?
+        ORDER BY s.full_name
+        """,
+        conn, params=[teacher_id, subject_id, center_id, class_name, subject_id, att_date, center_id],
+    )
+    df["recorded"] = df["status"].notna()
+    df["status"] = df["status"].fillna("present").map(STATUSES)
+    return df
+
+
+def save_roll_call(conn, center_id, teacher_id, subject_id, att_date, sheet):
+    """upsert لكل الصف في executemany واحدة داخل معاملة المستدعي (db_write). يعيد عدد الصفوف."""
+    rows = [
+        (int(r.student_id), int(subject_id), int(teacher_id), att_date, STATUS_CODES[r.status],
+         r.note if isinstance(r.note, str) and r.note.strip() else None, center_id)
+        for r in sheet.itertuples()
+    ]
+    conn.executemany(
+        """
+        INSERT INTO attendance(student_id, subject_id, teacher_id, att_date, status, note, center_id)
+        VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT(student_id, subject_id, att_date, center_id)
+        DO UPDATE SET status=excluded.status, note=excluded.note, teacher_id=excluded.teacher_id
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+_COUNTS = """
+    COUNT(*) AS "الحصص",
+    SUM(a.status='present') AS "حاضر",
+    SUM(a.status='absent_excused') AS "غائب بعذر",
+    SUM(a.status='absent_unexcused') AS "غائب بدون عذر",
+    ROUND(100.0 * AVG(a.status='present'), 1) AS "نسبة الحضور %"
+"""
+
+
+def class_summary(conn, center_id, class_name, date_from, date_to, subject_id=None):
+    """ملخص لكل طالب في الصف خلال الفترة (فهرس (center_id, att_date, subject_id))."""
+    where = "WHERE a.center_id=? AND a.att_date BETWEEN ? AND ?"; params = [center_id, date_from, date_to]
+    if subject_id: where += " AND a.subject_id=?"; params.append(int(subject_id))
+    return pd.read_sql_query(
+        f"""
+        SELECT s.full_name AS "الطالب", {_COUNTS}
+        FROM attendance a JOIN students s ON s.id=a.student_id AND s.class_name=?
+        {where}
+        GROUP BY s.id ORDER BY s.full_name
+        """,
+        conn, params=[class_name] + params,
+    )
+
+
+def student_summary(conn, center_id, student_id):
+    """ملخص طالب واحد لكل مادة (فهرس UNIQUE يبدأ بـ student_id)."""
+    return pd.read_sql_query(
+        f"""
+        SELECT sub.name AS "المادة", {_COUNTS}
+        FROM attendance a JOIN subjects sub ON sub.id=a.subject_id
+        WHERE a.student_id=? AND a.center_id=?
+        GROUP BY a.subject_id ORDER BY sub.name
+        """,
+        conn, params=[int(student_id), center_id],
+    )
+
+
+__all__ = ["STATUSES", "roll_call_sheet", "save_roll_call", "class_summary", "student_summary"]
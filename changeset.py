@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# changeset.py — حساب فروق st.data_editor دفعة واحدة وتطبيقها بـ executemany
+
+from collections import namedtuple
+
+ChangeSet = namedtuple("ChangeSet", ["inserts", "updates", "deletes"])
+
+
+def _rows(df, columns):
+    """صفوف بأنواع بايثون (sqlite3 لا يقبل numpy.int64) مع NaN → None."""
+    vals = df[columns].astype(object)
+    return vals.where(vals.notna(), None).values.tolist()
+
+
+def diff_frames(old, new, columns, key="id"):
+    """قارن الجدول الأصلي بالمعدَّل بعمليات متجهة بدل حلقة صف بصف.
+
+    الصفوف الجديدة في المحرر بلا مفتاح (key فارغ)؛ الصفوف الفارغة كليًا تُتجاهل.
+    """
+    added = new[new[key].isna()]
+    added = added[added[columns].notna().any(axis=1)]
+    kept = new[new[key].notna()].astype({key: "int64"}).set_index(key)
+    base = old.set_index(key)
+
+    deletes = [int(i) for i in base.index.difference(kept.index)]
+    common = kept.index.intersection(base.index)
+    a = base.loc[common, columns]
+    b = kept.loc[common, columns]
+    same = (a == b) | (a.isna() & b.isna())
+    changed = b[~same.all(axis=1)]
+    return ChangeSet(added[columns], changed.reset_index()[[key] + columns], deletes)
+
+
+def apply_changeset(conn, table, changes, columns, key="id", scope=None, insert_extra=None):
+    """طبّق الإضافات/التعديلات/الحذف بثلاث executemany داخل معاملة المستدعي (db_write).
+
+    scope: شروط إضافية {عمود: قيمة} على UPDATE/DELETE (مثل center_id).
+    insert_extra: أعمدة ثابتة تُضاف لكل صف جديد (مثل center_id و role).
+    يعيد {"inserted": n, "updated": n, "deleted": n}.
+    """
+    scope = scope or {}
+    insert_extra = insert_extra or {}
+    scope_sql = "".join(f" AND {c}=?" for c in scope)
+    scope_vals = list(scope.values())
+
+    if not changes.updates.empty:
+        sets = ", ".join(f"{c}=?" for c in columns)
+        conn.executemany(
+            f"UPDATE {table} SET {sets} WHERE {key}=?{scope_sql}",
+            [r[1:] + [r[0]] + scope_vals for r in _rows(changes.updates, [key] + columns)],
+        )
+    if not changes.inserts.empty:
+        cols = columns + list(insert_extra)
+        conn.executemany(
+            f"INSERT INTO {table}({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            [r + list(insert_extra.values()) for r in _rows(changes.inserts, columns)],
+        )
+    if changes.deletes:
+        conn.executemany(
+            f"DELETE FROM {table} WHERE {key}=?{scope_sql}",
+            [[i] + scope_vals for i in changes.deletes],
+        )
+    return {"inserted": len(changes.inserts), "updated": len(changes.updates), "deleted": len(changes.deletes)}
+
+
+def save_editor(conn, table, old, new, columns, **kw):
+    return apply_changeset(conn, table, diff_frames(old, new, columns), columns, **kw)
+
+
+__all__ = ["ChangeSet", "diff_frames", "apply_changeset", "save_editor"]
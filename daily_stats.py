@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# daily_stats.py — جدول grade_daily_stats المجمّع (مركز، صف، مادة، يوم): إعادة بناء، فحص تطابق، وقراءة سريعة
+#
+# الجدول والمشغّلات تُنشأ في الترحيل 4 (migrations.py) وتحدّثه تلقائيًا مع كل إدخال/تعديل/حذف في grades.
+# من سطر الأوامر:  python daily_stats.py check|rebuild [center_id]
+
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from gradebook import GRADE_DATE
+
+STATS_COLUMNS = ["center_id", "class_name", "subject_id", "grade_date", "n", "total", "total_sq", "min_score", "max_score"]
+
+# التجميع من الجدول الخام؛ {where} شرط إضافي على g/s، و{day} عمود اليوم و{date} نصّه ISO
+AGGREGATE_SQL = """
+    SELECT g.center_id, s.class_name, g.subject_id, {date},
+           COUNT(*), SUM(g.score), SUM(g.score * g.score), MIN(g.score), MAX(g.score)
+    FROM grades g JOIN students s ON s.id=g.student_id
+    {where}
+    GROUP BY g.center_id, s.class_name, g.subject_id, {day}
+"""
+
+KEY_CHUNK = 5000
+
+
+def _center_where(center_id, alias="g"):
+    if center_id is None:
+        return "", []
+    return f"WHERE {alias}.center_id=?", [int(center_id)]
+
+
+def _aggregate_sql(conn, where):
+    """الترحيل 4 يعيد البناء قبل أن يحوّل الترحيل 13 grade_date النصي إلى grade_day."""
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(grades)").fetchall()]
+    if "grade_day" in cols:
+        return AGGREGATE_SQL.format(where=where, day="g.grade_day", date=GRADE_DATE)
+    return AGGREGATE_SQL.format(where=where, day="g.grade_date", date="g.grade_date")
+
+
+def rebuild_daily_stats(conn, center_id=None):
+    """أعد بناء الجدول من grades (لمركز واحد أو للكل). المعاملة يملكها المستدعي. يعيد عدد المجموعات."""
+    where, params = _center_where(center_id, alias="grade_daily_stats")
+    conn.execute(f"DELETE FROM grade_daily_stats {where}", params)
+    where, params = _center_where(center_id)
+    cur = conn.execute(
+        f"INSERT INTO grade_daily_stats({', '.join(STATS_COLUMNS)}) {_aggregate_sql(conn, where)}", params
+    )
+    return cur.rowcount
+
+
+def check_daily_stats(conn, center_id=None, tol=1e-6):
+    """قارن الجدول المجمّع بتجميع جديد من grades. يعيد DataFrame بالمجموعات المختلفة (فارغ = متطابق)."""
+    keys = ["center_id", "class_name", "subject_id", "grade_date"]
+    where, params = _center_where(center_id)
+    fresh = pd.DataFrame(conn.execute(_aggregate_sql(conn, where), params).fetchall(), columns=STATS_COLUMNS)
+    where, params = _center_where(center_id, alias="grade_daily_stats")
+    stored = pd.read_sql_query(f"SELECT {', '.join(STATS_COLUMNS)} FROM grade_daily_stats {where}", conn, params=params)
+    both = fresh.merge(stored, how="outer", on=keys, suffixes=("", "_stored"), indicator=True)
+    bad = both["_merge"] != "both"
+    for c in ["n", "total", "total_sq", "min_score", "max_score"]:
+        a, b = both[c].astype("float64"), both[f"{c}_stored"].astype("float64")
+        bad |= (a - b).abs() > tol * a.abs().clip(lower=1.0)
+    return both[bad].rename(columns={"_merge": "الحالة"})
+
+
+def group_stats(conn, center_id, pairs):
+    """صفوف الجدول لأزواج (المادة، اليوم) المطلوبة — بحث بالمفتاح الأساسي بدل مسح الدرجات الخام."""
+    pairs = sorted({(int(s), str(d)) for s, d in pairs})
+    rows = []
+    for i in range(0, len(pairs), KEY_CHUNK):
+        chunk = pairs[i:i + KEY_CHUNK]
+        values = ",".join("(?,?)" for _ in chunk)
+        rows += conn.execute(
+            f"""
+            WITH k(subject_id, grade_date) AS (VALUES {values})
+            SELECT d.class_name, d.subject_id, d.grade_date, d.n, d.total, d.total_sq
+            FROM k JOIN grade_daily_stats d
+              ON d.center_id=? AND d.subject_id=k.subject_id AND d.grade_date=k.grade_date
+            """,
+            [v for p in chunk for v in p] + [int(center_id)],
+        ).fetchall()
+    return rows
+
+
+__all__ = ["STATS_COLUMNS", "rebuild_daily_stats", "check_daily_stats", "group_stats"]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("check", "rebuild"):
+        print("الاستخدام: python daily_stats.py check|rebuild [center_id]")
+        sys.exit(2)
+    center = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    conn = sqlite3.connect(os.environ.get("GRADES_DB_PATH", "grades.db"))
+    if sys.argv[1] == "rebuild":
+        with conn:
+            print(f"تمت إعادة البناء: {rebuild_daily_stats(conn, center)} مجموعة.")
+    else:
+        diff = check_daily_stats(conn, center)
+        print("الجدول المجمّع مطابق." if diff.empty else diff.to_string())
+        sys.exit(0 if diff.empty else 1)
+
@@ -322,7 +322,7 @@ def ensure_darien_seed(conn):
             conn.execute("INSERT INTO subjects(name) VALUES (?)", (s,))
     conn.commit()
 
-    # معلمون (users.role='teacher') + جدول أسبوعي عام
+    # معلمون (users.role='teacher') — أيام الحضور تظهر في الشريط، والحصص تُحجز من تبويب الجداول
     from passlib.hash import bcrypt
     for t in TEACHERS:
         email = f"{t['name']}.teacher@darien.local".replace(" ", "").replace("ـ","")
@@ -332,18 +332,6 @@ def ensure_darien_seed(conn):
                 "INSERT INTO users(full_name,email,role,password_hash) VALUES (?,?,?,?)",
                 (t["name"], email, "teacher", bcrypt.hash("123456"))
             )
-            tid = _get_id(conn, "SELECT id FROM users WHERE email=?", (email,))
-        for subj in t["subjects"]:
-            sid = _get_id(conn, "SELECT id FROM subjects WHERE name=?", (subj,))
-            if sid:
-                exists = _get_id(conn, """
-                    SELECT id FROM weekly_schedule
-                    WHERE class_name=? AND day_of_week=? AND subject_id=? AND teacher_id=?""",
-                    ("كل الصفوف", t["days"], sid, tid)
-                )
-                if not exists:
-                    conn.execute("""INSERT INTO weekly_schedule(class_name,day_of_week,subject_id,teacher_id)
-                                    VALUES (?,?,?,?)""", ("كل الصفوف", t["days"], sid, tid))
     conn.commit()
 
     # المدير – لو مش موجود
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# datacache.py — عدّادات إصدار البيانات لكل جدول (تزيد بمشغّلات SQLite مع كل كتابة) + ذاكرة مؤقتة للقوائم المرجعية
+
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import closing
+
+import pandas as pd
+
+# الجداول التي لها عدّاد في data_versions (تُنشأ مشغّلاتها في الترحيلات)
+VERSIONED_TABLES = ["grades", "attendance", "centers", "students", "subjects", "users", "enrollments", "grading_scheme"]
+STUDENT_PAGE = 50  # خيارات قائمة الطلاب في الصفحة الواحدة
+
+
+def version_triggers(table):
+    """مشغّلات INSERT/UPDATE/DELETE التي تزيد عدّاد الجدول بمقدار واحد لكل صف متغيّر."""
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{op.lower()} AFTER {op} ON {table}
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = '{table}'; END
+        """
+        for op in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def data_version(conn, *tables):
+    """مجموع إصدارات الجداول المطلوبة (أو كلها) — يتغيّر كلما كُتب في أيٍّ منها، ولو من عملية أخرى."""
+    names = list(tables) or VERSIONED_TABLES
+    with closing(conn.cursor()) as cur:
+        cur.execute(
+            f"SELECT COALESCE(SUM(version), 0) FROM data_versions WHERE name IN ({','.join('?' * len(names))})", names
+        )
+        return cur.fetchone()[0]
+
+
+class LookupCache:
+    """نتائج الاستعلامات المرجعية في الذاكرة، صالحة ما دام إصدار جداولها لم يتغيّر.
+
+    المشغّلات تزيد العدّاد مع كل كتابة من أي مسار (المحررات، الاستيراد، عملية أخرى)، فلا حاجة لإبطال يدوي.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def get(self, conn, name, tables, loader, *args):
+        version = data_version(conn, *tables)
+        key = (name,) + args
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version:
+                self._data.move_to_end(key)
+                self.hits[name] += 1
+                return entry[1].copy()
+            self.misses[name] += 1
+        value = loader(conn, *args)
+        with self._lock:
+            self._data[key] = (version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value.copy()
+
+    def stats(self):
+        """جدول المراقبة: الإصابات والإخفاقات ونسبة الإصابة لكل استعلام."""
+        names = sorted(set(self.hits) | set(self.misses))
+        df = pd.DataFrame({"الاستعلام": names,
+                           "إصابات": [self.hits[n] for n in names],
+                           "إخفاقات": [self.misses[n] for n in names]})
+        df["نسبة الإصابة %"] = (100.0 * df["إصابات"] / (df["إصابات"] + df["إخفاقات"]).clip(lower=1)).round(1)
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+
+lookup_cache = LookupCache()
+
+
+def _query(sql):
+    return lambda conn, *params: pd.read_sql_query(sql, conn, params=list(params))
+
+
+def centers(conn):
+    return lookup_cache.get(conn, "centers", ["centers"], _query("SELECT id, name FROM centers ORDER BY name"))
+
+
+def classes(conn, center_id):
+    return lookup_cache.get(conn, "classes", ["students"], _query(
+        "SELECT DISTINCT class_name FROM students WHERE center_id=? ORDER BY class_name"), center_id)
+
+
+def subjects(conn, center_id):
+    return lookup_cache.get(conn, "subjects", ["subjects"], _query(
+        "SELECT id, name FROM subjects WHERE center_id=? ORDER BY name"), center_id)
+
+
+def teachers(conn, center_id):
+    return lookup_cache.get(conn, "teachers", ["users"], _query(
+        "SELECT id, full_name, email FROM users WHERE role='teacher' AND center_id=? ORDER BY full_name"), center_id)
+
+
+class Roster(namedtuple("Roster", ["classes", "students", "subjects", "class_subjects"])):
+    """تعيينات معلّم واحد في الذاكرة: classes قائمة الصفوف، students[الصف] = {رقم الطالب: الاسم}،
+    subjects[رقم الطالب] = {رقم المادة: الاسم}، class_subjects[الصف] = {رقم المادة: الاسم}.
+
+    تُشارك بين الجلسات فهي للقراءة فقط؛ copy() يعيدها نفسها بدل نسخ القواميس.
+    """
+    __slots__ = ()
+
+    def copy(self):
+        return self
+
+
+def _build_roster(conn, teacher_id, center_id):
+    with closing(conn.cursor()) as cur:
+        cur.execute(
+            """
+            SELECT s.class_name, s.id, s.full_name, sub.id, sub.name
+            FROM enrollments e JOIN students s ON s.id=e.student_id JOIN subjects sub ON sub.id=e.subject_id
+            WHERE e.teacher_id=? AND e.center_id=?
+            ORDER BY s.class_name, s.full_name, sub.name
+            """,
+            (teacher_id, center_id),
+        )
+        rows = cur.fetchall()
+    students, subjects, class_subjects = {}, {}, {}
+    for cls, sid, name, subid, subname in rows:
+        students.setdefault(cls, {})[sid] = name
+        subjects.setdefault(sid, {})[subid] = subname
+        class_subjects.setdefault(cls, {})[subid] = subname
+    class_subjects = {c: dict(sorted(d.items(), key=lambda kv: kv[1])) for c, d in class_subjects.items()}
+    return Roster(list(students), students, subjects, class_subjects)
+
+
+def roster(conn, teacher_id, center_id):
+    """صف → طلاب → مواد للمعلّم باستعلام واحد، يُعاد بناؤه فقط عند تغيّر التعيينات أو الطلاب أو المواد."""
+    return lookup_cache.get(conn, "roster", ["enrollments", "students", "subjects"], _build_roster,
+                            int(teacher_id), int(center_id))
+
+
+def label_map(df, label, key="id"):
+    """{المعرّف: النص} مرة واحدة لكل DataFrame، لاستخدامها في format_func=names.get بدل set_index لكل خيار.
+
+    label اسم عمود أو Series جاهزة (مثل df.full_name + " - " + df.class_name).
+    """
+    values = df[label] if isinstance(label, str) else label
+    return dict(zip(df[key].tolist(), values.tolist()))
+
+
+def _names(loader, label):
+    return lambda conn, *params: label_map(loader(conn, *params), label)
+
+
+def center_names(conn):
+    return lookup_cache.get(conn, "center_names", ["centers"], _names(
+        _query("SELECT id, name FROM centers ORDER BY name"), "name"))
+
+
+def subject_names(conn, center_id):
+    return lookup_cache.get(conn, "subject_names", ["subjects"], _names(
+        _query("SELECT id, name FROM subjects WHERE center_id=? ORDER BY name"), "name"), center_id)
+
+
+def teacher_names(conn, center_id):
+    return lookup_cache.get(conn, "teacher_names", ["users"], _names(
+        _query("SELECT id, full_name FROM users WHERE role='teacher' AND center_id=? ORDER BY full_name"), "full_name"), center_id)
+
+
+def search_students(conn, center_id, text="", class_name=None, offset=0, limit=STUDENT_PAGE):
+    """(صفحة من الطلاب المطابقين للبحث، العدد الكلي) — الفلترة والترقيم داخل SQLite."""
+    where = "WHERE center_id=?"; params = [center_id]
+    if class_name: where += " AND class_name=?"; params.append(class_name)
+    if text: where += " AND full_name LIKE ?"; params.append(f"%{text.strip()}%")
+    with closing(conn.cursor()) as cur:
+        cur.execute(f"SELECT COUNT(*) FROM students {where}", params)
+        total = cur.fetchone()[0]
+    df = pd.read_sql_query(
+        f"SELECT id, full_name, class_name FROM students {where} ORDER BY full_name, id LIMIT ? OFFSET ?",
+        conn, params=params + [int(limit), int(offset)])
+    return df, total
+
+
+__all__ = [
+    "VERSIONED_TABLES", "version_triggers", "data_version",
+    "LookupCache", "lookup_cache", "centers", "classes", "subjects", "teachers", "Roster", "roster",
+    "label_map", "center_names", "subject_names", "teacher_names", "STUDENT_PAGE", "search_students",
+]
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# db_pool.py — اتصالات SQLite: قارئ لكل خيط (WAL) + كاتب واحد مشترك خلف قفل + طابور التزام جماعي
+
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+PRAGMAS = {
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,        # مللي ثانية قبل "database is locked"
+    "synchronous": "NORMAL",     # آمن مع WAL ويوفّر fsync لكل commit
+    "cache_size": -16000,        # ~16MB لكل اتصال (القيمة السالبة بالكيلوبايت)
+    "mmap_size": 268435456,      # 256MB
+    "temp_store": "MEMORY",
+}
+
+
+class ConnectionPool:
+    """كل خيط (جلسة Streamlit) يقرأ عبر اتصاله الخاص، وكل الكتابات تمر عبر اتصال كاتب واحد.
+
+    اتصال القارئ يعود إلى الحوض تلقائيًا عند انتهاء الخيط الذي استعاره.
+    """
+
+    def __init__(self, path, max_idle=16, pragmas=None):
+        self.path = path
+        self.max_idle = max_idle
+        self.pragmas = dict(PRAGMAS, **(pragmas or {}))
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._local = threading.local()
+        self._writer = None
+        self._write_lock = threading.RLock()
+
+    def _connect(self, read_only):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+        except sqlite3.Error:
+            pass
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value};")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON;")
+        return conn
+
+    def _checkin(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._idle_lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def reader(self):
+        """اتصال قراءة فقط خاص بالخيط الحالي (يُعاد استخدامه طوال عمر الخيط)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._idle_lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect(read_only=True)
+            self._local.conn = conn
+            weakref.finalize(threading.current_thread(), self._checkin, conn)
+        return conn
+
+    @contextmanager
+    def writer(self, begin=True):
+        """الاتصال الكاتب الوحيد، محجوز للخيط الحالي حتى نهاية الكتلة.
+
+        begin=True يفتح BEGIN IMMEDIATE ثم commit عند النجاح أو rollback عند الخطأ؛
+        begin=False يترك إدارة المعاملات للمستدعي (الترحيلات والبذرة).
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            conn = self._writer
+            if conn.in_transaction:
+                # كتلة متداخلة: المعاملة الخارجية هي التي تُثبّت أو تتراجع
+                yield conn
+                return
+            if not begin:
+                try:
+                    yield conn
+                finally:
+                    # لا نترك معاملة نصف منتهية على الاتصال الكاتب المشترك
+                    if conn.in_transaction:
+                        conn.rollback()
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                if conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                # يشمل فشل commit نفسه (قيد مؤجَّل مثلًا): SQLite يُبقي المعاملة مفتوحة، ولو بقيت
+                # لعُدّت كل كتلة لاحقة متداخلة ولم يُثبَّت شيء بعدها
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+
+    def close(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+class WriteQueue:
+    """التزام جماعي: خيط كاتب واحد يجمع ما يصل خلال window ثانية (حتى max_batch عملية) في معاملة واحدة.
+
+    كل عملية fn(conn, *args) تعمل داخل SAVEPOINT خاص بها، ففشلها يُرجع تغييراتها وحدها ويصل استثناؤها
+    إلى مستدعيها، وبقية الدفعة تُثبَّت بـ commit واحد (fsync واحد بدل واحد لكل درجة).
+    """
+
+    def __init__(self, pool, window=0.005, max_batch=256, history=2000):
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._stats_lock = threading.Lock()
+        self._batches = deque(maxlen=history)    # (عدد العمليات، زمن المعاملة بالثواني)
+        self._latencies = deque(maxlen=history)  # من الإرسال حتى ظهور النتيجة
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """أضف عملية كتابة؛ يعيد Future بنتيجة fn أو باستثنائها بعد التزام دفعتها."""
+        fut = Future()
+        self._queue.put((fn, args, kwargs, fut, time.perf_counter()))
+        return fut
+
+    def run(self, fn, *args, timeout=30, **kwargs):
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is None
+            items = [b for b in batch if b is not None]
+            if items:
+                self._commit(items)
+            if stop:
+                return
+
+    def _commit(self, items):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            with self.pool.writer() as conn:
+                for fn, args, kwargs, fut, _ in items:
+                    if not fut.set_running_or_notify_cancel():
+                        outcomes.append(None)
+                        continue
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        outcomes.append((True, fn(conn, *args, **kwargs)))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO queued_write")
+                        outcomes.append((False, e))
+                    conn.execute("RELEASE queued_write")
+        except Exception as e:
+            # فشل الالتزام نفسه: لا شيء من الدفعة ثُبّت
+            for fn, args, kwargs, fut, _ in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        done = time.perf_counter()
+        with self._stats_lock:
+            self._batches.append((len(items), done - started))
+            self._latencies.extend(done - item[4] for item in items)
+        for item, outcome in zip(items, outcomes):
+            if outcome is not None:
+                ok, value = outcome
+                item[3].set_result(value) if ok else item[3].set_exception(value)
+
+    def stats(self):
+        """حجم الدفعات وزمن الانتظار في الطابور (آخر history عملية)."""
+        with self._stats_lock:
+            sizes = [n for n, _ in self._batches]
+            lat = sorted(self._latencies)
+        pct = lambda p: round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 2) if lat else None
+        return {
+            "الدفعات": len(sizes),
+            "العمليات": sum(sizes),
+            "متوسط حجم الدفعة": round(sum(sizes) / len(sizes), 2) if sizes else None,
+            "أكبر دفعة": max(sizes, default=None),
+            "الانتظار p50 (ms)": pct(0.5),
+            "الانتظار p95 (ms)": pct(0.95),
+            "في الطابور الآن": self._queue.qsize(),
+        }
+
+
+__all__ = ["PRAGMAS", "ConnectionPool", "WriteQueue"]
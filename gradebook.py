@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# gradebook.py — تخزين الدرجات المضغوط: اليوم رقم صحيح (أيام منذ 1970-01-01) والملاحظات في grade_notes
+#
+# الترحيل 13 يعيد بناء grades بهذا الشكل. العرض grades_wide يحفظ الشكل القديم (grade_date نصي وأعمدة
+# الملاحظات الأربعة) للقراءة والكتابة معًا عبر مشغّلات INSTEAD OF؛ المسارات الساخنة تقرأ grades مباشرة
+# وتقارن grade_day بأرقام فتبقى في الفهارس.
+
+import numpy as np
+
+EPOCH_JULIAN = 2440587.5  # julianday('1970-01-01')
+
+
+def day_sql(iso_expr):
+    """تعبير SQL: تاريخ ISO → رقم اليوم."""
+    return f"CAST(julianday({iso_expr}) - {EPOCH_JULIAN} AS INTEGER)"
+
+
+def iso_sql(day_expr):
+    """تعبير SQL: رقم اليوم → تاريخ ISO (للعرض فقط، لا للفلترة)."""
+    return f"date({day_expr} * 86400, 'unixepoch')"
+
+
+def valid_iso_sql(expr):
+    """شرط SQL: expr يبدأ بتاريخ YYYY-MM-DD صالح (julianday يقبل أيضًا أرقامًا مجردة فلا يكفي وحده)."""
+    return f"({expr} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' AND date({expr}) IS NOT NULL)"
+
+
+GRADE_DATE = iso_sql("g.grade_day")  # grade_date القديم في الاستعلامات التي تسمّي grades بـ g
+
+# ملاحظات الدرجة؛ note_teacher يُخزَّن NULL حين يساوي note (الحفظ يكتب الملاحظة نفسها في الاثنين)
+# و'' حين يخلو وحده، ويُقرأ '' عندئذ NULL كبقية الملاحظات الفارغة
+NOTE_FIELDS = ["note", "note_teacher", "note_parent", "note_admin"]
+NOTES_JOIN = "LEFT JOIN grade_notes n ON n.grade_id=g.id"
+NOTE_TEACHER = "CASE WHEN n.note_teacher IS NULL THEN n.note ELSE NULLIF(n.note_teacher, '') END"
+
+
+def day_numbers(dates):
+    """تواريخ ISO (أو date) → مصفوفة أرقام أيام int64؛ datetime64[D] يقبل السنة 1 بخلاف pandas."""
+    return np.asarray(list(map(str, dates)), dtype="datetime64[D]").astype("int64")
+
+
+def day_number(d):
+    return int(day_numbers([d])[0])
+
+
+__all__ = [
+    "day_sql", "iso_sql", "valid_iso_sql", "GRADE_DATE", "NOTE_FIELDS", "NOTES_JOIN", "NOTE_TEACHER", "day_numbers", "day_number",
+]
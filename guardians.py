@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# guardians.py — أولياء الأمور: ربط الأبناء، وسجل موحّد (درجات + ملاحظات ولي الأمر + حضور) لكل الأبناء باستعلام واحد
+
+import pandas as pd
+
+from attendance import STATUSES
+from gradebook import GRADE_DATE, day_number
+
+GUARDIAN_PAGE = 50
+
+# الأبناء أولًا (مفتاح guardian_student الأساسي)، ثم لكل ابن بحث في idx_grades_student و idx_attendance_student
+FEED_SQL = f"""
+    WITH kids AS (
+        SELECT s.id AS student_id, s.full_name, s.center_id
+        FROM guardian_student gs JOIN students s ON s.id=gs.student_id
+        WHERE gs.guardian_id=?
+    )
+    SELECT day AS "التاريخ", child AS "الطالب", kind, subject AS "المادة", score, max_score, status, remark AS "ملاحظة", id
+    FROM (
+        SELECT {GRADE_DATE} AS day, 'grade' AS kind, g.id, k.full_name AS child, sub.name AS subject,
+               g.score, g.max_score, NULL AS status, n.note_parent AS remark
+        FROM kids k
+        JOIN grades g ON g.student_id=k.student_id AND g.center_id=k.center_id
+        JOIN subjects sub ON sub.id=g.subject_id
+        LEFT JOIN grade_notes n ON n.grade_id=g.id
+        WHERE (g.grade_day, 'grade', g.id) < (?, ?, ?)
+        UNION ALL
+        SELECT a.att_date, 'attendance', a.id, k.full_name, sub.name,
+               NULL, NULL, a.status, a.note
+        FROM kids k
+        JOIN attendance a ON a.student_id=k.student_id AND a.center_id=k.center_id
+        JOIN subjects sub ON sub.id=a.subject_id
+        WHERE (a.att_date, 'attendance', a.id) < (?, ?, ?)
+    )
+    ORDER BY day DESC, kind DESC, id DESC
+    LIMIT ?
+"""
+
+KIND_LABELS = {"grade": "درجة", "attendance": "حضور"}
+
+_END = ("9999-12-31", "~", 0)  # مؤشر "قبل البداية": أكبر من أي (تاريخ، نوع، رقم)
+
+
+def children(conn, guardian_id):
+    return pd.read_sql_query(
+        """
+        SELECT s.id, s.full_name, s.class_name, s.center_id
+        FROM guardian_student gs JOIN students s ON s.id=gs.student_id
+        WHERE gs.guardian_id=? ORDER BY s.full_name
+        """,
+        conn, params=[int(guardian_id)],
+    )
+
+
+def guardian_feed(conn, guardian_id, after=None, limit=GUARDIAN_PAGE):
+    """صفحة من سجل كل الأبناء بترتيب الأحدث أولًا. after=(التاريخ، النوع، الرقم) لآخر صف في الصفحة السابقة.
+
+    الصفحة كلها استعلام واحد؛ kind و id يبقيان في الجدول كمؤشر للصفحة التالية (تُخفى في الواجهة).
+    """
+    day, kind, rid = after or _END
+    df = pd.read_sql_query(
+        FEED_SQL, conn,
+        params=[int(guardian_id), day_number(day), kind, int(rid), day, kind, int(rid), int(limit)],
+    )
+    result = df["status"].map(STATUSES).fillna(df["status"])
+    graded = df["score"].notna()
+    score = df["score"].map("{:g}".format, na_action="ignore")
+    out_of = df["max_score"].map(" / {:g}".format, na_action="ignore").fillna("")
+    df.insert(4, "النتيجة", result.where(~graded, score + out_of))
+    df.insert(2, "النوع", df["kind"].map(KIND_LABELS))
+    return df.drop(columns=["score", "max_score", "status"])
+
+
+def link_children(conn, guardian_id, student_ids):
+    """اربط أبناء بولي أمر داخل معاملة المستدعي (db_write)؛ الربط الموجود يُتجاهل."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO guardian_student(guardian_id, student_id) VALUES (?,?)",
+        [(int(guardian_id), int(s)) for s in student_ids],
+    )
+
+
+def unlink_children(conn, links):
+    """links: أزواج (guardian_id, student_id)."""
+    conn.executemany(
+        "DELETE FROM guardian_student WHERE guardian_id=? AND student_id=?",
+        [(int(g), int(s)) for g, s in links],
+    )
+
+
+def center_guardians(conn, center_id):
+    """أولياء أمور المركز: من أنشأهم المركز أو لهم ابن فيه."""
+    return pd.read_sql_query(
+        """
+        SELECT id, full_name, email FROM guardian_accounts WHERE center_id=?
+        UNION
+        SELECT ga.id, ga.full_name, ga.email
+        FROM guardian_accounts ga JOIN guardian_student gs ON gs.guardian_id=ga.id
+        JOIN students s ON s.id=gs.student_id AND s.center_id=?
+        ORDER BY full_name
+        """,
+        conn, params=[center_id, center_id],
+    )
+
+
+def center_links(conn, center_id):
+    return pd.read_sql_query(
+        """
+        SELECT gs.guardian_id, gs.student_id, ga.full_name AS "ولي الأمر", ga.email AS "البريد",
+               s.full_name AS "الطالب", s.class_name AS "الصف"
+        FROM guardian_student gs JOIN guardian_accounts ga ON ga.id=gs.guardian_id
+        JOIN students s ON s.id=gs.student_id
+        WHERE s.center_id=? ORDER BY ga.full_name, s.full_name
+        """,
+        conn, params=[center_id],
+    )
+
+
+__all__ = [
+    "GUARDIAN_PAGE", "children", "guardian_feed", "link_children", "unlink_children",
+    "center_guardians", "center_links",
+]
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# importer.py — استيراد الطلاب/المعلمين/التعيينات/الحصص من CSV أو Excel: تحقق متجه، معاينة، ثم إدخال بالجملة
+
+import io
+from collections import namedtuple
+
+import pandas as pd
+
+from accounts import default_password_hash, provision_student_accounts
+from schedule import DAY_CODES, find_conflicts, load_lessons
+
+try:
+    from darien_seed import NOISE
+except Exception:
+    NOISE = set()
+
+ImportPlan = namedtuple("ImportPlan", ["rows", "rejected"])
+
+# رؤوس الأعمدة المقبولة (عربي/إنجليزي) → الاسم الداخلي
+ALIASES = {
+    "full_name": "full_name", "name": "full_name", "الاسم": "full_name", "الاسم الكامل": "full_name",
+    "class_name": "class_name", "class": "class_name", "الصف": "class_name",
+    "email": "email", "البريد": "email", "البريد الإلكتروني": "email", "الإيميل": "email",
+    "subjects": "subjects", "المواد": "subjects",
+    "student": "student", "الطالب": "student",
+    "subject": "subject", "المادة": "subject",
+    "teacher": "teacher", "المعلم": "teacher", "teacher_email": "teacher",
+    "day": "day", "اليوم": "day",
+    "start": "start_time", "start_time": "start_time", "من": "start_time",
+    "end": "end_time", "end_time": "end_time", "إلى": "end_time",
+    "room": "room", "القاعة": "room",
+}
+
+REQUIRED = {
+    "students": ["full_name", "class_name"],
+    "teachers": ["full_name", "email"],
+    "enrollments": ["student", "class_name", "subject", "teacher"],
+    "lessons": ["class_name", "subject", "teacher", "day", "start_time", "end_time"],
+}
+
+
+def read_table(name, data):
+    """اقرأ الملف المرفوع كنصوص (بدون تحويل الأنواع) إلى DataFrame بأسماء أعمدة موحّدة."""
+    buf = io.BytesIO(data)
+    if name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(buf, dtype=str)
+    else:
+        df = pd.read_csv(buf, dtype=str, encoding="utf-8-sig")
+    df.columns = [ALIASES.get(str(c).strip().lower(), ALIASES.get(str(c).strip(), str(c).strip())) for c in df.columns]
+    return df
+
+
+def _clean(s):
+    """نفس تنظيف البذرة: قص المسافات، دمج المسافات المزدوجة، وإسقاط كلمات الضجيج."""
+    s = s.fillna("").astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    return s.mask(s.isin(NOISE) | (s == ""))
+
+
+def _reject(rejected, df, mask, reason):
+    if mask.any():
+        rejected.append(df[mask].assign(السبب=reason))
+    return df[~mask]
+
+
+def _lookup(conn, q, params):
+    return pd.read_sql_query(q, conn, params=params)
+
+
+def _normalize_teacher(s):
+    return s.where(~s.str.contains("@", regex=False), s.str.lower())
+
+
+def _teacher_keys(conn, center_id):
+    """معلّمو المركز بمفتاح "teacher" = البريد أو الاسم (الأسماء المكررة تُستبعد لالتباسها)."""
+    teach = _lookup(conn, "SELECT id AS teacher_id, lower(email) AS email, full_name FROM users WHERE role='teacher' AND center_id=?", [center_id])
+    by_email = teach[["teacher_id", "email"]].rename(columns={"email": "teacher"})
+    by_name = teach[~teach["full_name"].duplicated(keep=False)][["teacher_id", "full_name"]].rename(columns={"full_name": "teacher"})
+    return pd.concat([by_email, by_name]).drop_duplicates("teacher")
+
+
+def _hhmm(s):
+    """"8:5" لا يُقبل؛ "8:05" → "08:05". غير الصالح → NaN."""
+    parts = s.str.extract(r"^(\d{1,2}):(\d{2})(?::\d{2})?$").astype("float64")
+    ok = (parts[0] < 24) & (parts[1] < 60)
+    out = parts[0].map("{:02.0f}".format) + ":" + parts[1].map("{:02.0f}".format)
+    return out.where(ok)
+
+
+def _plan_lessons(conn, df, center_id, rejected):
+    """الحصص: تحويل الأسماء إلى معرّفات، ثم رفض كل حصة تتداخل مع حصة مسجلة أو مع سطر آخر في الملف."""
+    df["teacher"] = _normalize_teacher(df["teacher"])
+    day = df["day"].map(DAY_CODES)
+    numeric = pd.to_numeric(df["day"], errors="coerce")
+    df["day_of_week"] = day.fillna(numeric.where(numeric.between(0, 6) & numeric.eq(numeric.round())))
+    df["start_time"], df["end_time"] = _hhmm(df["start_time"]), _hhmm(df["end_time"])
+    if "room" not in df.columns:
+        df["room"] = None
+    subs = _lookup(conn, "SELECT id AS subject_id, name AS subject FROM subjects WHERE center_id=?", [center_id])
+    merged = (df.reset_index()
+              .merge(subs, how="left", on="subject")
+              .merge(_teacher_keys(conn, center_id), how="left", on="teacher")
+              .set_index("index"))
+    merged = _reject(rejected, merged, merged["subject_id"].isna(), "مادة غير معروفة")
+    merged = _reject(rejected, merged, merged["teacher_id"].isna(), "معلّم غير معروف")
+    merged = _reject(rejected, merged, merged["day_of_week"].isna(), "يوم غير صالح")
+    merged = _reject(rejected, merged, merged[["start_time", "end_time"]].isna().any(axis=1), "وقت غير صالح (HH:MM)")
+    merged = _reject(rejected, merged, merged["start_time"] >= merged["end_time"], "البداية بعد النهاية")
+
+    cols = ["class_name", "subject_id", "teacher_id", "day_of_week", "start_time", "end_time", "room"]
+    merged = merged.astype({"subject_id": "int64", "teacher_id": "int64", "day_of_week": "int64"})
+    existing = load_lessons(conn, center_id)
+    # مفاتيح سالبة للحصص المسجلة حتى لا تختلط بأرقام أسطر الملف
+    both = pd.concat([merged[cols].assign(key=merged.index), existing[cols].assign(key=-existing["id"])], ignore_index=True)
+    clashes = find_conflicts(both)
+    clashes = clashes[clashes["key"] >= 0].drop_duplicates("key").set_index("key")
+    if not clashes.empty:
+        other = clashes["يتعارض مع"].astype("int64")
+        why = "تعارض: " + clashes["السبب"] + other.map(lambda k: f" (الحصة المسجلة #{-k})" if k < 0 else f" (السطر {k + 2})")
+        mask = merged.index.isin(clashes.index)
+        rejected.append(merged[mask].assign(السبب=why.reindex(merged.index[mask]).to_numpy()))
+        merged = merged[~mask]
+    return merged[cols]
+
+
+def plan_import(conn, kind, df, center_id):
+    """تحقّق متجه بالكامل (بلا حلقات صفوف). يعيد الصفوف الصالحة للإدخال والمرفوضة مع السبب."""
+    missing = [c for c in REQUIRED[kind] if c not in df.columns]
+    if missing:
+        raise ValueError("أعمدة ناقصة: " + "، ".join(missing))
+    df = df.copy()
+    for c in REQUIRED[kind] + [c for c in ("subjects", "room") if c in df.columns]:
+        df[c] = _clean(df[c])
+    rejected = []
+    df = _reject(rejected, df, df[REQUIRED[kind]].isna().any(axis=1), "حقل مطلوب فارغ أو كلمة ضجيج")
+
+    if kind == "students":
+        df = _reject(rejected, df, df.duplicated(["full_name", "class_name"]), "مكرر داخل الملف")
+        existing = _lookup(conn, "SELECT full_name, class_name FROM students WHERE center_id=?", [center_id])
+        exists = df.merge(existing.drop_duplicates(), how="left", indicator=True)["_merge"].eq("both").to_numpy()
+        df = _reject(rejected, df, pd.Series(exists, index=df.index), "موجود مسبقًا")
+        rows = df[["full_name", "class_name"]]
+
+    elif kind == "teachers":
+        df["email"] = df["email"].str.lower()
+        df = _reject(rejected, df, ~df["email"].str.contains("@", regex=False), "بريد غير صالح")
+        df = _reject(rejected, df, df.duplicated("email"), "بريد مكرر داخل الملف")
+        taken = _lookup(conn, "SELECT lower(email) AS email FROM users", [])["email"]
+        df = _reject(rejected, df, df["email"].isin(taken), "البريد مستخدم بالفعل")
+        if "subjects" in df.columns:
+            known = set(_lookup(conn, "SELECT name FROM subjects WHERE center_id=?", [center_id])["name"])
+            listed = df["subjects"].fillna("").str.split(r"\s*[,،]\s*", regex=True).explode()
+            unknown = listed[listed.ne("") & ~listed.isin(known)]
+            df = _reject(rejected, df, df.index.isin(unknown.index), "مادة غير معروفة")
+        rows = df[["full_name", "email"]]
+
+    elif kind == "lessons":
+        rows = _plan_lessons(conn, df, center_id, rejected)
+
+    else:  # enrollments
+        df = _reject(rejected, df, df.duplicated(["student", "class_name", "subject"]), "مكرر داخل الملف")
+        studs = _lookup(conn, "SELECT id AS student_id, full_name AS student, class_name FROM students WHERE center_id=?", [center_id])
+        studs = studs[~studs.duplicated(["student", "class_name"], keep=False)]  # الأسماء الملتبسة تُرفض
+        subs = _lookup(conn, "SELECT id AS subject_id, name AS subject FROM subjects WHERE center_id=?", [center_id])
+        df["teacher"] = _normalize_teacher(df["teacher"])
+        merged = (df.reset_index()
+                  .merge(studs, how="left", on=["student", "class_name"])
+                  .merge(subs, how="left", on="subject")
+                  .merge(_teacher_keys(conn, center_id), how="left", on="teacher")
+                  .set_index("index"))
+        merged = _reject(rejected, merged, merged["student_id"].isna(), "طالب غير موجود في هذا الصف")
+        merged = _reject(rejected, merged, merged["subject_id"].isna(), "مادة غير معروفة")
+        merged = _reject(rejected, merged, merged["teacher_id"].isna(), "معلّم غير معروف")
+        rows = merged[["student_id", "subject_id", "teacher_id"]].astype("int64")
+
+    rejected = pd.concat(rejected) if rejected else pd.DataFrame(columns=list(df.columns) + ["السبب"])
+    return ImportPlan(rows, rejected)
+
+
+def commit_import(conn, kind, plan, center_id, password):
+    """أدخل الصفوف الصالحة بـ executemany واحدة داخل معاملة المستدعي (db_write). يعيد عدد الصفوف."""
+    if plan.rows.empty:
+        return 0
+    values = plan.rows.astype(object).values.tolist()
+    if kind == "students":
+        conn.executemany(
+            "INSERT INTO students(full_name, class_name, center_id) VALUES (?,?,?)",
+            [r + [center_id] for r in values],
+        )
+        provision_student_accounts(conn, password, center_id)
+    elif kind == "teachers":
+        pw_hash = default_password_hash(password)
+        conn.executemany(
+            "INSERT INTO users(full_name, email, role, password_hash, center_id) VALUES (?,?,'teacher',?,?)",
+            [r + [pw_hash, center_id] for r in values],
+        )
+    elif kind == "lessons":
+        conn.executemany(
+            """
+            INSERT INTO lessons(class_name, subject_id, teacher_id, day_of_week, start_time, end_time, room, center_id)
+            VALUES (?,?,?,?,?,?,?,?)
+            """,
+            [r + [center_id] for r in plan.rows.astype(object).where(plan.rows.notna(), None).values.tolist()],
+        )
+    else:
+        conn.executemany(
+            """
+            INSERT INTO enrollments(student_id, subject_id, teacher_id, center_id) VALUES (?,?,?,?)
+            ON CONFLICT(student_id, subject_id, center_id) DO UPDATE SET teacher_id=excluded.teacher_id
+            """,
+            [r + [center_id] for r in values],
+        )
+    return len(values)
+
+
+__all__ = ["ImportPlan", "ALIASES", "REQUIRED", "read_table", "plan_import", "commit_import"]
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# labels.py — التقييم النوعي متجهًا لدفعات كاملة (صف، فترة، مركز) مع ذاكرة لإحصاءات (الصف، المادة، اليوم)
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from daily_stats import group_stats
+from datacache import data_version
+from schemes import center_schemes, resolve_schemes
+
+QUAL_LABELS = ["متفوق", "مرتفع", "متوسط", "منخفض"]
+ABSOLUTE_CUTS = (90.0, 75.0, 50.0)  # عند غياب المخطط وإحصاءات الصف
+
+GRADE_COLUMNS = {
+    "class_name": "class_name", "subject_id": "subject_id", "grade_date": "grade_date",
+    "score": "score", "min_score": "min_score", "max_score": "max_score",
+}
+
+
+class StatsCache:
+    """(center_id, الصف، المادة، اليوم) → (العدد، المتوسط، الانحراف) بحجم محدود (LRU).
+
+    كل مدخل محفوظ مع إصدار grades + students وقت قراءته (كما في LookupCache)، فأي كتابة — حذف طالب
+    بالتتابع، نقله لصف آخر، أو حفظ من عملية أخرى — تُبطله دون استدعاء invalidate_stats.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        with self._lock:
+            for k in keys:
+                entry = self._data.get(k)
+                if entry is not None and entry[0] == version:
+                    self._data.move_to_end(k)
+                    found[k] = entry[1]
+                else:
+                    missing.append(k)
+        return found, missing
+
+    def put_many(self, items, version=None):
+        with self._lock:
+            for k, v in items.items():
+                self._data[k] = (version, v)
+                self._data.move_to_end(k)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, center_id=None, keys=None):
+        with self._lock:
+            if keys is not None:
+                for k in keys:
+                    self._data.pop((center_id,) + tuple(k), None)
+            elif center_id is None:
+                self._data.clear()
+            else:
+                for k in [k for k in self._data if k[0] == center_id]:
+                    del self._data[k]
+
+
+_stats_cache = StatsCache()
+
+
+def invalidate_stats(center_id=None, keys=None):
+    """إفراغ اختياري للذاكرة (الصحة لا تعتمد عليه). keys: أزواج (الصف، المادة، اليوم)؛ بدونها يُمسح المركز كله."""
+    _stats_cache.invalidate(center_id, keys)
+
+
+def _label(x, bounds):
+    """x وحدود الأقسام الثلاثة (مصفوفات بطول x) → تسمية لكل صف في خطوة واحدة."""
+    return np.select([x >= b for b in bounds], QUAL_LABELS[:3], QUAL_LABELS[3])
+
+
+def qualitative_labels(scores, min_score=None, max_score=None, cuts=None):
+    """تسميات دفعة درجات لمجموعة واحدة (صف/مادة/يوم) — بحدود المخطط إن وُجدت وإلا بمتوسط المجموعة وانحرافها."""
+    scores = pd.Series(scores, dtype="float64")
+    if cuts is not None and all(pd.notna(c) for c in cuts) and max_score is not None and max_score > min_score:
+        x = (scores - min_score) / (max_score - min_score) * 100.0
+        bounds = [float(c) for c in cuts]
+    else:
+        x = scores
+        avg, std = scores.mean(), scores.std(ddof=0)
+        bounds = [avg + std, avg, avg - std] if len(scores) > 1 and std > 0 else list(ABSOLUTE_CUTS)
+    return pd.Series(_label(x, bounds), index=scores.index).where(scores.notna())
+
+
+def class_stats(conn, center_id, keys):
+    """إحصاءات (الصف، المادة، اليوم) للمفاتيح المطلوبة: من الذاكرة، والناقص من جدول grade_daily_stats."""
+    center_id = int(center_id)
+    keys = [(str(c), int(s), str(d)) for c, s, d in keys]
+    version = data_version(conn, "grades", "students")
+    found, missing = _stats_cache.get_many([(center_id,) + k for k in keys], version)
+    fresh = {}
+    for k in missing:
+        fresh[k] = (0, None, None)
+    # صفوف grade_daily_stats لكل (المادة، اليوم) الناقصة؛ نخزّن كل الصفوف الدراسية المُعادة لا المطلوب وحده
+    for c, s, d, n, total, total_sq in group_stats(conn, center_id, {k[2:] for k in missing}):
+        avg = total / n
+        var = max(total_sq / n - avg * avg, 0.0)
+        fresh[(center_id, c, s, d)] = (n, avg, var ** 0.5 if var > 1e-9 else 0.0)
+    _stats_cache.put_many(fresh, version)
+    found.update((k, fresh[k]) for k in missing)
+    out = pd.DataFrame(
+        [(k[1], k[2], k[3]) + v for k, v in found.items()],
+        columns=["class_name", "subject_id", "grade_date", "n", "avg", "std"],
+    )
+    return out.astype({"class_name": object, "subject_id": "int64", "grade_date": object, "n": "int64", "avg": "float64", "std": "float64"})
+
+
+def label_grades(conn, center_id, df, columns=None):
+    """تسمية كل صفوف df (قد تمتد على صفوف ومواد وأيام مختلفة) دفعة واحدة.
+
+    columns يربط الأسماء الداخلية في GRADE_COLUMNS بأعمدة df (مثل "الصف" بدل class_name).
+    يعيد Series بنفس فهرس df.
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    cols = dict(GRADE_COLUMNS, **(columns or {}))
+    g = pd.DataFrame({k: df[v].to_numpy() if v in df.columns else np.nan for k, v in cols.items()})
+    g["subject_id"] = g["subject_id"].astype("int64")
+    # أعمدة None بالكامل (صفحات تقارير بلا min/max) تصل object؛ float قبل fillna
+    g = g.astype({"score": "float64", "min_score": "float64", "max_score": "float64"})
+
+    # المخطط الساري يوم كل درجة من الخريطة المخزّنة (الخاص بالمادة قبل العام للصف)
+    sch = resolve_schemes(center_schemes(conn, center_id), g)
+    cut_cols = ["excellent_cut", "high_cut", "average_cut"]
+
+    mn = g["min_score"].fillna(sch["min_score"]).fillna(0.0)
+    mx = g["max_score"].fillna(sch["max_score"]).fillna(100.0)
+    use_cuts = (sch[cut_cols].notna().all(axis=1) & (mx > mn)).to_numpy()
+
+    keys = g.loc[~use_cuts, ["class_name", "subject_id", "grade_date"]].drop_duplicates()
+    stats = class_stats(conn, center_id, keys.itertuples(index=False, name=None))
+    g = g.merge(stats, how="left", on=["class_name", "subject_id", "grade_date"])
+    use_stats = ~use_cuts & (g["n"] > 1).to_numpy() & (g["std"] > 0).to_numpy()
+
+    pct = ((g["score"] - mn) / (mx - mn).where(mx > mn) * 100.0).to_numpy()
+    score = g["score"].to_numpy()
+    x = np.where(use_cuts, pct, score)
+    bounds = [
+        np.where(use_cuts, sch[cut].to_numpy(dtype="float64"), np.where(use_stats, g["avg"] + k * g["std"], a))
+        for cut, k, a in zip(cut_cols, (1, 0, -1), ABSOLUTE_CUTS)
+    ]
+    return pd.Series(_label(x, bounds), index=df.index).where(pd.notna(score))
+
+
+__all__ = [
+    "QUAL_LABELS", "StatsCache", "invalidate_stats", "qualitative_labels",
+    "class_stats", "label_grades",
+]
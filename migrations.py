@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+# migrations.py — ترحيلات مخطط قاعدة البيانات بأرقام إصدارات (تُنفَّذ مرة واحدة لكل إصدار)
+
+from contextlib import closing
+
+from daily_stats import rebuild_daily_stats
+from datacache import version_triggers
+from gradebook import NOTE_TEACHER, day_sql, iso_sql, valid_iso_sql
+
+# كل ترحيل: (رقم الإصدار، وصف، دالة تستقبل cursor). لا تُعدَّل الترحيلات المنشورة؛ أضف إصدارًا جديدًا.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def has_column(cur, table, col):
+    cur.execute("PRAGMA table_info(%s)" % table)
+    return any(r[1] == col for r in cur.fetchall())
+
+
+def _run_all(cur, statements):
+    for sql in statements:
+        cur.execute(sql)
+
+
+TABLES_TO_CENTER = [
+    "users", "students", "subjects", "enrollments", "grades", "attendance", "student_accounts"
+]
+
+
+@migration(1, "المخطط الأساسي: تعدد المراكز، الحصص، مخطط الدرجات، min/max، المالكون")
+def _m001_baseline(cur):
+    # آمن على قواعد بيانات أُنشئت قبل ترقيم الإصدارات: كل خطوة مشروطة بعدم وجودها.
+    _run_all(cur, [
+        """
+        CREATE TABLE IF NOT EXISTS owners (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL DEFAULT 'مالك التطبيق',
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS centers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            address TEXT,
+            phone TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin','teacher')),
+            password_hash TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            class_name TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS enrollments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+            teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS grades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+            teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            grade_date TEXT NOT NULL,
+            score REAL NOT NULL,
+            note TEXT,
+            note_teacher TEXT,
+            note_parent TEXT,
+            note_admin TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+            teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            att_date TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('present','absent_excused','absent_unexcused')),
+            note TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS student_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS guardian_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS guardian_student (
+            guardian_id INTEGER NOT NULL REFERENCES guardian_accounts(id) ON DELETE CASCADE,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            PRIMARY KEY (guardian_id, student_id)
+        )
+        """,
+    ])
+
+    # إضافة center_id للجداول إن لم يوجد
+    for t in TABLES_TO_CENTER:
+        if not has_column(cur, t, "center_id"):
+            cur.execute(f"ALTER TABLE {t} ADD COLUMN center_id INTEGER DEFAULT 1")
+
+    # min/max للدرجات
+    if not has_column(cur, "grades", "min_score"):
+        cur.execute("ALTER TABLE grades ADD COLUMN min_score REAL")
+    if not has_column(cur, "grades", "max_score"):
+        cur.execute("ALTER TABLE grades ADD COLUMN max_score REAL")
+
+    _run_all(cur, [
+        # جداول الحصص
+        """
+        CREATE TABLE IF NOT EXISTS lessons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            center_id INTEGER NOT NULL,
+            class_name TEXT NOT NULL,
+            subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+            teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            day_of_week INTEGER NOT NULL,  -- 0=Mon .. 6=Sun
+            start_time TEXT NOT NULL,
+            end_time   TEXT NOT NULL
+        )
+        """,
+        # مخطط الدرجات
+        """
+        CREATE TABLE IF NOT EXISTS grading_scheme (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            center_id INTEGER NOT NULL,
+            class_name TEXT NOT NULL,
+            subject_id INTEGER,
+            min_score REAL NOT NULL DEFAULT 0,
+            max_score REAL NOT NULL DEFAULT 100,
+            excellent_cut REAL,
+            high_cut REAL,
+            average_cut REAL
+        )
+        """,
+        # فهارس
+        "CREATE INDEX IF NOT EXISTS idx_users_center ON users(center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_students_center ON students(center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_subjects_center ON subjects(center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_enroll_center ON enrollments(center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_grades_center ON grades(center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_lessons_center ON lessons(center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_scheme_center ON grading_scheme(center_id)",
+    ])
+
+    # مركز افتراضي + إسناد center_id=1
+    cur.execute("SELECT COUNT(*) FROM centers")
+    if cur.fetchone()[0] == 0:
+        cur.execute("INSERT INTO centers(name) VALUES ('مركز دارين التعليمي')")
+    for t in TABLES_TO_CENTER:
+        cur.execute(f"UPDATE {t} SET center_id=1 WHERE center_id IS NULL")
+
+
+@migration(2, "فهرس student_accounts(student_id) لتجهيز الحسابات بالجملة")
+def _m002_student_accounts_index(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_accounts_student ON student_accounts(student_id)")
+
+
+@migration(3, "فهارس مركّبة لاستعلامات الدرجات والتعيينات + UNIQUE على التعيين")
+def _m003_composite_indexes(cur):
+    # التعيين المكرر (نفس الطالب/المادة/المركز) يُبقي أقدم صف قبل فرض UNIQUE
+    cur.execute(
+        """
+        DELETE FROM enrollments WHERE id NOT IN (
+            SELECT MIN(id) FROM enrollments GROUP BY student_id, subject_id, center_id
+        )
+        """
+    )
+    _run_all(cur, [
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_enroll_student_subject ON enrollments(student_id, subject_id, center_id)",
+        # صفوف/طلاب/مواد المعلّم في لوحة المعلّم
+        "CREATE INDEX IF NOT EXISTS idx_enroll_teacher ON enrollments(teacher_id, center_id, student_id, subject_id)",
+        "CREATE INDEX IF NOT EXISTS idx_students_center_class ON students(center_id, class_name, full_name)",
+        # "درجاتي الأخيرة": ORDER BY grade_date DESC, id DESC من الفهرس مباشرة (id هو rowid)
+        "CREATE INDEX IF NOT EXISTS idx_grades_teacher ON grades(teacher_id, center_id, grade_date)",
+        # بوابة الطالب
+        "CREATE INDEX IF NOT EXISTS idx_grades_student ON grades(student_id, center_id, grade_date)",
+        # التقارير (نطاق تاريخ داخل مركز)
+        "CREATE INDEX IF NOT EXISTS idx_grades_center_date ON grades(center_id, grade_date)",
+        # لوحة المجتهدين والتقييم النوعي: صف/مادة/تاريخ
+        "CREATE INDEX IF NOT EXISTS idx_grades_subject_date ON grades(center_id, subject_id, grade_date, student_id, score)",
+        # idx_grades_center صار بادئة لـ idx_grades_center_date
+        "DROP INDEX IF EXISTS idx_grades_center",
+    ])
+    cur.execute("ANALYZE")
+
+
+@migration(4, "جدول grade_daily_stats المجمّع + مشغّلات تحدّثه مع كل تغيير في الدرجات")
+def _m004_grade_daily_stats(cur):
+    # تجميع مجموعة واحدة (مركز، مادة، يوم، صف) من الخام؛ تُستعمل في المشغّلات بعد حذف الصف القديم
+    refresh = """
+        DELETE FROM grade_daily_stats
+        WHERE center_id={c} AND subject_id={s} AND grade_date={d} AND class_name {cls};
+        INSERT INTO grade_daily_stats(center_id, class_name, subject_id, grade_date, n, total, total_sq, min_score, max_score)
+        SELECT g.center_id, st.class_name, g.subject_id, g.grade_date,
+               COUNT(*), SUM(g.score), SUM(g.score * g.score), MIN(g.score), MAX(g.score)
+        FROM grades g JOIN students st ON st.id=g.student_id
+        WHERE g.center_id={c} AND g.subject_id={s} AND g.grade_date={d} AND st.class_name {cls}
+        GROUP BY st.class_name;
+    """
+    old = refresh.format(c="OLD.center_id", s="OLD.subject_id", d="OLD.grade_date",
+                         cls="= (SELECT class_name FROM students WHERE id=OLD.student_id)")
+    new = refresh.format(c="NEW.center_id", s="NEW.subject_id", d="NEW.grade_date",
+                         cls="= (SELECT class_name FROM students WHERE id=NEW.student_id)")
+    # عند الحذف قد يكون الطالب نفسه محذوفًا (CASCADE)، فنعيد تجميع كل صفوف (المادة، اليوم)
+    old_all = refresh.format(c="OLD.center_id", s="OLD.subject_id", d="OLD.grade_date", cls="IS NOT NULL")
+    _run_all(cur, [
+        """
+        CREATE TABLE IF NOT EXISTS grade_daily_stats (
+            center_id INTEGER NOT NULL,
+            class_name TEXT NOT NULL,
+            subject_id INTEGER NOT NULL,
+            grade_date TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            total_sq REAL NOT NULL,
+            min_score REAL NOT NULL,
+            max_score REAL NOT NULL,
+            PRIMARY KEY (center_id, subject_id, grade_date, class_name)
+        ) WITHOUT ROWID
+        """,
+        # لوحات المؤشرات: نطاق تاريخ داخل مركز
+        "CREATE INDEX IF NOT EXISTS idx_daily_stats_date ON grade_daily_stats(center_id, grade_date)",
+        # الإدخال (المسار الشائع) تحديث تراكمي بلا قراءة للخام
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_grades_stats_insert AFTER INSERT ON grades
+        BEGIN
+            INSERT INTO grade_daily_stats(center_id, class_name, subject_id, grade_date, n, total, total_sq, min_score, max_score)
+            SELECT NEW.center_id, st.class_name, NEW.subject_id, NEW.grade_date, 1, NEW.score, NEW.score * NEW.score, NEW.score, NEW.score
+            FROM students st WHERE st.id=NEW.student_id
+            ON CONFLICT(center_id, subject_id, grade_date, class_name) DO UPDATE SET
+                n = n + 1, total = total + excluded.total, total_sq = total_sq + excluded.total_sq,
+                min_score = min(min_score, excluded.min_score), max_score = max(max_score, excluded.max_score);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_grades_stats_update
+        AFTER UPDATE OF center_id, student_id, subject_id, grade_date, score ON grades
+        BEGIN {old} {new} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_grades_stats_delete AFTER DELETE ON grades
+        BEGIN {old_all} END
+        """,
+        # نقل طالب إلى صف آخر ينقل درجاته بين المجموعات
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_students_stats_class AFTER UPDATE OF class_name ON students
+        WHEN OLD.class_name IS NOT NEW.class_name
+        BEGIN
+            DELETE FROM grade_daily_stats
+            WHERE class_name IN (OLD.class_name, NEW.class_name)
+              AND (center_id, subject_id, grade_date) IN (SELECT center_id, subject_id, grade_date FROM grades WHERE student_id=NEW.id);
+            INSERT INTO grade_daily_stats(center_id, class_name, subject_id, grade_date, n, total, total_sq, min_score, max_score)
+            SELECT g.center_id, st.class_name, g.subject_id, g.grade_date,
+                   COUNT(*), SUM(g.score), SUM(g.score * g.score), MIN(g.score), MAX(g.score)
+            FROM grades g JOIN students st ON st.id=g.student_id
+            WHERE st.class_name IN (OLD.class_name, NEW.class_name)
+              AND (g.center_id, g.subject_id, g.grade_date) IN (SELECT center_id, subject_id, grade_date FROM grades WHERE student_id=NEW.id)
+            GROUP BY g.center_id, st.class_name, g.subject_id, g.grade_date;
+        END
+        """,
+    ])
+    rebuild_daily_stats(cur)
+
+
+@migration(5, "عدّادات إصدار البيانات للدرجات والحضور (مفتاح ذاكرة لوحة التحليلات)")
+def _m005_data_versions(cur):
+    _run_all(cur, [
+        "CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+        "INSERT OR IGNORE INTO data_versions(name) VALUES ('grades'), ('attendance')",
+        *version_triggers("grades"),
+        *version_triggers("attendance"),
+    ])
+
+
+@migration(6, "عدّادات إصدار للمراكز والطلاب والمواد والمستخدمين (ذاكرة القوائم المرجعية)")
+def _m006_lookup_versions(cur):
+    tables = ["centers", "students", "subjects", "users"]
+    cur.execute("INSERT OR IGNORE INTO data_versions(name) VALUES " + ",".join("(?)" for _ in tables), tables)
+    _run_all(cur, [sql for t in tables for sql in version_triggers(t)])
+
+
+@migration(7, "مفتاح فريد للحضور (طالب/مادة/يوم) لرصد الصف بـ upsert + فهرس (center_id, att_date, subject_id)")
+def _m007_attendance_keys(cur):
+    # السجل المكرر لنفس الطالب/المادة/اليوم: يبقى الأحدث
+    cur.execute(
+        """
+        DELETE FROM attendance WHERE id NOT IN (
+            SELECT MAX(id) FROM attendance GROUP BY student_id, subject_id, att_date, center_id
+        )
+        """
+    )
+    _run_all(cur, [
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_student_day ON attendance(student_id, subject_id, att_date, center_id)",
+        "CREATE INDEX IF NOT EXISTS idx_attendance_center_date ON attendance(center_id, att_date, subject_id)",
+    ])
+
+
+@migration(8, "عمود القاعة للحصص + فهرس (center_id, day_of_week, start_time, end_time) لكشف التعارض")
+def _m008_lesson_rooms(cur):
+    if not has_column(cur, "lessons", "room"):
+        cur.execute("ALTER TABLE lessons ADD COLUMN room TEXT")
+    _run_all(cur, [
+        "CREATE INDEX IF NOT EXISTS idx_lessons_center_day ON lessons(center_id, day_of_week, start_time, end_time)",
+        # الفهرس الجديد يبدأ بـ center_id فيغني عن القديم
+        "DROP INDEX IF EXISTS idx_lessons_center",
+    ])
+
+
+@migration(9, "جدول sessions لرموز الدخول الدائمة + app_settings لمفتاح توقيعها")
+def _m009_sessions(cur):
+    _run_all(cur, [
+        """
+        CREATE TABLE IF NOT EXISTS app_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO app_settings(key, value) VALUES ('session_secret', lower(hex(randomblob(32))))",
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            account_id INTEGER NOT NULL,
+            center_id INTEGER,
+            account TEXT NOT NULL,
+            ip TEXT,
+            created_at INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            revoked_at INTEGER
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_account ON sessions(kind, account_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)",
+    ])
+
+
+@migration(10, "بوابة أولياء الأمور: مركز منشئ الحساب + فهارس الأبناء وسجل حضور الطالب")
+def _m010_guardians(cur):
+    if not has_column(cur, "guardian_accounts", "center_id"):
+        cur.execute("ALTER TABLE guardian_accounts ADD COLUMN center_id INTEGER")
+    _run_all(cur, [
+        "CREATE INDEX IF NOT EXISTS idx_guardian_accounts_center ON guardian_accounts(center_id)",
+        # أولياء أمور طلاب المركز (لوحة المدير)؛ الاتجاه الآخر يغطيه المفتاح الأساسي (guardian_id, student_id)
+        "CREATE INDEX IF NOT EXISTS idx_guardian_student_student ON guardian_student(student_id)",
+        # سجل ولي الأمر: حضور الابن بترتيب التاريخ (ux_attendance_student_day يبدأ بـ student_id ثم subject_id)
+        "CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance(student_id, center_id, att_date)",
+    ])
+
+
+@migration(11, "عدّاد إصدار للتعيينات (ذاكرة قائمة المعلّم: صف → طلاب → مواد)")
+def _m011_enrollment_version(cur):
+    cur.execute("INSERT OR IGNORE INTO data_versions(name) VALUES ('enrollments')")
+    _run_all(cur, version_triggers("enrollments"))
+
+
+@migration(12, "مخطط الدرجات: تاريخ سريان + مفتاح فريد (الصف، المادة أو العام، التاريخ) لحفظه بـ upsert + عدّاد إصدار")
+def _m012_scheme_versions(cur):
+    if not has_column(cur, "grading_scheme", "effective_from"):
+        cur.execute("ALTER TABLE grading_scheme ADD COLUMN effective_from TEXT NOT NULL DEFAULT '0001-01-01'")
+    # النسخ المكررة من الإضافة المتكررة: يبقى الأحدث (وهو ما كانت التسميات تطبّقه)
+    cur.execute(
+        """
+        DELETE FROM grading_scheme WHERE id NOT IN (
+            SELECT MAX(id) FROM grading_scheme GROUP BY center_id, class_name, IFNULL(subject_id, 0), effective_from
+        )
+        """
+    )
+    _run_all(cur, [
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_scheme_key
+        ON grading_scheme(center_id, class_name, IFNULL(subject_id, 0), effective_from)
+        """,
+        "DROP INDEX IF EXISTS idx_scheme_center",
+        "INSERT OR IGNORE INTO data_versions(name) VALUES ('grading_scheme')",
+        *version_triggers("grading_scheme"),
+    ])
+
+
+# ملاحظات صف NEW من grades_wide؛ الصف لا يُنشأ إن كانت كل الملاحظات فارغة
+_NOTES_FROM_NEW = """
+    INSERT INTO grade_notes(grade_id, note, note_teacher, note_parent, note_admin)
+    SELECT {gid}, NULLIF(NEW.note, ''),
+           CASE WHEN NEW.note_teacher IS NEW.note THEN NULL ELSE COALESCE(NEW.note_teacher, '') END,
+           NULLIF(NEW.note_parent, ''), NULLIF(NEW.note_admin, '')
+    WHERE COALESCE(NULLIF(NEW.note, ''), NULLIF(NEW.note_teacher, ''), NULLIF(NEW.note_parent, ''), NULLIF(NEW.note_admin, '')) IS NOT NULL;
+"""
+
+
+@migration(13, "صفوف درجات مضغوطة: اليوم رقم صحيح، الملاحظات في grade_notes، والعرض grades_wide بالشكل القديم")
+def _m013_compact_grades(cur):
+    # مشغّل الطلاب يقرأ grades؛ يُعاد إنشاؤه على الشكل الجديد بعد النسخ
+    cur.execute("DROP TRIGGER IF EXISTS trg_students_stats_class")
+    cur.execute("ALTER TABLE grades RENAME TO grades_old")
+    _run_all(cur, [
+        """
+        CREATE TABLE grades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            subject_id INTEGER NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+            teacher_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            center_id INTEGER DEFAULT 1,
+            grade_day INTEGER NOT NULL,  -- أيام منذ 1970-01-01 (gradebook.day_number)
+            score REAL NOT NULL,
+            min_score REAL,
+            max_score REAL,
+            created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+        """,
+        # تاريخ قديم تالف لا يُسقط الترحيل (grade_day NOT NULL): يُصلَح بيوم created_at، وإلا اليوم 0
+        # (1970-01-01)، ويُحفظ النص الأصلي في grade_date_repairs ليراجعه المدير
+        """
+        CREATE TABLE grade_date_repairs (
+            grade_id INTEGER PRIMARY KEY,
+            grade_date TEXT,
+            created_at TEXT
+        )
+        """,
+        f"""
+        INSERT INTO grade_date_repairs(grade_id, grade_date, created_at)
+        SELECT id, grade_date, created_at FROM grades_old WHERE NOT COALESCE({valid_iso_sql('grade_date')}, 0)
+        """,
+        f"""
+        INSERT INTO grades(id, student_id, subject_id, teacher_id, center_id, grade_day, score, min_score, max_score, created_at)
+        SELECT id, student_id, subject_id, teacher_id, center_id,
+               CASE WHEN {valid_iso_sql('grade_date')} THEN {day_sql('grade_date')}
+                    WHEN {valid_iso_sql('created_at')} THEN {day_sql('created_at')}
+                    ELSE 0 END,
+               score, min_score, max_score, COALESCE(CAST(strftime('%s', created_at) AS INTEGER), 0)
+        FROM grades_old
+        """,
+        """
+        CREATE TABLE grade_notes (
+            grade_id INTEGER PRIMARY KEY REFERENCES grades(id) ON DELETE CASCADE,
+            note TEXT,
+            note_teacher TEXT,  -- NULL = مثل note
+            note_parent TEXT,
+            note_admin TEXT
+        )
+        """,
+        """
+        INSERT INTO grade_notes(grade_id, note, note_teacher, note_parent, note_admin)
+        SELECT id, NULLIF(note, ''), CASE WHEN note_teacher IS note THEN NULL ELSE COALESCE(note_teacher, '') END,
+               NULLIF(note_parent, ''), NULLIF(note_admin, '')
+        FROM grades_old
+        WHERE COALESCE(NULLIF(note, ''), NULLIF(note_teacher, ''), NULLIF(note_parent, ''), NULLIF(note_admin, '')) IS NOT NULL
+        """,
+        # الفهارس ومشغّلات الإحصاءات والإصدار تُحذف مع الجدول القديم
+        "DROP TABLE grades_old",
+        "CREATE INDEX idx_grades_teacher ON grades(teacher_id, center_id, grade_day)",
+        "CREATE INDEX idx_grades_student ON grades(student_id, center_id, grade_day)",
+        "CREATE INDEX idx_grades_center_date ON grades(center_id, grade_day)",
+        "CREATE INDEX idx_grades_subject_date ON grades(center_id, subject_id, grade_day, student_id, score)",
+        *version_triggers("grades"),
+    ])
+
+    # grade_daily_stats يبقى بتواريخ نصية (جدول صغير تقرأه التحليلات والتسميات)
+    refresh = """
+        DELETE FROM grade_daily_stats
+        WHERE center_id={c} AND subject_id={s} AND grade_date={iso} AND class_name {cls};
+        INSERT INTO grade_daily_stats(center_id, class_name, subject_id, grade_date, n, total, total_sq, min_score, max_score)
+        SELECT g.center_id, st.class_name, g.subject_id, {iso},
+               COUNT(*), SUM(g.score), SUM(g.score * g.score), MIN(g.score), MAX(g.score)
+        FROM grades g JOIN students st ON st.id=g.student_id
+        WHERE g.center_id={c} AND g.subject_id={s} AND g.grade_day={d} AND st.class_name {cls}
+        GROUP BY st.class_name;
+    """
+    old, new = (
+        refresh.format(c=f"{r}.center_id", s=f"{r}.subject_id", d=f"{r}.grade_day", iso=iso_sql(f"{r}.grade_day"),
+                       cls=f"= (SELECT class_name FROM students WHERE id={r}.student_id)")
+        for r in ("OLD", "NEW")
+    )
+    old_all = refresh.format(c="OLD.center_id", s="OLD.subject_id", d="OLD.grade_day", iso=iso_sql("OLD.grade_day"),
+                             cls="IS NOT NULL")
+    _run_all(cur, [
+        f"""
+        CREATE TRIGGER trg_grades_stats_insert AFTER INSERT ON grades
+        BEGIN
+            INSERT INTO grade_daily_stats(center_id, class_name, subject_id, grade_date, n, total, total_sq, min_score, max_score)
+            SELECT NEW.center_id, st.class_name, NEW.subject_id, {iso_sql('NEW.grade_day')}, 1, NEW.score, NEW.score * NEW.score, NEW.score, NEW.score
+            FROM students st WHERE st.id=NEW.student_id
+            ON CONFLICT(center_id, subject_id, grade_date, class_name) DO UPDATE SET
+                n = n + 1, total = total + excluded.total, total_sq = total_sq + excluded.total_sq,
+                min_score = min(min_score, excluded.min_score), max_score = max(max_score, excluded.max_score);
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_grades_stats_update
+        AFTER UPDATE OF center_id, student_id, subject_id, grade_day, score ON grades
+        BEGIN {old} {new} END
+        """,
+        f"""
+        CREATE TRIGGER trg_grades_stats_delete AFTER DELETE ON grades
+        BEGIN {old_all} END
+        """,
+        f"""
+        CREATE TRIGGER trg_students_stats_class AFTER UPDATE OF class_name ON students
+        WHEN OLD.class_name IS NOT NEW.class_name
+        BEGIN
+            DELETE FROM grade_daily_stats
+            WHERE class_name IN (OLD.class_name, NEW.class_name)
+              AND (center_id, subject_id, grade_date) IN (
+                  SELECT center_id, subject_id, {iso_sql('grade_day')} FROM grades WHERE student_id=NEW.id);
+            INSERT INTO grade_daily_stats(center_id, class_name, subject_id, grade_date, n, total, total_sq, min_score, max_score)
+            SELECT g.center_id, st.class_name, g.subject_id, {iso_sql('g.grade_day')},
+                   COUNT(*), SUM(g.score), SUM(g.score * g.score), MIN(g.score), MAX(g.score)
+            FROM grades g JOIN students st ON st.id=g.student_id
+            WHERE st.class_name IN (OLD.class_name, NEW.class_name)
+              AND (g.center_id, g.subject_id, g.grade_day) IN (SELECT center_id, subject_id, grade_day FROM grades WHERE student_id=NEW.id)
+            GROUP BY g.center_id, st.class_name, g.subject_id, g.grade_day;
+        END
+        """,
+    ])
+
+    # الشكل القديم: نفس الأعمدة بنفس الترتيب، قابل للكتابة (INSERT/UPDATE/DELETE) عبر INSTEAD OF
+    _run_all(cur, [
+        f"""
+        CREATE VIEW grades_wide AS
+        SELECT g.id, g.student_id, g.subject_id, g.teacher_id, {iso_sql('g.grade_day')} AS grade_date, g.score,
+               n.note, {NOTE_TEACHER} AS note_teacher, n.note_parent, n.note_admin,
+               datetime(g.created_at, 'unixepoch') AS created_at, g.center_id, g.min_score, g.max_score
+        FROM grades g LEFT JOIN grade_notes n ON n.grade_id=g.id
+        """,
+        f"""
+        CREATE TRIGGER trg_grades_wide_insert INSTEAD OF INSERT ON grades_wide
+        BEGIN
+            INSERT INTO grades(id, student_id, subject_id, teacher_id, center_id, grade_day, score, min_score, max_score, created_at)
+            VALUES (NEW.id, NEW.student_id, NEW.subject_id, NEW.teacher_id, COALESCE(NEW.center_id, 1),
+                    {day_sql('NEW.grade_date')}, NEW.score, NEW.min_score, NEW.max_score,
+                    COALESCE(CAST(strftime('%s', NEW.created_at) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)));
+            {_NOTES_FROM_NEW.format(gid="last_insert_rowid()")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_grades_wide_update INSTEAD OF UPDATE ON grades_wide
+        BEGIN
+            UPDATE grades SET student_id=NEW.student_id, subject_id=NEW.subject_id, teacher_id=NEW.teacher_id,
+                   center_id=NEW.center_id, grade_day={day_sql('NEW.grade_date')}, score=NEW.score,
+                   min_score=NEW.min_score, max_score=NEW.max_score
+            WHERE id=OLD.id;
+            DELETE FROM grade_notes WHERE grade_id=OLD.id;
+            {_NOTES_FROM_NEW.format(gid="OLD.id")}
+        END
+        """,
+        """
+        CREATE TRIGGER trg_grades_wide_delete INSTEAD OF DELETE ON grades_wide
+        BEGIN
+            DELETE FROM grade_notes WHERE grade_id=OLD.id;
+            DELETE FROM grades WHERE id=OLD.id;
+        END
+        """,
+    ])
+    cur.execute("ANALYZE grades")
+
+
+def current_version(conn):
+    with closing(conn.cursor()) as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+            )
+            """
+        )
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cur.fetchone()[0]
+
+
+def run_migrations(conn):
+    """طبّق الترحيلات الناقصة فقط، كلٌّ في معاملة مستقلة. يعيد أرقام الإصدارات المطبّقة."""
+    applied = []
+    if current_version(conn) >= MIGRATIONS[-1][0]:
+        return applied
+    for version, description, fn in MIGRATIONS:
+        with closing(conn.cursor()) as cur:
+            # BEGIN IMMEDIATE يحجز قفل الكتابة: لو بدأت عمليتان معًا تنتظر الثانية ثم تجد الإصدار مطبّقًا.
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                if cur.fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                fn(cur)
+                cur.execute("INSERT INTO schema_version(version, description) VALUES (?,?)", (version, description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        applied.append(version)
+    return applied
+
+
+__all__ = ["MIGRATIONS", "migration", "has_column", "current_version", "run_migrations"]
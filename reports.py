@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# reports.py — تقارير الدرجات: فلاتر على الخادم + ترقيم صفحات بالمفتاح (grade_day, id) + تصدير متدفق
+
+import csv
+import io
+from contextlib import closing
+
+import pandas as pd
+
+from gradebook import GRADE_DATE, NOTE_TEACHER, NOTES_JOIN, day_number
+
+try:
+    from openpyxl import Workbook
+except Exception:  # التصدير إلى Excel اختياري
+    Workbook = None
+
+XLSX_AVAILABLE = Workbook is not None
+
+PAGE_SIZE = 100
+COUNT_CAP = 10000  # بعد هذا الحد نعرض "أكثر من" بدل عدّ كل الصفوف
+EXPORT_CHUNK = 5000
+# download_button يحتفظ بالملف كاملًا في ذاكرة الخادم حتى انتهاء الجلسة (~100 بايت للصف في CSV)،
+# فما فوق هذا الحد يُطلب تضييقه بالفلاتر بدل تحميل مئات الميغابايتات لكل مستخدم
+EXPORT_MAX_ROWS = 200000
+
+REPORT_COLUMNS = f"""
+    g.id AS "#", {GRADE_DATE} AS "التاريخ", s.full_name AS "الطالب", s.class_name AS "الصف", sub.name AS "المادة",
+    u.full_name AS "المعلم", g.score AS "الدرجة", g.min_score AS "الدنيا", g.max_score AS "العظمى"
+"""
+NOTE_COLUMNS = f"""
+    n.note AS "ملاحظة للطالب", {NOTE_TEACHER} AS "ملاحظة للمعلم", n.note_parent AS "ملاحظة لولي الأمر", n.note_admin AS "ملاحظة للمدير"
+"""
+STUDENT_NOTE_COLUMNS = 'n.note AS "ملاحظات المعلم"'
+# الصفحات لا تطلب الملاحظات فيُسقط SQLite الربط بـ grade_notes (مفتاحه grade_id)؛ التصدير يقرؤها
+REPORT_FROM = f"""
+    FROM grades g JOIN students s ON s.id=g.student_id JOIN subjects sub ON sub.id=g.subject_id JOIN users u ON u.id=g.teacher_id
+    {NOTES_JOIN}
+"""
+
+
+def report_where(center_id, filters):
+    """filters: date_from/date_to (ISO)، class_name، subject_id، teacher_id، student_id — كلها اختيارية."""
+    where = "WHERE g.center_id=?"; params = [center_id]
+    if filters.get("date_from"): where += " AND g.grade_day >= ?"; params.append(day_number(filters["date_from"]))
+    if filters.get("date_to"): where += " AND g.grade_day <= ?"; params.append(day_number(filters["date_to"]))
+    # بلا تلميح فهرس الطلاب عمدًا: المسح بترتيب (center_id, grade_day) يتوقف بعد LIMIT صف
+    if filters.get("class_name"): where += " AND s.class_name=?"; params.append(filters["class_name"])
+    if filters.get("subject_id"): where += " AND g.subject_id=?"; params.append(int(filters["subject_id"]))
+    if filters.get("teacher_id"): where += " AND g.teacher_id=?"; params.append(int(filters["teacher_id"]))
+    if filters.get("student_id"): where += " AND g.student_id=?"; params.append(int(filters["student_id"]))
+    return where, params
+
+
+def report_page(conn, center_id, filters, after=None, limit=PAGE_SIZE):
+    """صفحة واحدة بترتيب الأحدث أولًا. after=(التاريخ ISO، id) لآخر صف في الصفحة السابقة."""
+    where, params = report_where(center_id, filters)
+    if after is not None:
+        # مقارنة row-value تبقى بحثًا في نطاق الفهرس؛ صيغة OR المكافئة تنقلب إلى MULTI-INDEX OR
+        where += " AND (g.grade_day, g.id) < (?, ?)"
+        params += [day_number(after[0]), int(after[1])]
+    # subject_id عمود مساعد لحساب التقييم النوعي (يُخفى في الواجهة)
+    q = f"SELECT {REPORT_COLUMNS}, g.subject_id {REPORT_FROM} {where} ORDER BY g.grade_day DESC, g.id DESC LIMIT ?"
+    return pd.read_sql_query(q, conn, params=params + [int(limit)])
+
+
+def report_count_estimate(conn, center_id, filters, cap=COUNT_CAP):
+    """(العدد، هل تجاوز الحد) — العدّ يتوقف عند cap فلا يمسح كل التاريخ."""
+    where, params = report_where(center_id, filters)
+    with closing(conn.cursor()) as cur:
+        cur.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM grades g JOIN students s ON s.id=g.student_id {where} LIMIT ?)",
+            params + [cap + 1],
+        )
+        n = cur.fetchone()[0]
+    return min(n, cap), n > cap
+
+
+def grade_notes(conn, grade_id, center_id):
+    """ملاحظات درجة واحدة، تُجلب فقط عند فتح صفها."""
+    with closing(conn.cursor()) as cur:
+        cur.execute(
+            f"SELECT n.note, {NOTE_TEACHER}, n.note_parent, n.note_admin FROM grades g {NOTES_JOIN} WHERE g.id=? AND g.center_id=?",
+            (int(grade_id), center_id),
+        )
+        r = cur.fetchone()
+    if not r:
+        return None
+    return {"ملاحظة للطالب": r[0], "ملاحظة للمعلم": r[1], "ملاحظة لولي الأمر": r[2], "ملاحظة للمدير": r[3]}
+
+
+def teacher_recent_grades(conn, teacher_id, center_id, limit=200):
+    """آخر درجات المعلّم (الأحدث أولًا) — تقرأ idx_grades_teacher بترتيبه وتتوقف بعد limit."""
+    q = f"""
+    SELECT g.id AS "#", {GRADE_DATE} AS "التاريخ", s.full_name AS "الطالب", sub.name AS "المادة",
+           g.score AS "الدرجة", g.min_score AS "الدنيا", g.max_score AS "العظمى", n.note AS "الملاحظات"
+    FROM grades g JOIN students s ON s.id=g.student_id JOIN subjects sub ON sub.id=g.subject_id {NOTES_JOIN}
+    WHERE g.teacher_id=? AND g.center_id=? ORDER BY g.grade_day DESC, g.id DESC LIMIT ?
+    """
+    return pd.read_sql_query(q, conn, params=[int(teacher_id), center_id, int(limit)])
+
+
+def student_grades(conn, student_id, center_id):
+    """درجات طالب واحد لبوابته؛ subject_id وclass_name مساعدان لحساب التقييم (يُخفيان في الواجهة)."""
+    q = f"""
+    SELECT {GRADE_DATE} AS "التاريخ", sub.name AS "المادة", g.score AS "الدرجة",
+           g.min_score AS "الدنيا", g.max_score AS "العظمى", n.note AS "ملاحظات المعلم",
+           g.subject_id, s.class_name
+    FROM grades g JOIN subjects sub ON sub.id=g.subject_id JOIN students s ON s.id=g.student_id {NOTES_JOIN}
+    WHERE g.student_id=? AND g.center_id=? ORDER BY g.grade_day DESC
+    """
+    return pd.read_sql_query(q, conn, params=[int(student_id), center_id])
+
+
+def grade_sheet(conn, center_id, teacher_id, subject_id, class_name, on_date):
+    """طلاب الصف المعيّنون للمعلّم في المادة مع آخر درجة لكل منهم في اليوم (إن وجدت) — استعلام واحد."""
+    q = f"""
+    SELECT s.id AS student_id, s.full_name, g.id AS grade_id, g.score, n.note
+    FROM (SELECT DISTINCT student_id FROM enrollments
+          WHERE teacher_id=? AND subject_id=? AND center_id=?) e
+    JOIN students s ON s.id=e.student_id AND s.class_name=?
+    LEFT JOIN grades g ON g.id = (
+        SELECT MAX(id) FROM grades
+        WHERE student_id=s.id AND subject_id=? AND grade_day=? AND center_id=?)
+    {NOTES_JOIN}
+    ORDER BY s.full_name
+    """
+    subject_id = int(subject_id)
+    return pd.read_sql_query(q, conn, params=[int(teacher_id), subject_id, center_id, class_name,
+                                              subject_id, day_number(on_date), center_id])
+
+
+def center_enrollments(conn, center_id):
+    q = """
+    SELECT e.id AS "#", s.full_name AS "الطالب", s.class_name AS "الصف", sub.name AS "المادة", u.full_name AS "المعلم"
+    FROM enrollments e JOIN students s ON s.id=e.student_id JOIN subjects sub ON sub.id=e.subject_id JOIN users u ON u.id=e.teacher_id
+    WHERE e.center_id=? ORDER BY "الصف", "الطالب", "المادة"
+    """
+    return pd.read_sql_query(q, conn, params=[center_id])
+
+
+HONOR_PARTITIONS = {
+    "class": "s.class_name",
+    "subject": "g.subject_id",
+    "class_subject": "s.class_name, g.subject_id",
+}
+
+
+def honor_board_top10(conn, center_id, class_name=None, subject_id=None, date_iso=None, per=None):
+    """أعلى 10% (ceil، بحد أدنى طالب واحد) محسوبة داخل SQLite فلا يصل إلى pandas إلا الصفوف الفائزة.
+
+    per ("class"/"subject"/"class_subject") يرتّب كل مجموعة على حدة في استعلام واحد.
+    """
+    where = "WHERE g.center_id=?"; params = [center_id]
+    # s.center_id=g.center_id يوجّه المخطِّط إلى فهرس (center_id, class_name) على الطلاب
+    if class_name: where += " AND s.center_id=g.center_id AND s.class_name=?"; params.append(class_name)
+    if subject_id: where += " AND g.subject_id=?"; params.append(subject_id)
+    if date_iso: where += " AND g.grade_day=?" ; params.append(day_number(date_iso))
+    if per is None:
+        # العدد أولًا ثم LIMIT ثابت: SQLite يرتّب بكومة محدودة الحجم بدل فرز كل الصفوف
+        with closing(conn.cursor()) as cur:
+            cur.execute(f"SELECT COUNT(*) FROM grades g JOIN students s ON s.id=g.student_id {where}", params)
+            n = cur.fetchone()[0]
+        q = f"""
+        SELECT s.full_name AS student, s.class_name AS class, g.subject_id, sub.name AS subject, {GRADE_DATE} AS grade_date, g.score, g.min_score, g.max_score
+        FROM grades g JOIN students s ON s.id=g.student_id JOIN subjects sub ON sub.id=g.subject_id
+        {where} ORDER BY g.score DESC, g.id LIMIT ?
+        """
+        return pd.read_sql_query(q, conn, params=params + [(n + 9) // 10])
+    part = HONOR_PARTITIONS[per]
+    q = f"""
+    SELECT s.full_name AS student, s.class_name AS class, r.subject_id, sub.name AS subject, r.grade_date, r.score, r.min_score, r.max_score
+    FROM (
+        SELECT g.student_id, g.subject_id, {GRADE_DATE} AS grade_date, g.score, g.min_score, g.max_score,
+               ROW_NUMBER() OVER (PARTITION BY {part} ORDER BY g.score DESC, g.id) AS rn,
+               COUNT(*) OVER (PARTITION BY {part}) AS n
+        FROM grades g JOIN students s ON s.id=g.student_id
+        {where}
+    ) r JOIN students s ON s.id=r.student_id JOIN subjects sub ON sub.id=r.subject_id
+    WHERE r.rn <= (r.n + 9) / 10
+    ORDER BY class, subject, r.score DESC
+    """
+    return pd.read_sql_query(q, conn, params=params)
+
+
+def iter_report_chunks(conn, center_id, filters, notes=NOTE_COLUMNS, chunk_size=EXPORT_CHUNK):
+    """(رؤوس الأعمدة، مولّد دفعات صفوف) من مؤشر واحد عبر fetchmany — بلا DataFrame كامل.
+
+    notes: أعمدة الملاحظات المسموح بها لمن يصدّر (بوابة الطالب تمرر STUDENT_NOTE_COLUMNS).
+    """
+    where, params = report_where(center_id, filters)
+    cur = conn.cursor()
+    cur.execute(f"SELECT {REPORT_COLUMNS}, {notes} {REPORT_FROM} {where} ORDER BY g.grade_day DESC, g.id DESC", params)
+    header = [d[0] for d in cur.description]
+
+    def chunks():
+        with closing(cur):
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+
+    return header, chunks()
+
+
+def export_csv(conn, center_id, filters, out, notes=NOTE_COLUMNS):
+    """اكتب التقرير CSV في ملف ثنائي out. utf-8-sig يضيف BOM ليقرأ Excel العربية صحيحًا. يعيد عدد الصفوف."""
+    header, chunks = iter_report_chunks(conn, center_id, filters, notes)
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(header)
+    n = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        n += len(rows)
+    text.flush()
+    text.detach()
+    return n
+
+
+def export_xlsx(conn, center_id, filters, out, notes=NOTE_COLUMNS):
+    """اكتب التقرير XLSX في out بوضع write_only (الصفوف تُكتب للقرص تباعًا). يعيد عدد الصفوف."""
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("openpyxl غير مثبت")
+    header, chunks = iter_report_chunks(conn, center_id, filters, notes)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("الدرجات")
+    ws.sheet_view.rightToLeft = True
+    ws.append(header)
+    n = 0
+    for rows in chunks:
+        for r in rows:
+            ws.append(r)
+        n += len(rows)
+    wb.save(out)
+    return n
+
+
+__all__ = [
+    "PAGE_SIZE", "report_where", "report_page", "report_count_estimate", "grade_notes",
+    "teacher_recent_grades", "student_grades", "grade_sheet", "center_enrollments", "HONOR_PARTITIONS", "honor_board_top10",
+    "XLSX_AVAILABLE", "NOTE_COLUMNS", "STUDENT_NOTE_COLUMNS", "EXPORT_MAX_ROWS", "iter_report_chunks", "export_csv", "export_xlsx",
+]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# schedule.py — الجدول الأسبوعي: كشف تعارض المعلّم/الصف/القاعة، التحقق بالجملة، وعرض شبكة أسبوعية
+
+import pandas as pd
+
+DAYS = ["الإثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]  # 0=Mon .. 6=Sun
+DAY_CODES = {name: i for i, name in enumerate(DAYS)}
+
+# الموارد التي لا تقبل حصتين متداخلتين: (العمود، وصف التعارض)
+RESOURCES = [("teacher_id", "المعلّم مشغول"), ("class_name", "الصف مشغول"), ("room", "القاعة محجوزة")]
+
+LESSON_COLUMNS = ["id", "class_name", "subject_id", "teacher_id", "day_of_week", "start_time", "end_time", "room"]
+
+
+def to_minutes(hhmm):
+    h, m = str(hhmm).strip().split(":")[:2]
+    return int(h) * 60 + int(m)
+
+
+def lesson_conflicts(conn, center_id, lesson, exclude_id=None):
+    """تعارضات حصة واحدة مع المسجّل: بحث نطاق في فهرس (center_id, day_of_week, start_time) لا مسح كل الحصص.
+
+    lesson: dict بمفاتيح class_name/teacher_id/day_of_week/start_time/end_time/room. يعيد قائمة (السبب، رقم الحصة).
+    الأوقات بصيغة HH:MM فالمقارنة النصية صحيحة.
+    """
+    rows = conn.execute(
+        """
+        SELECT id, teacher_id, class_name, room FROM lessons
+        WHERE center_id=? AND day_of_week=? AND start_time < ? AND end_time > ? AND id IS NOT ?
+          AND (teacher_id=? OR class_name=? OR (room IS NOT NULL AND room=?))
+        """,
+        (center_id, int(lesson["day_of_week"]), lesson["end_time"], lesson["start_time"], exclude_id,
+         int(lesson["teacher_id"]), lesson["class_name"], lesson.get("room")),
+    ).fetchall()
+    out = []
+    for lid, tid, cls, room in rows:
+        if tid == int(lesson["teacher_id"]): out.append((RESOURCES[0][1], lid))
+        if cls == lesson["class_name"]: out.append((RESOURCES[1][1], lid))
+        if room is not None and room == lesson.get("room"): out.append((RESOURCES[2][1], lid))
+    return out
+
+
+def find_conflicts(lessons):
+    """كشف التداخل بالجملة: لكل مورد وكل يوم تُرتَّب الحصص بالبداية، فتتعارض الحصة إن بدأت قبل أكبر نهاية
+    سبقتها، أو انتهت بعد بداية الحصة التالية لها.
+
+    متجه بالكامل (فرز + cummax)، O(n log n) لآلاف الحصص. lessons يحتاج الأعمدة class_name/teacher_id/
+    day_of_week/start_time/end_time/room و"key" يعرّف الصف. يعيد DataFrame (key، السبب، يتعارض مع) فيه
+    كل حصة داخلة في تعارض مرة واحدة لكل مورد.
+    """
+    df = lessons.assign(_s=lessons["start_time"].map(to_minutes), _e=lessons["end_time"].map(to_minutes))
+    found = []
+    for col, reason in RESOURCES:
+        part = df[df[col].notna()].sort_values([col, "day_of_week", "_s", "_e"], kind="mergesort")
+        if part.empty:
+            continue
+        by = [part[col], part["day_of_week"]]
+        running = part.groupby(by, sort=False)["_e"].cummax()
+        prev_end = running.groupby(by, sort=False).shift()
+        # صاحب أكبر نهاية حتى الآن هو الطرف الآخر في التعارض
+        holder = part["key"].where(part["_e"].eq(running)).groupby(by, sort=False).ffill()
+        prev_key = holder.groupby(by, sort=False).shift()
+        next_start = part.groupby(by, sort=False)["_s"].shift(-1)
+        next_key = part.groupby(by, sort=False)["key"].shift(-1)
+        before, after = part["_s"] < prev_end, next_start < part["_e"]
+        found.append(pd.DataFrame({"key": part.loc[before, "key"], "السبب": reason, "يتعارض مع": prev_key[before]}))
+        found.append(pd.DataFrame({"key": part.loc[after & ~before, "key"], "السبب": reason, "يتعارض مع": next_key[after & ~before]}))
+    if not found:
+        return pd.DataFrame(columns=["key", "السبب", "يتعارض مع"])
+    return pd.concat(found, ignore_index=True)
+
+
+def load_lessons(conn, center_id):
+    return pd.read_sql_query(
+        f"SELECT {', '.join(LESSON_COLUMNS)} FROM lessons WHERE center_id=?", conn, params=[center_id]
+    )
+
+
+def weekly_grid(conn, center_id, teacher_id=None, class_name=None):
+    """شبكة أسبوعية (صفوف = فترات الحصص، أعمدة = الأيام) لمعلّم أو صف."""
+    where = "WHERE l.center_id=?"; params = [center_id]
+    if teacher_id: where += " AND l.teacher_id=?"; params.append(int(teacher_id))
+    if class_name: where += " AND l.class_name=?"; params.append(class_name)
+    df = pd.read_sql_query(
+        f"""
+        SELECT l.day_of_week, l.start_time || ' - ' || l.end_time AS slot, sub.name AS subject,
+               l.class_name, u.full_name AS teacher, l.room
+        FROM lessons l JOIN subjects sub ON sub.id=l.subject_id JOIN users u ON u.id=l.teacher_id
+        {where}
+        ORDER BY l.start_time, l.day_of_week
+        """,
+        conn, params=params,
+    )
+    if df.empty:
+        return df
+    other = df["class_name"] if teacher_id else df["teacher"]
+    df["cell"] = df["subject"] + " — " + other + df["room"].map(lambda r: f" ({r})" if isinstance(r, str) and r else "")
+    grid = df.pivot_table(index="slot", columns="day_of_week", values="cell", aggfunc=" / ".join, sort=False)
+    grid = grid.reindex(columns=[d for d in range(7) if d in grid.columns])
+    grid.columns = [DAYS[d] for d in grid.columns]
+    return grid.fillna("")
+
+
+__all__ = [
+    "DAYS", "DAY_CODES", "RESOURCES", "to_minutes", "lesson_conflicts", "find_conflicts",
+    "load_lessons", "weekly_grid",
+]
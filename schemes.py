@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# schemes.py — مخططات الدرجات: حفظ بـ upsert لكل (الصف، المادة، تاريخ السريان)، وخريطة محلولة في الذاكرة تُطبَّق بالجملة
+
+import numpy as np
+import pandas as pd
+
+from datacache import lookup_cache
+from gradebook import day_numbers
+
+SCHEME_FIELDS = ["min_score", "max_score", "excellent_cut", "high_cut", "average_cut"]
+ALL_SUBJECTS = 0              # subject_id الفارغ (مخطط عام للصف) في الخريطة المحلولة
+SINCE_ALWAYS = "0001-01-01"   # تاريخ سريان المخططات السابقة للإصدارات: يسري على كل الدرجات
+
+# المفتاح الفريد (الترحيل 12): مخطط واحد لكل (المركز، الصف، المادة أو العام، تاريخ السريان)
+UPSERT_SQL = f"""
+    INSERT INTO grading_scheme(center_id, class_name, subject_id, effective_from, {', '.join(SCHEME_FIELDS)})
+    VALUES (?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(center_id, class_name, IFNULL(subject_id, 0), effective_from)
+    DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in SCHEME_FIELDS)}
+"""
+
+
+def save_scheme(conn, center_id, class_name, subject_id, values, effective_from=SINCE_ALWAYS):
+    """أضف إصدارًا أو عدّل الموجود لنفس (الصف، المادة، التاريخ) داخل معاملة المستدعي (db_write).
+
+    subject_id=None مخطط عام للصف؛ values قاموس بحقول SCHEME_FIELDS.
+    """
+    conn.execute(
+        UPSERT_SQL,
+        (int(center_id), class_name, None if subject_id is None else int(subject_id), str(effective_from))
+        + tuple(float(values[c]) if values.get(c) is not None else None for c in SCHEME_FIELDS),
+    )
+
+
+def delete_schemes(conn, center_id, ids):
+    conn.executemany("DELETE FROM grading_scheme WHERE id=? AND center_id=?", [(int(i), int(center_id)) for i in ids])
+    return len(ids)
+
+
+def _load_schemes(conn, center_id):
+    df = pd.read_sql_query(
+        f"""
+        SELECT id, class_name, IFNULL(subject_id, {ALL_SUBJECTS}) AS subject_id, effective_from, {', '.join(SCHEME_FIELDS)}
+        FROM grading_scheme WHERE center_id=?
+        """,
+        conn, params=[int(center_id)],
+    )
+    df = df.astype({"class_name": object, "subject_id": "int64", **{c: "float64" for c in SCHEME_FIELDS}})
+    df["day"] = day_numbers(df["effective_from"])
+    return df.sort_values("day", kind="mergesort", ignore_index=True)
+
+
+def center_schemes(conn, center_id):
+    """كل إصدارات مخططات المركز مرتبة بتاريخ السريان؛ تُقرأ مرة وتبقى في الذاكرة حتى تتغيّر grading_scheme."""
+    return lookup_cache.get(conn, "grading_schemes", ["grading_scheme"], _load_schemes, int(center_id))
+
+
+def resolve_schemes(schemes, keys):
+    """المخطط الساري لكل صف من keys (أعمدة class_name/subject_id/grade_date) بلا استعلام لكل صف.
+
+    لكل صف: أحدث إصدار تاريخه <= تاريخ الدرجة، والخاص بالمادة يتقدم على العام للصف.
+    يعيد DataFrame بحقول SCHEME_FIELDS بنفس فهرس keys (NaN حيث لا مخطط).
+    """
+    k = pd.DataFrame({
+        "class_name": keys["class_name"].astype(object).to_numpy(),
+        "subject_id": keys["subject_id"].astype("int64").to_numpy(),
+        "day": day_numbers(keys["grade_date"]),
+        "row": np.arange(len(keys)),
+    }).sort_values("day", kind="mergesort")
+    cols = ["class_name", "subject_id", "day"] + SCHEME_FIELDS
+    specific = pd.merge_asof(k, schemes[cols], on="day", by=["class_name", "subject_id"])
+    general = pd.merge_asof(k, schemes.loc[schemes["subject_id"].eq(ALL_SUBJECTS), cols].drop(columns="subject_id"),
+                            on="day", by="class_name")
+    has_specific = specific["min_score"].notna().to_numpy()
+    out = pd.DataFrame(np.where(has_specific[:, None], specific[SCHEME_FIELDS].to_numpy(), general[SCHEME_FIELDS].to_numpy()),
+                       columns=SCHEME_FIELDS, index=k["row"].to_numpy()).sort_index()
+    return out.set_axis(keys.index)
+
+
+def scheme_for(conn, center_id, class_name, subject_id, on_date):
+    """المخطط الساري لصف/مادة في يوم واحد (قاموس SCHEME_FIELDS) أو None — من الخريطة المخزّنة."""
+    key = pd.DataFrame({"class_name": [class_name], "subject_id": [int(subject_id)], "grade_date": [str(on_date)]})
+    row = resolve_schemes(center_schemes(conn, center_id), key).iloc[0]
+    return None if pd.isna(row["min_score"]) else row.to_dict()
+
+
+__all__ = [
+    "SCHEME_FIELDS", "ALL_SUBJECTS", "SINCE_ALWAYS", "save_scheme", "delete_schemes",
+    "center_schemes", "resolve_schemes", "scheme_for",
+]
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# sessions.py — جلسات دخول دائمة: رمز موقّع بـ HMAC في الرابط، انتهاء منزلق، وإلغاء من جهة الخادم
+#
+# الرمز = <معرّف الجلسة>.<HMAC-SHA256 للمعرّف>. التوقيع يُفحص أولًا (بلا قاعدة بيانات ولا bcrypt)،
+# ثم يُقرأ صف الجلسة بالمفتاح الأساسي للتأكد من أنها لم تنتهِ ولم تُلغَ، مع صف الحساب الحي في الجملة نفسها.
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from accounts import session_account
+
+SESSION_TTL = 7 * 24 * 3600   # ثوانٍ من آخر نشاط
+TOUCH_EVERY = 300             # لا نكتب last_seen/expires_at أكثر من مرة كل 5 دقائق للجلسة
+TOKEN_PARAM = "s"             # اسم معامل الرابط الذي يحمل الرمز
+
+Session = namedtuple("Session", ["id", "account", "center_id", "needs_touch"])
+
+
+def session_secret(conn, configured=None):
+    """مفتاح التوقيع: SESSION_SECRET من الإعدادات إن وُجد، وإلا المفتاح العشوائي المحفوظ في app_settings (الترحيل 9)."""
+    if configured:
+        return str(configured).encode()
+    row = conn.execute("SELECT value FROM app_settings WHERE key='session_secret'").fetchone()
+    return row[0].encode()
+
+
+def _sign(secret, sid):
+    mac = hmac.new(secret, sid.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode()
+
+
+def parse_token(secret, token):
+    """معرّف الجلسة إن كان التوقيع صحيحًا، وإلا None."""
+    sid, _, sig = str(token or "").partition(".")
+    if not sid or not sig or not sig.isascii():
+        return None
+    # bytes لا str: compare_digest يرفض النصوص غير ASCII، والرمز يأتي من الرابط كما هو
+    if not hmac.compare_digest(sig.encode(), _sign(secret, sid).encode()):
+        return None
+    return sid
+
+
+def create_session(conn, secret, account, center_id, ip=None, ttl=SESSION_TTL):
+    """سجّل جلسة جديدة داخل معاملة المستدعي (db_write) واحذف المنتهية. يعيد (الرمز، المعرّف)."""
+    now = int(time.time())
+    sid = secrets.token_urlsafe(24)
+    account_id = account.get("account_id", account.get("id"))
+    conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+    conn.execute(
+        """
+        INSERT INTO sessions(id, kind, account_id, center_id, account, ip, created_at, last_seen, expires_at)
+        VALUES (?,?,?,?,?,?,?,?,?)
+        """,
+        (sid, account["kind"], account_id, center_id, json.dumps(account, ensure_ascii=False), ip, now, now, now + ttl),
+    )
+    return f"{sid}.{_sign(secret, sid)}", sid
+
+
+# صف الجلسة + حسابها الحي: كل LEFT JOIN بحث بالمفتاح الأساسي مقيّد بنوع الجلسة، فلا يطابق إلا واحد منها.
+# مستخدم المركز والطالب يُطابَقان بمركز الجلسة كما في ACCOUNT_SQL (النقل إلى مركز آخر يُنهي الجلسة).
+LIVE_SESSION_SQL = """
+    SELECT se.kind, se.account_id, se.center_id, se.last_seen,
+           COALESCE(o.full_name, u.full_name, st.full_name, ga.full_name),
+           COALESCE(o.email, u.email, sa.email, ga.email),
+           CASE se.kind WHEN 'user' THEN u.role ELSE se.kind END,
+           sa.student_id
+    FROM sessions se
+    LEFT JOIN owners o ON se.kind='owner' AND o.id=se.account_id
+    LEFT JOIN users u ON se.kind='user' AND u.id=se.account_id AND u.center_id=se.center_id
+    LEFT JOIN student_accounts sa ON se.kind='student' AND sa.id=se.account_id AND sa.center_id=se.center_id
+    LEFT JOIN students st ON st.id=sa.student_id
+    LEFT JOIN guardian_accounts ga ON se.kind='guardian' AND ga.id=se.account_id
+    WHERE se.id=? AND se.revoked_at IS NULL AND se.expires_at > ?
+"""
+
+
+def load_session(conn, secret, token, now=None):
+    """تحقق HMAC ثم جملة واحدة بالمفاتيح الأساسية. None إن كان الرمز مزورًا أو منتهيًا أو ملغى، أو حُذف حسابه.
+
+    الاسم والبريد والدور تُقرأ من صف الحساب الحي لا من نسخة وقت الدخول: تغيير الدور يسري من التشغيل التالي.
+    """
+    sid = parse_token(secret, token)
+    if sid is None:
+        return None
+    now = int(now or time.time())
+    row = conn.execute(LIVE_SESSION_SQL, (sid, now)).fetchone()
+    if row is None or row[4] is None:
+        return None
+    kind, account_id, center_id, last_seen, full_name, email, role, student_id = row
+    account = session_account({"kind": kind, "id": account_id, "full_name": full_name, "email": email,
+                               "role": role, "student_id": student_id})
+    return Session(sid, account, center_id, now - last_seen >= TOUCH_EVERY)
+
+
+def touch_session(conn, sid, ttl=SESSION_TTL):
+    """مدّد الجلسة (انتهاء منزلق) داخل معاملة المستدعي."""
+    now = int(time.time())
+    conn.execute("UPDATE sessions SET last_seen=?, expires_at=? WHERE id=? AND revoked_at IS NULL", (now, now + ttl, sid))
+
+
+def revoke_sessions(conn, ids):
+    now = int(time.time())
+    conn.executemany("UPDATE sessions SET revoked_at=? WHERE id=? AND revoked_at IS NULL", [(now, i) for i in ids])
+    return len(ids)
+
+
+def active_sessions(conn):
+    """الجلسات السارية (للمالك) مرتبة بآخر نشاط."""
+    df = pd.read_sql_query(
+        """
+        SELECT id, kind, account_id, center_id, account, ip, created_at, last_seen, expires_at
+        FROM sessions WHERE revoked_at IS NULL AND expires_at > ? ORDER BY last_seen DESC
+        """,
+        conn, params=[int(time.time())],
+    )
+    acc = df["account"].map(json.loads)
+    df["full_name"] = acc.map(lambda a: a.get("full_name"))
+    df["email"] = acc.map(lambda a: a.get("email"))
+    df["role"] = acc.map(lambda a: a.get("role"))
+    for c in ("created_at", "last_seen", "expires_at"):
+        df[c] = pd.to_datetime(df[c], unit="s")
+    return df.drop(columns="account")
+
+
+__all__ = [
+    "SESSION_TTL", "TOUCH_EVERY", "TOKEN_PARAM", "Session", "session_secret", "parse_token",
+    "create_session", "LIVE_SESSION_SQL", "load_session", "touch_session", "revoke_sessions", "active_sessions",
+]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# conftest.py — إعداد مشترك للاختبارات: الوحدات في جذر المستودع (ملفات مسطّحة بلا حزمة)
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import random
+from contextlib import closing
+
+import pytest
+
+from db_pool import ConnectionPool
+from migrations import run_migrations
+
+CLASSES = ["الأول", "الثاني", "الثالث", "الرابع", "الخامس", "السادس"]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """حوض على قاعدة فارغة في ملف مؤقت بعد كل الترحيلات (WAL يحتاج ملفًا لا :memory:)."""
+    p = ConnectionPool(str(tmp_path / "grades.db"))
+    with p.writer(begin=False) as w:
+        run_migrations(w)
+    yield p
+    p.close()
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    """اتصال قراءة على قاعدة مبذورة بـ seed() بإعداداتها الافتراضية، مشترك بين اختبارات الوحدة (للقراءة فقط)."""
+    p = ConnectionPool(str(tmp_path_factory.mktemp("seeded") / "grades.db"))
+    with p.writer(begin=False) as w:
+        run_migrations(w)
+    with p.writer() as w:
+        seed(w)
+    yield p.reader()
+    p.close()
+
+
+def seed(conn, centers=2, teachers=10, students=300, subjects=6, days=120, grades_per_day=40, rng_seed=7):
+    """بيانات اصطناعية: مراكز، معلمون، طلاب موزعون على CLASSES، مواد، تعيينات، ودرجات بملاحظات متفرقة."""
+    rng = random.Random(rng_seed)
+    with closing(conn.cursor()) as cur:
+        for c in range(1, centers + 1):
+            cur.execute("INSERT OR IGNORE INTO centers(id, name) VALUES (?,?)", (c, f"مركز {c}"))
+        cur.executemany(
+            "INSERT INTO users(id, full_name, email, role, password_hash, center_id) VALUES (?,?,?,?,?,?)",
+            [(t, f"معلم {t}", f"t{t}@x", "teacher", "x", 1 + t % centers) for t in range(1, teachers + 1)],
+        )
+        cur.executemany(
+            "INSERT INTO students(id, full_name, class_name, center_id) VALUES (?,?,?,?)",
+            [(s, f"طالب {s}", CLASSES[s % len(CLASSES)], 1 + s % centers) for s in range(1, students + 1)],
+        )
+        cur.executemany(
+            "INSERT INTO subjects(id, name, center_id) VALUES (?,?,?)",
+            [(j, f"مادة {j}", 1 + j % centers) for j in range(1, subjects + 1)],
+        )
+        enrollments = []
+        for s in range(1, students + 1):
+            c = 1 + s % centers
+            for j in range(1, subjects + 1):
+                if 1 + j % centers == c:
+                    teacher = rng.choice([t for t in range(1, teachers + 1) if 1 + t % centers == c])
+                    enrollments.append((s, j, teacher, c))
+        cur.executemany("INSERT INTO enrollments(student_id, subject_id, teacher_id, center_id) VALUES (?,?,?,?)", enrollments)
+        grades = []
+        for day in range(20000, 20000 + days):
+            for s, j, t, c in rng.sample(enrollments, grades_per_day):
+                grades.append((s, j, t, c, day, rng.randint(0, 100), 0, 100, day * 86400))
+        if grades:  # days=0: بلا درجات (ومع مخطط ما قبل الترحيل 13 أيضًا)
+            cur.executemany(
+                "INSERT INTO grades(student_id, subject_id, teacher_id, center_id, grade_day, score, min_score, max_score, created_at)"
+                " VALUES (?,?,?,?,?,?,?,?,?)", grades,
+            )
+            cur.execute("INSERT INTO grade_notes(grade_id, note) SELECT id, 'ملاحظة' FROM grades WHERE id % 7 = 0")
+        cur.execute("ANALYZE")
+    return enrollments
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# test_accounts.py — الدخول: حدّ المحاولات تحت التزامن، والبريد المشترك بين جداول الحسابات
+
+import threading
+
+import pytest
+
+import accounts
+from accounts import RateLimiter, authenticate, hash_password, set_bcrypt_rounds
+
+LIMIT = 5
+
+
+@pytest.fixture
+def conn(pool, monkeypatch):
+    set_bcrypt_rounds(4)
+    monkeypatch.setattr(accounts, "email_limiter", RateLimiter(limit=LIMIT, window=300))
+    monkeypatch.setattr(accounts, "ip_limiter", RateLimiter(limit=30, window=300))
+    with pool.writer() as w:
+        w.execute("INSERT INTO owners(full_name, email, password_hash) VALUES ('المالك', 'shared@x', ?)", (hash_password("owner-pw"),))
+        w.execute("INSERT INTO users(full_name, email, role, password_hash, center_id) VALUES ('مدير', 'shared@x', 'admin', ?, 1)",
+                  (hash_password("admin-pw"),))
+    return pool.reader()
+
+
+def _together(n, fn):
+    gate = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        gate.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_limiter_admits_exactly_limit_concurrent_attempts():
+    lim = RateLimiter(limit=LIMIT, window=60)
+    waits = _together(40, lambda: lim.attempt("k"))
+    assert waits.count(0) == LIMIT and all(w > 0 for w in waits if w)
+    lim.release("k")
+    assert lim.attempt("k") == 0 and lim.attempt("k") > 0
+
+
+def test_concurrent_bad_logins_stop_at_the_limit(pool, conn):
+    tried = []
+
+    def login():
+        r = authenticate(pool.reader(), "shared@x", "wrong", 1, ip="10.0.0.1")
+        tried.append(r.retry_after == 0)
+        return r
+
+    results = _together(20, login)
+    assert all(r.account is None for r in results)
+    assert tried.count(True) == LIMIT  # أكثر من LIMIT تحقق bcrypt كان يمر قبل تسجيل الفشل
+    assert authenticate(conn, "shared@x", "admin-pw", 1).retry_after > 0
+
+
+def test_shared_email_tries_every_account(conn):
+    assert authenticate(conn, "shared@x", "owner-pw", 1).account["kind"] == "owner"
+    admin = authenticate(conn, "shared@x", "admin-pw", 1).account
+    assert admin["kind"] == "user" and admin["role"] == "admin"
+    assert authenticate(conn, "shared@x", "admin-pw", 2).account is None  # المستخدم مقيّد بمركزه
+
+
+def test_success_does_not_count_against_the_ip(conn):
+    for _ in range(40):
+        assert authenticate(conn, "shared@x", "owner-pw", 1, ip="10.0.0.2").account is not None
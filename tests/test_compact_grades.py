@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# test_compact_grades.py — الترحيل 13 على بيانات بالشكل القديم: تواريخ تالفة، ملاحظات NULL، والعرض grades_wide
+
+import sqlite3
+
+import pytest
+
+import migrations
+from conftest import seed
+from gradebook import day_number
+from migrations import run_migrations
+
+LEGACY_INSERT = """
+    INSERT INTO grades(id, student_id, subject_id, teacher_id, center_id, grade_date, score, min_score, max_score,
+                       note, note_teacher, note_parent, note_admin, created_at)
+    VALUES (?,?,?,?,?,?,?,0,100,?,?,?,?,?)
+"""
+
+
+@pytest.fixture
+def legacy(tmp_path, monkeypatch):
+    """قاعدة عند الإصدار 12 (grades بالشكل القديم) فيها طلاب وتعيينات من seed."""
+    conn = sqlite3.connect(str(tmp_path / "legacy.db"))
+    conn.execute("PRAGMA foreign_keys=ON")
+    with monkeypatch.context() as m:
+        m.setattr(migrations, "MIGRATIONS", [mig for mig in migrations.MIGRATIONS if mig[0] < 13])
+        run_migrations(conn)
+    yield conn, seed(conn, days=0)
+    conn.close()
+
+
+def _wide(conn, gid):
+    return conn.execute(
+        "SELECT grade_date, note, note_teacher, note_parent, note_admin FROM grades_wide WHERE id=?", (gid,)
+    ).fetchone()
+
+
+def test_malformed_dates_are_repaired_not_fatal(legacy):
+    conn, enrollments = legacy
+    s, j, t, c = enrollments[0]
+    rows = [
+        (1, "2024-10-05", "2024-10-05 08:00:00"),
+        (2, "05/10/2024", "2024-10-06 09:30:00"),  # تالف: يُؤخذ يوم created_at
+        (3, "", "not a date"),                     # تالف كلاهما: اليوم 0
+        (4, "2024", "2024-10-07 10:00:00"),        # julianday يقبله رقمًا يوليانيًا؛ ليس تاريخًا
+    ]
+    conn.executemany(LEGACY_INSERT, [(gid, s, j, t, c, d, 50, None, None, None, None, created) for gid, d, created in rows])
+    conn.commit()
+    assert 13 in run_migrations(conn)
+    days = dict(conn.execute("SELECT id, grade_day FROM grades"))
+    assert days == {1: day_number("2024-10-05"), 2: day_number("2024-10-06"), 3: 0, 4: day_number("2024-10-07")}
+    assert [r[0] for r in conn.execute("SELECT grade_id FROM grade_date_repairs ORDER BY grade_id")] == [2, 3, 4]
+
+
+def test_wide_view_keeps_empty_notes_null(legacy):
+    conn, enrollments = legacy
+    s, j, t, c = enrollments[0]
+    notes = {
+        1: (None, None, None, None),         # بلا ملاحظات: لا صف في grade_notes
+        2: ("جيد", "جيد", None, None),       # الحفظ المعتاد: note_teacher = note
+        3: ("جيد", None, "ولي", None),       # ملاحظة المعلم وحدها فارغة
+        4: ("جيد", "مختلفة", None, "مدير"),
+    }
+    conn.executemany(LEGACY_INSERT, [(gid, s, j, t, c, "2024-10-05", 50, *n, "2024-10-05 08:00:00")
+                                     for gid, n in notes.items()])
+    conn.commit()
+    run_migrations(conn)
+    for gid, n in notes.items():
+        assert _wide(conn, gid) == ("2024-10-05", *n)
+    assert conn.execute("SELECT COUNT(*) FROM grade_notes").fetchone()[0] == 3
+    # الكتابة عبر العرض تحفظ نفس الدلالة
+    conn.execute("UPDATE grades_wide SET note='ممتاز', note_teacher=NULL WHERE id=4")
+    assert _wide(conn, 4) == ("2024-10-05", "ممتاز", None, None, "مدير")
+
+
+def _grades_pages(conn):
+    """(صفحات grades، صفحات grades مع grade_notes) — الجدول بلا فهارسه."""
+    try:
+        rows = dict(conn.execute("SELECT name, COUNT(*) FROM dbstat WHERE name IN ('grades', 'grade_notes') GROUP BY name"))
+    except sqlite3.OperationalError:
+        pytest.skip("SQLite بلا dbstat")
+    return rows["grades"], rows["grades"] + rows.get("grade_notes", 0)
+
+
+def test_rows_per_page_after_compaction(legacy):
+    conn, enrollments = legacy
+    # ملاحظة في كل ثالث درجة (مكررة في note_teacher كما يحفظ التطبيق)، وكل عاشرة لولي الأمر
+    rows = []
+    for i, (s, j, t, c) in enumerate(enrollments * 4, start=1):
+        note = f"ملاحظة المعلم على أداء الطالب رقم {i}" if i % 3 == 0 else None
+        rows.append((i, s, j, t, c, f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", i % 101, note, note,
+                     "يرجى المتابعة في البيت" if i % 10 == 0 else None, None, "2024-10-05 08:00:00"))
+    conn.executemany(LEGACY_INSERT, rows)
+    conn.commit()
+    conn.execute("VACUUM")
+    before, _ = _grades_pages(conn)
+    run_migrations(conn)
+    conn.execute("VACUUM")
+    after, with_notes = _grades_pages(conn)
+    print(f"{len(rows)} grades: {len(rows) / before:.0f} → {len(rows) / after:.0f} rows per page "
+          f"({before} → {after} pages, {with_notes} with grade_notes)")
+    # المسح الكامل لـ grades (التحليلات والعدّ) يقرأ أقل من نصف الصفحات، والملاحظات معًا لا تزيد عن الأصل
+    assert after * 2 < before
+    assert with_notes < before
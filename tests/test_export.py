@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# test_export.py — التصدير المتدفق: ذاكرة ثابتة مهما كبر التقرير (EXPORT_BENCH_ROWS=1000000 للقياس الكامل)
+
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import pytest
+
+from conftest import seed
+from db_pool import ConnectionPool
+from migrations import run_migrations
+from reports import EXPORT_CHUNK, EXPORT_MAX_ROWS, XLSX_AVAILABLE, export_csv, export_xlsx, report_count_estimate
+
+ROWS = int(os.environ.get("EXPORT_BENCH_ROWS", 100000))
+DAYS = 100
+
+
+@pytest.fixture(scope="module")
+def big(tmp_path_factory):
+    p = ConnectionPool(str(tmp_path_factory.mktemp("export") / "grades.db"))
+    with p.writer(begin=False) as w:
+        run_migrations(w)
+    with p.writer() as w:
+        seed(w, centers=1, students=4000, days=DAYS, grades_per_day=ROWS // DAYS)
+    yield p.reader()
+    p.close()
+
+
+def _export(fn, conn, filters):
+    with tempfile.TemporaryFile() as out:
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            n = fn(conn, 1, filters, out)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return n, out.tell(), peak, time.perf_counter() - started
+
+
+def test_csv_export_memory_is_flat(big):
+    n, size, peak, seconds = _export(export_csv, big, {})
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"CSV {n} rows, {size / 2**20:.1f} MB in {seconds:.1f}s; traced peak {peak / 2**20:.1f} MB, process peak RSS {rss:.0f} MB")
+    assert n == ROWS
+    assert peak < 16 * 2**20  # دفعة واحدة من EXPORT_CHUNK صف، لا الملف كله
+    small, *_, small_peak, _ = _export(export_csv, big, {"date_to": "2024-10-13"})
+    assert small == 10 * ROWS // DAYS and peak < small_peak + 4 * 2**20  # الذروة لا تكبر مع عدد الصفوف
+
+
+@pytest.mark.skipif(not XLSX_AVAILABLE, reason="openpyxl غير مثبت")
+def test_xlsx_export_writes_every_row(big):
+    n, size, peak, seconds = _export(export_xlsx, big, {"date_to": "2024-10-05"})
+    print(f"XLSX {n} rows, {size / 2**20:.1f} MB in {seconds:.1f}s; traced peak {peak / 2**20:.1f} MB")
+    assert n == 2 * ROWS // DAYS and size > 0
+
+
+def test_export_cap_is_checked_with_a_bounded_count(big):
+    assert EXPORT_MAX_ROWS > EXPORT_CHUNK
+    assert report_count_estimate(big, 1, {}, cap=ROWS - 1) == (ROWS - 1, True)
+    assert report_count_estimate(big, 1, {}, cap=ROWS) == (ROWS, False)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# test_honor_board.py — أعلى 10% تُحسب داخل SQLite: نفس نتيجة الترتيب في pandas، ولا يعبر إلى Python غير الفائزين
+
+import math
+
+import pandas as pd
+import pytest
+
+from gradebook import GRADE_DATE
+from reports import honor_board_top10
+
+DAY = "2024-10-10"
+
+
+@pytest.fixture(scope="module")
+def grades(seeded):
+    """كل درجات المركز 1 كما كان المسار القديم يحمّلها إلى pandas."""
+    return pd.read_sql_query(
+        f"""
+        SELECT g.id, s.class_name AS class, g.subject_id, {GRADE_DATE} AS grade_date, g.score
+        FROM grades g JOIN students s ON s.id=g.student_id WHERE g.center_id=1
+        """, seeded)
+
+
+def _top(df):
+    """المرجع: ترتيب بالدرجة ثم id وأخذ ceil(10%) بحد أدنى صف واحد."""
+    return df.sort_values(["score", "id"], ascending=[False, True]).head(max(1, math.ceil(len(df) * 0.10)))
+
+
+@pytest.mark.parametrize("filters", [{}, {"date_iso": DAY}, {"class_name": "الثالث", "subject_id": 2}])
+def test_top_tenth_matches_pandas(seeded, grades, filters):
+    df = grades
+    if "date_iso" in filters: df = df[df.grade_date == filters["date_iso"]]
+    if "class_name" in filters: df = df[df["class"] == filters["class_name"]]
+    if "subject_id" in filters: df = df[df.subject_id == filters["subject_id"]]
+    expected = _top(df)
+    got = honor_board_top10(seeded, 1, **filters)
+    # فقط الفائزون يصلون إلى pandas: عُشر الصفوف المطابقة لا كلها
+    assert len(got) == len(expected) < len(df)
+    assert got["score"].tolist() == expected["score"].tolist()
+
+
+def test_per_class_subject_in_one_query(seeded, grades):
+    df = grades[grades.grade_date == DAY]
+    expected = df.groupby(["class", "subject_id"]).apply(_top, include_groups=False)
+    got = honor_board_top10(seeded, 1, date_iso=DAY, per="class_subject")
+    assert len(got) == len(expected) < len(df)
+    for (cls, sub), part in got.groupby(["class", "subject_id"]):
+        assert sorted(part["score"], reverse=True) == expected.loc[(cls, sub), "score"].tolist()
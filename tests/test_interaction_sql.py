@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# test_interaction_sql.py — كلفة كل تفاعل بعدد جمل SQL وزمنها: جسم الـ fragment مقابل التشغيل الكامل
+#
+# AppTest يعيد تشغيل السكربت كاملًا دائمًا، فيُقاس ما ينفّذه جسم كل fragment وحده (وهو ما يعيد Streamlit
+# تشغيله عند تفاعل داخله) عبر st.fragment مغلّف، وتُعدّ الجمل بـ set_trace_callback على كل اتصال يفتحه الحوض.
+
+import os
+import re
+import time
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import datacache
+import db_pool
+import labels
+from conftest import ROOT, seed
+
+ADMIN = {"kind": "user", "id": 1000, "full_name": "المدير", "email": "admin@test.local", "role": "admin"}
+TEACHER = {"kind": "user", "id": 2, "full_name": "معلم 2", "email": "t2@x", "role": "teacher"}
+OUTSIDE_SQL = 2         # ما ينفّذه السكربت خارج الـ fragments في كل تشغيل (قائمة المراكز المخزّنة)
+FRAGMENT_SQL = 12       # سقف جمل جسم الـ fragment لتفاعل واحد
+FRAGMENT_SECONDS = 5.0  # حد سخي لزمن جسم الـ fragment على قاعدة الاختبار الصغيرة
+GRADE_SECTIONS = {"📈 التقارير", "🏅 المجتهدون", "📊 التحليلات"}
+READS_GRADES = re.compile(r"\b(FROM|JOIN) grades\b")
+# عمل التهيئة (الترحيلات، الحسابات الافتراضية، البذرة، تجهيز حسابات الطلاب) — مرة لكل عملية لا لكل تشغيل
+BOOTSTRAP = re.compile(
+    r"^\s*(CREATE|ALTER|DROP)\b|schema_version|sqlite_master|table_info"
+    r"|\b(INSERT INTO|UPDATE|DELETE FROM) (owners|users|students|subjects|enrollments|student_accounts)\b"
+    r"|FROM owners|role='admin'|\.teacher@darien\.local",
+    re.IGNORECASE,
+)
+
+
+class SqlLog:
+    def __init__(self):
+        self.statements = []
+        self.fragments = {}  # الاسم → (جمل SQL التي نفّذها جسمه، الزمن بالثواني)
+
+    def trace(self, sql):
+        if not sql.lstrip().upper().startswith(("PRAGMA", "BEGIN", "COMMIT", "SAVEPOINT", "RELEASE")):
+            self.statements.append(sql)
+
+
+@pytest.fixture
+def sql_log(pool, monkeypatch):
+    with pool.writer() as w:
+        seed(w)
+        w.execute("INSERT INTO users(id, full_name, email, role, password_hash, center_id) VALUES (?,?,?,'admin','x',1)",
+                  (ADMIN["id"], ADMIN["full_name"], ADMIN["email"]))
+    for key, value in {"GRADES_DB_PATH": pool.path, "BCRYPT_ROUNDS": "4", "SESSION_SECRET": "test-secret",
+                       "DARIEN_UNIFIED_PASSWORD": "123456", "OWNER_EMAIL": "owner@test.local", "OWNER_PASSWORD": "owner",
+                       "WHATSAPP_E164": "+200", "BACKEND_URL": "-"}.items():
+        # كل إعداد يُقرأ قبل set_page_config يجب أن يأتي من البيئة: الرجوع إلى st.secrets بلا ملف يرسم تنبيهًا
+        monkeypatch.setenv(key, value)
+
+    log = SqlLog()
+    connect = db_pool.ConnectionPool._connect
+
+    def traced_connect(self, read_only):
+        conn = connect(self, read_only)
+        conn.set_trace_callback(log.trace)
+        return conn
+
+    fragment = st.fragment
+
+    def measured_fragment(func=None, **kwargs):
+        def wrap(f):
+            def body(*args, **kw):
+                n, started = len(log.statements), time.perf_counter()
+                try:
+                    return f(*args, **kw)
+                finally:
+                    log.fragments[f.__name__] = (log.statements[n:], time.perf_counter() - started)
+            body.__name__ = body.__qualname__ = f.__name__
+            return fragment(body, **kwargs)
+        return wrap(func) if func else wrap
+
+    monkeypatch.setattr(db_pool.ConnectionPool, "_connect", traced_connect)
+    monkeypatch.setattr(st, "fragment", measured_fragment)
+    # مخازن على مستوى العملية مفتاحها عدّادات الإصدار، وهي تتطابق بين قواعد الاختبارات المختلفة
+    st.cache_resource.clear()
+    datacache.lookup_cache.clear()
+    monkeypatch.setattr(labels, "_stats_cache", labels.StatsCache())
+    yield log
+    st.cache_resource.clear()
+
+
+def run(log, at):
+    """شغّل AppTest ويعيد (جمل التشغيل الكامل، {fragment: (جمل، زمن)})."""
+    log.fragments.clear()
+    n = len(log.statements)
+    at.run()
+    assert not at.exception, [e.value for e in at.exception]
+    return log.statements[n:], dict(log.fragments)
+
+
+def as_user(log, user):
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    if user is not None:
+        at.session_state["user"] = user
+    at.session_state["center_id"] = 1  # الشريط الجانبي يختار أول مركز بالاسم؛ التعيينات المبذورة في المركز 1
+    run(log, at)
+    return at
+
+
+def check(log, at, fragment):
+    """تفاعل واحد: خارج الـ fragment شبه لا شيء، وجسمه محدود العدد والزمن. يعيد جمل الجسم."""
+    full, frags = run(log, at)
+    queries, seconds = frags[fragment]
+    assert len(full) - len(queries) <= OUTSIDE_SQL, full
+    assert len(queries) <= FRAGMENT_SQL, queries
+    assert seconds < FRAGMENT_SECONDS
+    return queries
+
+
+def test_admin_sections_run_only_their_queries(sql_log):
+    at = as_user(sql_log, ADMIN)
+    check(sql_log, at, "admin_panel")
+    for section in at.radio(key="admin_section").options:
+        at.radio(key="admin_section").set_value(section)
+        queries = check(sql_log, at, "admin_panel")
+        if section not in GRADE_SECTIONS:
+            # الأقسام غير المعروضة لا تُنفَّذ: لا قراءة للدرجات إلا من أقسامها
+            assert not [q for q in queries if READS_GRADES.search(q)], section
+
+
+def test_admin_widget_reruns_fragment_only(sql_log):
+    at = as_user(sql_log, ADMIN)
+    sort = next(s for s in at.selectbox if s.label == "طريقة الفرز")
+    sort.set_value(sort.options[-1])
+    check(sql_log, at, "admin_panel")
+
+
+def test_teacher_entry_modes(sql_log):
+    at = as_user(sql_log, TEACHER)
+    check(sql_log, at, "teacher_daily_panel")
+    for mode in at.radio(key="entry_mode").options:
+        at.radio(key="entry_mode").set_value(mode)
+        check(sql_log, at, "teacher_daily_panel")
+
+
+def test_warm_rerun_skips_bootstrap(sql_log, tmp_path, monkeypatch):
+    # قاعدة جديدة فارغة: أول تشغيل يرحّل ويبذر، والتشغيل التالي لصفحة الدخول عمل الصفحة فقط
+    monkeypatch.setenv("GRADES_DB_PATH", str(tmp_path / "fresh.db"))
+    at = as_user(sql_log, None)
+    first = sql_log.statements[:]
+    assert sum(bool(BOOTSTRAP.search(q)) for q in first) > 10  # الفحص يرى عمل التهيئة فعلًا
+    second, _ = run(sql_log, at)
+    assert [q for q in second if BOOTSTRAP.search(q)] == []
+    assert len(second) <= OUTSIDE_SQL, second
+    print(f"login page: first run {len(first)} SQL, warm rerun {len(second)} SQL")
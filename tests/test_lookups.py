@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# test_lookups.py — قوائم الاختيار: خرائط id→نص تُبنى مرة لكل إصدار بيانات، ومنتقي الطلاب بصفحات من SQLite
+
+import time
+
+import pandas as pd
+import pytest
+
+import datacache
+from conftest import seed
+
+STUDENTS = 5000
+
+
+@pytest.fixture
+def conn(pool):
+    with pool.writer() as w:
+        seed(w, students=STUDENTS, days=0)
+    datacache.lookup_cache.clear()  # مخزن على مستوى العملية؛ عدّادات الإصدار تتطابق بين قواعد الاختبارات
+    return pool.reader()
+
+
+def _statements(conn, fn, *args):
+    seen = []
+    conn.set_trace_callback(seen.append)
+    try:
+        return fn(conn, *args), seen
+    finally:
+        conn.set_trace_callback(None)
+
+
+def _render(options, format_func):
+    started = time.perf_counter()
+    labels = [format_func(i) for i in options]
+    return labels, time.perf_counter() - started
+
+
+def test_format_5000_students(conn):
+    df = pd.read_sql_query("SELECT id, full_name, class_name FROM students WHERE center_id=1", conn)
+    started = time.perf_counter()
+    names = datacache.label_map(df, df["full_name"] + " - " + df["class_name"])
+    labels, render = _render(list(names), names.get)
+    new = time.perf_counter() - started + render
+    assert len(labels) == len(df) and labels[0] == f"{df.full_name[0]} - {df.class_name[0]}"
+    # المسار القديم: set_index لكل خيار (يُقاس على 500 خيار فقط؛ كلفته تربيعية في عدد الطلاب)
+    old_labels, old = _render(list(df.id[:500]), lambda i: df.set_index("id").loc[i, "full_name"] + " - " + df.set_index("id").loc[i, "class_name"])
+    assert old_labels == labels[:500]
+    print(f"{len(df)} options: label_map {new * 1000:.1f} ms; set_index per option {old / 500 * 1000:.2f} ms each")
+    assert new < old / 5  # كل الخيارات الـ2500 أسرع من خُمس 500 خيار بالطريقة القديمة
+
+
+def test_names_are_rebuilt_only_when_the_table_changes(conn, pool):
+    first, seen = _statements(conn, datacache.subject_names, 1)
+    assert any("FROM subjects" in q for q in seen)
+    again, seen = _statements(conn, datacache.subject_names, 1)
+    assert again == first and not any("FROM subjects" in q for q in seen)  # فحص الإصدار وحده
+    with pool.writer() as w:
+        w.execute("UPDATE subjects SET name='مادة معدلة' WHERE id=2")
+    changed, seen = _statements(conn, datacache.subject_names, 1)
+    assert changed[2] == "مادة معدلة" and any("FROM subjects" in q for q in seen)
+
+
+def test_student_picker_pages_in_sqlite(conn):
+    page, total = datacache.search_students(conn, 1)
+    assert total == STUDENTS // 2 and len(page) == datacache.STUDENT_PAGE
+    nxt, _ = datacache.search_students(conn, 1, offset=datacache.STUDENT_PAGE)
+    assert not set(page.id) & set(nxt.id)
+    found, n = datacache.search_students(conn, 1, "طالب 12", "الأول")
+    assert n == len(found) > 0 and found.full_name.str.contains("طالب 12").all() and (found.class_name == "الأول").all()
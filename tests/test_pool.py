@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# test_pool.py — ConnectionPool تحت التزامن: 50 معلّمًا يحفظون معًا عبر الكاتب الواحد، وبعضهم يفشل
+
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import seed
+
+TEACHERS = 50
+INSERT_GRADE = (
+    "INSERT INTO grades(student_id, subject_id, teacher_id, center_id, grade_day, score, min_score, max_score, created_at)"
+    " VALUES (?,?,?,?,?,?,0,100,0)"
+)
+
+
+@pytest.fixture
+def enrollments(pool):
+    with pool.writer() as w:
+        return seed(w, teachers=TEACHERS, days=0)
+
+
+def _together(n, target):
+    """شغّل target(i) في n خيط تبدأ معًا؛ يعيد {i: الاستثناء أو None}."""
+    barrier = threading.Barrier(n)
+    outcome = {}
+
+    def run(i):
+        barrier.wait()
+        try:
+            target(i)
+            outcome[i] = None
+        except Exception as e:
+            outcome[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return outcome
+
+
+def _bad(i):
+    return i % 5 == 0  # طالب غير موجود: FOREIGN KEY constraint failed
+
+
+def test_concurrent_teacher_saves(pool, enrollments):
+    def save(i):
+        s, j, t, c = enrollments[i]
+        with pool.writer() as w:
+            # درجتان في معاملة واحدة: الفاشلة تُرجع الأولى معها
+            w.execute(INSERT_GRADE, (s, j, t, c, 20000, 50 + i % 50))
+            w.execute(INSERT_GRADE, (999999 if _bad(i) else s, j, t, c, 20001, 60))
+        # القارئ الخاص بهذا الخيط يرى ما ثبّته الكاتب فورًا (WAL)
+        assert pool.reader().execute("SELECT COUNT(*) FROM grades WHERE student_id=? AND subject_id=?", (s, j)).fetchone()[0] == 2
+
+    outcome = _together(TEACHERS, save)
+    assert all(isinstance(outcome[i], sqlite3.IntegrityError) for i in outcome if _bad(i))
+    assert [i for i in outcome if not _bad(i) and outcome[i] is not None] == []
+    good = {enrollments[i][:2] for i in range(TEACHERS) if not _bad(i)}
+    rows = pool.reader().execute("SELECT student_id, subject_id, COUNT(*) FROM grades GROUP BY 1, 2").fetchall()
+    assert {(s, j) for s, j, _ in rows} == good
+    assert {n for _, _, n in rows} == {2}
+
+
+def test_reader_is_read_only(pool):
+    with pytest.raises(sqlite3.OperationalError):
+        pool.reader().execute("INSERT INTO centers(name) VALUES ('x')")
+
+
+def test_readers_are_per_thread_and_recycled(pool):
+    seen = []
+    _together(4, lambda i: seen.append(pool.reader()))
+    assert len({id(c) for c in seen}) == 4
+    # الخيوط انتهت فعادت اتصالاتها إلى الحوض، والخيط التالي يستعير أحدها بدل فتح جديد
+    assert any(pool.reader() is c for c in seen)
+
+
+def test_failed_commit_does_not_wedge_writer(pool, enrollments):
+    s, j, t, c = enrollments[0]
+    with pytest.raises(sqlite3.IntegrityError):
+        with pool.writer() as w:
+            # قيد مؤجَّل يُفحص عند COMMIT فيفشل commit نفسه لا الجملة
+            w.execute("PRAGMA defer_foreign_keys=ON")
+            w.execute(INSERT_GRADE, (999999, j, t, c, 20000, 1))
+    with pool.writer() as w:
+        w.execute(INSERT_GRADE, (s, j, t, c, 20000, 2))
+    assert pool.reader().execute("SELECT score FROM grades").fetchall() == [(2.0,)]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# test_query_plans.py — المسارات الساخنة تبقى في الفهارس: EXPLAIN QUERY PLAN لكل استعلام تنفّذه فعلًا
+#
+# كل دالة تُستدعى على قاعدة اصطناعية ويُلتقط ما تنفّذه عبر set_trace_callback (SQL موسّع بالقيم)، ثم يُفحص
+# مخطط كل SELECT: أي SCAN على grades أو enrollments يعني أن فهرسًا سقط أو أن الاستعلام تغيّر شكله.
+
+import re
+
+import pytest
+
+import datacache
+import reports
+
+SCAN = re.compile(r"^SCAN (g|grades|e|enrollments)\b")
+SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+
+
+def _captured(conn, fn, *args, **kw):
+    """نفّذ fn والتقط جمل SELECT التي أرسلتها إلى SQLite."""
+    seen = []
+    conn.set_trace_callback(seen.append)
+    try:
+        fn(conn, *args, **kw)
+    finally:
+        conn.set_trace_callback(None)
+    return [q for q in seen if q.lstrip().upper().startswith(("SELECT", "WITH"))]
+
+
+def _scans(conn, sql):
+    """مسوح كاملة على grades/enrollments؛ مسح استعلام فرعي مُجسَّد (مثل DISTINCT e) مسموح فهو بحجم نتيجته."""
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    subqueries = {m.group(1) for m in map(SUBQUERY.match, plan) if m}
+    return [d for d in plan if SCAN.match(d) and d.split()[1] not in subqueries]
+
+
+CASES = {
+    "teacher_recent_grades": (reports.teacher_recent_grades, 2, 1),
+    "student_grades": (reports.student_grades, 2, 1),
+    "grade_sheet": (reports.grade_sheet, 1, 2, 1, "الثالث", "2024-10-10"),
+    "center_enrollments": (reports.center_enrollments, 1),
+    "roster": (datacache._build_roster, 2, 1),
+    "honor_board": (reports.honor_board_top10, 1, "الثاني", 1, "2024-10-10"),
+    "honor_board_whole_center": (reports.honor_board_top10, 1),
+    "honor_board_per_class_subject": (lambda c, *a: reports.honor_board_top10(c, *a, per="class_subject"), 1, None, None, "2024-10-10"),
+    "report_page": (reports.report_page, 1, {}),
+    "report_page_next": (lambda c, *a: reports.report_page(c, *a, after=("2024-10-10", 5000)), 1, {}),
+    "report_page_filtered": (reports.report_page, 1, {"date_from": "2024-10-20", "date_to": "2024-12-01", "class_name": "الرابع",
+                                                      "subject_id": 3, "teacher_id": 2}),
+    "report_page_student": (reports.report_page, 1, {"student_id": 4}),
+    "report_count": (reports.report_count_estimate, 1, {"date_from": "2024-10-20"}),
+    "grade_notes": (reports.grade_notes, 7, 2),
+}
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_hot_query_uses_indexes(seeded, name):
+    fn, *args = CASES[name]
+    queries = _captured(seeded, fn, *args)
+    assert queries, name
+    for sql in queries:
+        assert _scans(seeded, sql) == [], sql
+
+
+def test_plan_check_catches_full_scan(seeded):
+    # ضبط الاختبار نفسه: استعلام بلا فهرس مناسب يجب أن يُرفض
+    assert _scans(seeded, "SELECT * FROM grades g WHERE g.score > 50")
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# test_reports.py — ترقيم التقارير بالمفتاح والعدّ المحدود: الكلفة بخطوات آلة SQLite الافتراضية (لا بالزمن)
+
+import pandas as pd
+
+from reports import REPORT_COLUMNS, REPORT_FROM, report_count_estimate, report_page
+
+PAGE = 20
+
+
+def vm_steps(conn, fn, *args, **kw):
+    """(نتيجة fn، عدد تعليمات VDBE التي نفّذتها بوحدات من 100)."""
+    steps = [0]
+
+    def tick():
+        steps[0] += 1
+        return 0
+
+    conn.set_progress_handler(tick, 100)
+    try:
+        return fn(conn, *args, **kw), steps[0]
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def _walk(conn, filters, pages):
+    """صفحات متتالية بمفتاح آخر صف؛ يعيد [(الصفحة، الكلفة)]."""
+    out, after = [], None
+    for _ in range(pages):
+        df, cost = vm_steps(conn, report_page, 1, filters, after=after, limit=PAGE)
+        if df.empty:
+            break
+        out.append((df, cost))
+        after = (df["التاريخ"].iloc[-1], df["#"].iloc[-1])
+    return out
+
+
+def test_keyset_pages_cover_history_once(seeded):
+    pages = _walk(seeded, {}, 10 ** 6)
+    ids = [i for df, _ in pages for i in df["#"]]
+    total = seeded.execute("SELECT COUNT(*) FROM grades WHERE center_id=1").fetchone()[0]
+    assert len(ids) == len(set(ids)) == total
+    keys = [(d, i) for df, _ in pages for d, i in zip(df["التاريخ"], df["#"])]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_deep_page_costs_the_same_as_first(seeded):
+    for filters in ({}, {"subject_id": 2}):
+        pages = _walk(seeded, filters, 50)
+        assert len(pages) >= 30, filters
+        first, last = pages[0][1], pages[-1][1]
+        # OFFSET كان يمرّ على كل الصفوف السابقة: الصفحة k بكلفة ~k صفحة
+        assert last <= 2 * first, (filters, first, last)
+
+
+def test_offset_paging_is_what_keyset_avoids(seeded):
+    # ضبط المقياس نفسه: ترقيم OFFSET على نفس الاستعلام تتضخم كلفته مع عمق الصفحة
+    def offset_page(conn, k):
+        q = f"SELECT {REPORT_COLUMNS} {REPORT_FROM} WHERE g.center_id=1 ORDER BY g.grade_day DESC, g.id DESC LIMIT ? OFFSET ?"
+        return pd.read_sql_query(q, conn, params=[PAGE, k * PAGE])
+
+    _, first = vm_steps(seeded, offset_page, 0)
+    _, deep = vm_steps(seeded, offset_page, 49)
+    assert deep > 5 * first
+
+
+def test_count_stops_at_cap(seeded):
+    (n, more), capped = vm_steps(seeded, report_count_estimate, 1, {}, cap=100)
+    (full, more_full), uncapped = vm_steps(seeded, report_count_estimate, 1, {}, cap=10 ** 9)
+    assert (n, more) == (100, True) and not more_full and full > 1000
+    assert capped * 10 < uncapped
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# test_sessions.py — الجلسة تتبع الحساب الحي: الحذف يُبطل الرمز وتغيير الدور يسري فورًا
+
+import pytest
+
+from accounts import authenticate, hash_password, provision_student_accounts, set_bcrypt_rounds
+from conftest import seed
+from sessions import LIVE_SESSION_SQL, create_session, load_session
+
+SECRET = b"test-secret"
+
+
+@pytest.fixture
+def conn(pool):
+    set_bcrypt_rounds(4)
+    with pool.writer() as w:
+        seed(w, students=20, days=0)
+        w.execute("UPDATE users SET password_hash=? WHERE id=2", (hash_password("pw"),))
+        provision_student_accounts(w, "pw")
+    return pool.reader()
+
+
+def _login(pool, conn, email, center_id=1):
+    account = authenticate(conn, email, "pw", center_id).account
+    with pool.writer() as w:
+        token, _ = create_session(w, SECRET, account, center_id)
+    return token
+
+
+def test_role_and_name_come_from_the_live_row(pool, conn):
+    token = _login(pool, conn, "t2@x")
+    assert load_session(conn, SECRET, token).account == {
+        "kind": "user", "id": 2, "full_name": "معلم 2", "email": "t2@x", "role": "teacher"}
+    with pool.writer() as w:
+        w.execute("UPDATE users SET role='admin', full_name='مدير جديد' WHERE id=2")
+    account = load_session(conn, SECRET, token).account
+    assert account["role"] == "admin" and account["full_name"] == "مدير جديد"
+
+
+def test_deleted_account_token_is_rejected(pool, conn):
+    token = _login(pool, conn, "t2@x")
+    with pool.writer() as w:
+        w.execute("UPDATE enrollments SET teacher_id=4 WHERE teacher_id=2")
+        w.execute("DELETE FROM users WHERE id=2")
+    assert load_session(conn, SECRET, token) is None
+
+
+def test_deleted_student_token_is_rejected(pool, conn):
+    token = _login(pool, conn, "student2@darien.local")
+    account = load_session(conn, SECRET, token).account
+    assert account["kind"] == "student" and account["student_id"] == 2 and account["full_name"] == "طالب 2"
+    with pool.writer() as w:
+        w.execute("DELETE FROM students WHERE id=2")  # حساب الطالب يُحذف معه (ON DELETE CASCADE)
+    assert load_session(conn, SECRET, token) is None
+
+
+def test_user_moved_to_another_center_is_signed_out(pool, conn):
+    token = _login(pool, conn, "t2@x")
+    with pool.writer() as w:
+        w.execute("UPDATE users SET center_id=2 WHERE id=2")
+    assert load_session(conn, SECRET, token) is None
+
+
+def test_live_lookup_uses_primary_keys(conn):
+    plan = " | ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + LIVE_SESSION_SQL, ("x", 0)))
+    assert "SCAN" not in plan, plan
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# test_write_queue.py — الالتزام الجماعي: 500 حفظ متزامن، فشل عملية واحدة داخل دفعتها، وفشل commit الدفعة كلها
+
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import seed
+from db_pool import WriteQueue
+
+SAVES = 500
+INSERT_GRADE = (
+    "INSERT INTO grades(student_id, subject_id, teacher_id, center_id, grade_day, score, min_score, max_score, created_at)"
+    " VALUES (?,?,?,?,?,?,0,100,0)"
+)
+
+
+@pytest.fixture
+def enrollments(pool):
+    with pool.writer() as w:
+        return seed(w, students=SAVES, days=0)
+
+
+@pytest.fixture
+def wq(pool):
+    q = WriteQueue(pool, window=0.02)
+    yield q
+    q.close()
+
+
+def save_grade(conn, student_id, subject_id, teacher_id, center_id, score):
+    return conn.execute(INSERT_GRADE, (student_id, subject_id, teacher_id, center_id, 20000, score)).lastrowid
+
+
+def _count(pool):
+    return pool.reader().execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+
+
+def test_concurrent_saves(pool, enrollments, wq):
+    bad = set(range(0, SAVES, 10))  # طالب غير موجود
+    barrier = threading.Barrier(SAVES)
+    outcome = {}
+
+    def save(i):
+        s, j, t, c = enrollments[i]
+        barrier.wait()
+        try:
+            outcome[i] = wq.run(save_grade, 999999 if i in bad else s, j, t, c, i % 100)
+        except Exception as e:
+            outcome[i] = e
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(SAVES)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert {i for i, r in outcome.items() if isinstance(r, sqlite3.IntegrityError)} == bad
+    ids = {r for i, r in outcome.items() if i not in bad}
+    rows = pool.reader().execute("SELECT id, student_id, subject_id FROM grades").fetchall()
+    assert {r[0] for r in rows} == ids
+    assert {r[1:] for r in rows} == {enrollments[i][:2] for i in range(SAVES) if i not in bad}
+    stats = wq.stats()
+    assert stats["العمليات"] == SAVES
+    assert stats["الدفعات"] < SAVES  # جُمعت في دفعات فعلًا
+    assert stats["في الطابور الآن"] == 0
+
+
+def test_failed_item_rolls_back_alone(pool, enrollments, wq):
+    def two_then_fail(conn, e):
+        save_grade(conn, *e, 1)
+        save_grade(conn, *e, 2)
+        raise ValueError("درجة غير صالحة")
+
+    # نفس الدفعة: كلها تصل خلال النافذة قبل أن يلتقطها الكاتب
+    futures = [wq.submit(save_grade, *enrollments[0], 10), wq.submit(two_then_fail, enrollments[1]),
+               wq.submit(save_grade, *enrollments[2], 30)]
+    with pytest.raises(ValueError):
+        futures[1].result(10)
+    assert futures[0].result(10) and futures[2].result(10)
+    assert wq.stats()["الدفعات"] == 1
+    assert sorted(r[0] for r in pool.reader().execute("SELECT score FROM grades")) == [10, 30]
+
+
+def test_commit_failure_fails_whole_batch(pool, enrollments, wq):
+    def deferred_violation(conn, e):
+        # القيد المؤجَّل لا يُفحص في SAVEPOINT بل عند COMMIT: تفشل الدفعة كلها
+        conn.execute("PRAGMA defer_foreign_keys=ON")
+        save_grade(conn, 999999, *e[1:], 1)
+
+    futures = [wq.submit(save_grade, *enrollments[0], 10), wq.submit(deferred_violation, enrollments[1]),
+               wq.submit(save_grade, *enrollments[2], 30)]
+    for f in futures:
+        with pytest.raises(sqlite3.IntegrityError):
+            f.result(10)
+    assert _count(pool) == 0
+    # الكاتب المشترك لم يعلق في معاملة: الدفعة التالية تُثبَّت
+    assert wq.run(save_grade, *enrollments[3], 40)
+    assert _count(pool) == 1
+
+
+def test_close_drains_pending(pool, enrollments):
+    q = WriteQueue(pool, window=0.5)
+    futures = [q.submit(save_grade, *e, 1) for e in enrollments[:20]]
+    q.close()
+    assert all(f.done() for f in futures)
+    assert _count(pool) == 20